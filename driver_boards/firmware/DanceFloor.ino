@@ -8,6 +8,9 @@
 //  constant RGB colour when in fact only one is on at any given time.
 
 // Data can be received from a PC through the serial port at 1000000 baud (1Mbps)
+// It either comes as one long frame, which each module in the chain takes the first
+//  part of and passes on the rest, or as a packet addressed to each module in turn
+//  (see CMD_MODULE_DATA below)
 
 // If no data is received in several seconds then the module starts to set the LEDs to random
 //  pure colours, changing 2 times a second
@@ -92,6 +95,21 @@ PROGMEM prog_uint16_t exp_table_blue[] =
 //  (This is effectively a 'sync' pulse)
 # define CMD_NEW_DATA 1
 
+// The character that starts a packet addressed to a single module. It is followed
+//  by the module id, and then BUFFER_SIZE bytes of data for that module. Every
+//  module passes every packet on.
+// A packet for ENUMERATE_ADDRESS carries a single byte instead, an id, which the
+//  module takes as its own and passes on one higher to the next module
+// Neither 0xFF nor 0x01 are ever sent as data
+#define CMD_MODULE_DATA 0xFF
+#define ENUMERATE_ADDRESS 0
+
+// What the UART ISR is expecting next
+#define RX_CHAIN 0
+#define RX_ADDRESS 1
+#define RX_MODULE_DATA 2
+#define RX_ENUMERATE 3
+
 // Module size constants
 
 #define MODULE_WIDTH 6
@@ -110,6 +128,13 @@ static unsigned char *display_buffer = display_buffer_2;
 static unsigned char *ptr;
 static unsigned int pos = 0;
 
+// Variables used for addressed packets in the UART ISR
+// Our id, 0 until one has been given to us
+static unsigned char module_id = 0;
+static byte rx_state = RX_CHAIN;
+static byte packet_for_us = 0;
+static unsigned int packet_pos = 0;
+
 // Temporary buffer to store the next set of random colours
 //  (These are calculated in advance over a period of cycles
 //   so that they do not take too much processing time)
@@ -342,6 +367,7 @@ ISR(USART_RX_vect)
   if (b == CMD_NEW_DATA)  {
     // ... retransmit the pulse to subsequent modules
     UDR0=b; 
+    rx_state = RX_CHAIN;
     //pos=0; 
     // Reset our counter
     pos=BUFFER_SIZE; 
@@ -369,6 +395,51 @@ ISR(USART_RX_vect)
     cycling = false;
     return;
   }    
+
+  // The start of an addressed packet. Everything to do with these is passed
+  //  straight on, apart from the id when we are being given ours
+  if (b == CMD_MODULE_DATA) {
+    UDR0=b;
+    // Stop taking data from the long frame, if we were
+    pos=0;
+    rx_state = RX_ADDRESS;
+    return;
+  }
+  if (rx_state == RX_ADDRESS) {
+    UDR0=b;
+    if (b == ENUMERATE_ADDRESS) {
+      rx_state = RX_ENUMERATE;
+    }
+    else {
+      packet_for_us = (module_id != 0 && b == module_id);
+      packet_pos = 0;
+      rx_state = RX_MODULE_DATA;
+    }
+    return;
+  }
+  if (rx_state == RX_ENUMERATE) {
+    module_id = b;
+    UDR0=b + 1;
+    rx_state = RX_CHAIN;
+    return;
+  }
+  if (rx_state == RX_MODULE_DATA) {
+    UDR0=b;
+    if (packet_for_us) {
+      display_buffer[packet_pos] = b;
+    }
+    packet_pos++;
+    if (packet_pos == BUFFER_SIZE) {
+      rx_state = RX_CHAIN;
+      if (packet_for_us) {
+        // This counts as a new frame for us, the same as a sync pulse
+        lastdata_tickcounter = tickcounter;
+        cycling = false;
+      }
+    }
+    return;
+  }
+
   //  if (pos == BUFFER_SIZE) {
   // If we have received all the data we need (and have not yet received a new frame pulse),
   //  then relay the data to the next module by re-transmitting it.
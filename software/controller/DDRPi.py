@@ -83,27 +83,34 @@ import os
 import time
 # We need pygame for the controller input logic, and the debug gui
 import pygame
-
-import sys
+# For network errors
+import socket
 
 # Python comes with some color conversion methods.
 import colorsys
 # For Math things, what else
 import math
-
-# For dynamically loading modules from files
-import imp
-import inspect
+# For packing the frames of a replayed recording
+import numpy
 
 # Dance Floor library classes
 from lib.layout import DisplayLayout
 from lib.floorcanvas import FloorCanvas
-from lib.output import GuiOutput, SerialOutput, PipeOutput
+from lib.calibration import Calibration
+from lib.power import PowerLimiter
+from lib.output import GuiOutput, SerialOutput, AddressedSerialOutput, PipeOutput, UdpOutput, PreviewOutput, RecorderOutput
 from lib.playlist import PluginPlaylistModel
 from lib.controllers import ControllerInput
 from lib.menu import Menu
 from lib.pluginmodel import PluginModel
+from lib.pluginloader import PluginManifest
+from lib.watcher import FileWatcher
+from lib.inputserver import InputServer
+from lib.recording import FrameRecording
+from lib.events import EventRouter
+from lib.controlserver import ControlServer, FrameStats
 from lib.filters import ClearFilter, NegativeFilter, NeutralDensityFilter
+from GamePlugin import GamePlugin
 
 import logging
 
@@ -142,6 +149,19 @@ class DDRPiMaster():
     #  of this array
     DEFAULT_STARTUP_PLUGIN = ["DiscoFloorVisualisationPlugin"]
 
+    # Games are moved on in fixed steps of this many milliseconds of game
+    #  time, however fast or slow frames are being drawn
+    GAME_UPDATE_STEP = 10
+    # If we fall further behind than this, e.g. because the machine was busy,
+    #  then let the game run slow rather than trying to catch up all at once
+    GAME_UPDATE_MAX_LAG = 250
+    # Frames that haven't changed aren't sent to the outputs, apart from once
+    #  in this many ms, in case anything was missed along the way
+    OUTPUT_REFRESH_INTERVAL = 1000
+
+    # Where the plugin manifest is cached, relative to the DDRPi directory
+    PLUGIN_MANIFEST = ".plugin_manifest.json"
+
     """
     Initial constructor set up
     """
@@ -152,6 +172,9 @@ class DDRPiMaster():
     def _initial_setup(self):
         self.gui = None
         self.clock = pygame.time.Clock()
+        # Where the plugins were found, filled in by load_plugins()
+        self.plugin_manifest = None
+        self.plugin_directories = []
         pass
 
     """
@@ -236,8 +259,18 @@ class DDRPiMaster():
                 elif ("name" in filter_config and filter_config["name"] == "NeutralDensityFilter"):
                     output_filters.append(NeutralDensityFilter(filter_config))
 
+        # Colour correction for the modules, which the outputs to the floor use
+        calibration = None
+        if "calibration" in config:
+            calibration = Calibration(config["calibration"], layout)
+
+        # Keep the floor within what the power supplies can provide
+        power_limiter = None
+        if "power" in config:
+            power_limiter = PowerLimiter(config["power"], layout)
+
         # Set up the various outputs defined in the config.
-        # Known types are the moment are "gui", "serial" and "pipe"
+        # Known types are the moment are "gui", "serial", "pipe", "udp", "preview" and "recorder"
         if ("outputs" in config):
             for output_number, details in config["outputs"].items():
                 self.logger.info("%d - %s" % (output_number, details))
@@ -248,10 +281,18 @@ class DDRPiMaster():
                         continue
                 self.logger.info("Configuring output %d" % output_number)
                 if details["type"] == "serial":
-                    self.logger.info("Creating a SerialOutput class")
-                    serial_output = SerialOutput(details)
-                    serial_output.set_name("SerialOutput-#%d" % output_number)
-                    serial_output.set_output_converter(converter)
+                    if details.get("protocol") == "addressed":
+                        self.logger.info("Creating an AddressedSerialOutput class")
+                        serial_output = AddressedSerialOutput(details)
+                        serial_output.set_name("AddressedSerialOutput-#%d" % output_number)
+                        serial_output.set_output_layout(layout)
+                    else:
+                        self.logger.info("Creating a SerialOutput class")
+                        serial_output = SerialOutput(details)
+                        serial_output.set_name("SerialOutput-#%d" % output_number)
+                        serial_output.set_output_converter(converter)
+                    serial_output.set_calibration(calibration)
+                    serial_output.set_power_limiter(power_limiter)
                     for output_filter in output_filters:
                         serial_output.append_filter(output_filter)
                     output_devices.append(serial_output)
@@ -266,11 +307,50 @@ class DDRPiMaster():
                 elif details["type"] == "pipe":
                     self.logger.info("Creating a PipeOutput class")
                     pipe_output = PipeOutput(details)
+                    pipe_output.set_name("PipeOutput-#%d" % output_number)
                     pipe_output.set_output_converter(converter)
+                    pipe_output.set_calibration(calibration)
                     output_devices.append(pipe_output)
+                elif details["type"] == "udp":
+                    self.logger.info("Creating a UdpOutput class")
+                    udp_output = UdpOutput(details)
+                    udp_output.set_name("UdpOutput-#%d" % output_number)
+                    udp_output.set_output_converter(converter)
+                    udp_output.set_calibration(calibration)
+                    for output_filter in output_filters:
+                        udp_output.append_filter(output_filter)
+                    output_devices.append(udp_output)
+                elif details["type"] == "preview":
+                    self.logger.info("Creating a PreviewOutput class")
+                    try:
+                        preview_output = PreviewOutput(details)
+                    except (socket.error, ValueError, TypeError) as e:
+                        self.logger.error("Unable to start the preview server: %s" % e)
+                        continue
+                    preview_output.set_name("PreviewOutput-#%d" % output_number)
+                    output_devices.append(preview_output)
+                elif details["type"] == "recorder":
+                    self.logger.info("Creating a RecorderOutput class")
+                    recorder_output = RecorderOutput(details)
+                    recorder_output.set_name("RecorderOutput-#%d" % output_number)
+                    try:
+                        recorder_output.set_output_layout(layout)
+                    except (IOError, OSError) as e:
+                        self.logger.error("Unable to start recording: %s" % e)
+                        continue
+                    output_devices.append(recorder_output)
                 else:
                     self.logger.warn("I don't know how to handle an output of type '%s'" % (details["type"]))
 
+        # Play a recording straight to the outputs instead of running any plugins
+        if "replay" in config["system"]:
+            self.run_replay(config["system"]["replay"], config["system"].get("replay_speed", 1.0),
+                            canvas, output_devices)
+            for output_device in output_devices:
+                output_device.close()
+            pygame.quit()
+            return None
+
         # Initialise any connected joypads/joysticks
         controllers = self.init_joysticks()
 
@@ -279,8 +359,16 @@ class DDRPiMaster():
         #  master list. If there are duplicate class names, the last one encountered probably wins silently.
         visualisation_plugin_dirs = ["visualisation_plugins", "game_plugins"]
 
+        # What is in each plugin file is cached here, so that they don't all
+        #  need to be read again (or imported at all) every time we start
+        plugin_manifest = self.PLUGIN_MANIFEST
+        try:
+            plugin_manifest = config["system"]["plugin_manifest"]
+        except (AttributeError, KeyError, TypeError):
+            pass
+
         # We will store a dict of classname > class object in here
-        available_plugins = self.load_plugins(visualisation_plugin_dirs)
+        available_plugins = self.load_plugins(visualisation_plugin_dirs, plugin_manifest)
 
         # Add all the available plugins to the menu
         #menu.add_available_plugins(available_plugins)
@@ -289,7 +377,19 @@ class DDRPiMaster():
         #  menu class to change what is active
         # We should also be able to provide this model to a webservice
         #  class if we chose to add in HTTP control of the floor too
-        plugin_model = PluginModel((layout.size_x, layout.size_y))
+        # Idle plugins are released if we use more than this much memory
+        plugin_memory_limit = None
+        try:
+            plugin_memory_limit = int(config["system"]["plugin_memory_limit"]) * 1024 * 1024
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        # Plugins that are to be run in a process of their own, or True for all of them
+        plugin_sandbox = None
+        try:
+            plugin_sandbox = config["system"]["sandbox"]
+        except (AttributeError, KeyError, TypeError):
+            pass
+        plugin_model = PluginModel((layout.size_x, layout.size_y), plugin_memory_limit, plugin_sandbox)
 
         # Populate the data model
         plugin_model.add_plugins(available_plugins)
@@ -314,6 +414,9 @@ class DDRPiMaster():
                 #  for whatever reason, exit.
                 exit()
 
+        # The playlist files we have loaded, which are reloaded if they change
+        playlist_files = []
+
         if "playlist" in config["system"]:
 
             # Retrieve the list of playlists specified on the command line
@@ -328,6 +431,7 @@ class DDRPiMaster():
                         playlist = os.path.join(root_directory, playlist)
                     # Load the playlist
                     plugin_model.add_playlist_from_file(playlist)
+                    playlist_files.append(playlist)
                 # Start the first one we added
                 self.logger.info("Setting current playlist to the first one we added")
                 plugin_model.set_current_playlist_by_index(1)
@@ -387,6 +491,38 @@ class DDRPiMaster():
         # Create an object that can map key events to joystick events
         self.controller_mapper = ControllerInput()
 
+        # Each event is passed along a chain of consumers, each of which
+        #  returns None if it has dealt with the event, or the event if
+        #  something else should act upon it. They only see the types of
+        #  event they have asked for:
+        # - Key presses are mapped to joystick events first
+        # - The menu, which only wants SELECT unless it is open, when it
+        #    takes everything
+        # - The current plugin, which is filled in each frame
+        def handle_menu_event(e):
+            e = menu.handle_event(e)
+            event_router.set_filter("menu", *menu.get_event_filter())
+            return e
+
+        # The plugin can't be trusted not to throw an exception, any more
+        #  than it can in draw_frame(), and the instance changes from frame
+        #  to frame, so it is looked up here rather than in the router
+        plugin_consumer = {"instance": None}
+
+        def handle_plugin_event(e):
+            try:
+                return plugin_consumer["instance"].handle_event(e)
+            except Exception as ex:
+                self.logger.warn("Current plugin threw an error whilst running handle_event()")
+                self.logger.warn(ex)
+                return None
+
+        event_router = EventRouter()
+        event_router.add_consumer("controller_mapper", self.controller_mapper.map_event,
+                                  [pygame.KEYDOWN, pygame.KEYUP])
+        event_router.add_consumer("menu", handle_menu_event, *menu.get_event_filter())
+        event_router.add_consumer("plugin", None)
+
         # The main loop is an event loop, with each part
         #  non-blocking and yields after doing a short bit.
         # Each 'bit' is a frame
@@ -394,48 +530,126 @@ class DDRPiMaster():
         # Check for pygame events, primarily coming from
         #  gamepads and the keyboard
 
+        # Watch the plugins and playlists for changes, so they can be
+        #  reloaded without having to restart everything else
+        watcher = None
+        if "watch_files" in config["system"] and config["system"]["watch_files"] is True:
+            watcher = FileWatcher(playlist_files, self.plugin_directories)
+            watcher.start()
+
+        # Take controller input over the network, on a thread of its own
+        input_server = None
+        if "input_port" in config["system"]:
+            try:
+                input_server = InputServer(config["system"].get("input_host", "0.0.0.0"),
+                                           int(config["system"]["input_port"]))
+                input_server.start()
+            except (socket.error, ValueError, TypeError) as e:
+                self.logger.error("Unable to start the input server: %s" % e)
+                input_server = None
+
+        # Serve the status of the floor, and take commands for it, over HTTP
+        control_server = None
+        if "control_port" in config["system"]:
+            try:
+                control_server = ControlServer(config["system"].get("control_host", "0.0.0.0"),
+                                               int(config["system"]["control_port"]))
+                control_server.start()
+            except (socket.error, ValueError, TypeError) as e:
+                self.logger.error("Unable to start the control server: %s" % e)
+                control_server = None
+        # How long each part of the loop takes
+        frame_stats = FrameStats()
+
+        # Whatever drew the last frame, either the menu or a plugin
+        last_drawn_by = None
+
+        # Game time that has passed but that the current game hasn't been
+        #  updated with yet
+        game_time_owed = 0
+        last_update_ticks = pygame.time.get_ticks()
+        # When the outputs were last sent a frame, and which canvas it was
+        last_sent_ticks = last_update_ticks
+        last_sent_frame = None
+
         running = True
         while running:
+            frame_stats.start_frame()
+
+            # Pick up any changed files, though not while someone is in the
+            #  menu, as it hangs on to the playlist it is showing
+            if watcher is not None and not menu.in_menu:
+                for path in watcher.get_changes():
+                    self.reload_file(path, plugin_model, playlist_files)
+
+            # Carry out anything that was asked for over HTTP since the last frame
+            if control_server is not None:
+                control_server.apply_commands(plugin_model, menu)
 
             current_playlist = plugin_model.get_current_playlist()
             current_plugin = None
             if current_playlist is not None:
                 current_plugin = current_playlist.get_current_plugin()
 
-            for e in pygame.event.get():
+            events = pygame.event.get()
+            if input_server is not None:
+                events += input_server.get_events()
+
+            # The menu may have been left without an event, e.g. over HTTP,
+            #  and the plugin may have changed
+            if len(events) > 0:
+                event_router.set_filter("menu", *menu.get_event_filter())
+                if current_plugin is not None and current_plugin.instance is not None:
+                    instance = current_plugin.instance
+                    plugin_consumer["instance"] = instance
+                    event_router.set_handler("plugin", handle_plugin_event,
+                                             getattr(instance, "EVENT_TYPES", None),
+                                             getattr(instance, "EVENT_BUTTONS", None))
+                else:
+                    event_router.set_handler("plugin", None)
+
+            for e in events:
 
                 if e.type == pygame.QUIT:
                     running = False
 
-                e = self.controller_mapper.map_event(e)
-
-                # Each consumer should return None if the
-                #  event has been consumed, or return
-                #  the event if something else should
-                #  act upon it
-
-                # Check first if the framework is going to
-                #  consume this event. This includes heading
-                #  into menus, possibly modifying the plugin
-                #  model (previous/next plugin)
-                #e = self.handle_event(e)
-                #if e is None:
-                #	continue
+                event_router.dispatch(e)
+            frame_stats.mark("input")
 
-                # See if the menu wants to consume this event
-                e = menu.handle_event(e)
-                if e is None:
-                    continue
-
-                #self.print_input_event(e)
-
-                # Next pass it on to the current plugin, if
-                #  there is one
-                if current_plugin is not None:
-                    #					e = current_plugin['instance'].handle_event(e)
-                    e = current_plugin.instance.handle_event(e)
-                    if e is None:
-                        continue
+            # Layers and owed game time belong to whatever is drawing the
+            #  floor, so throw them away when something else takes over
+            if menu.in_menu:
+                drawn_by = menu
+            else:
+                drawn_by = current_plugin
+            # A transition from one plugin to the next in the playlist
+            transition = None
+            if current_playlist is not None and drawn_by is current_plugin:
+                transition = current_playlist.get_transition()
+            if drawn_by is not last_drawn_by:
+                # The plugin that is fading out keeps its layers until it has gone
+                if transition is not None and transition.outgoing is last_drawn_by:
+                    transition.take_over(canvas)
+                canvas.clear_layers()
+                game_time_owed = 0
+                last_drawn_by = drawn_by
+
+            # Move the game on by however many fixed steps have passed since
+            #  the last frame. Only a game that is on the floor moves on
+            ticks = pygame.time.get_ticks()
+            game_time_owed = min(game_time_owed + ticks - last_update_ticks, self.GAME_UPDATE_MAX_LAG)
+            last_update_ticks = ticks
+            if drawn_by is current_plugin and current_plugin is not None \
+                    and isinstance(current_plugin.instance, GamePlugin):
+                try:
+                    while game_time_owed >= self.GAME_UPDATE_STEP:
+                        current_plugin.instance.update(self.GAME_UPDATE_STEP)
+                        game_time_owed -= self.GAME_UPDATE_STEP
+                except Exception as e:
+                    self.logger.warn("Current plugin threw an error whilst running update()")
+                    self.logger.warn(e)
+                    game_time_owed = 0
+            frame_stats.mark("update")
 
             # Ask the framework if it thinks it is displaying something
             # display_frame = self.draw_frame(canvas)
@@ -451,7 +665,11 @@ class DDRPiMaster():
                     #  external code (or some in-house code!), so catch any
                     #  exception
                     try:
-                        display_frame = current_plugin.instance.draw_frame(canvas)
+                        # The first frame may have been drawn already, while
+                        #  the plugin was being got ready in the background
+                        display_frame = current_plugin.take_prewarmed_frame(canvas)
+                        if display_frame is None:
+                            display_frame = current_plugin.instance.draw_frame(canvas)
                     except Exception as e:
                         self.logger.warn("Current plugin threw an error whilst running draw_frame()")
                         self.logger.warn(e)
@@ -470,17 +688,116 @@ class DDRPiMaster():
             if display_frame is None:
                 canvas.set_colour((0, 0, 0))
                 display_frame = canvas
+            frame_stats.mark("draw")
+
+            # Composite any layers onto the frame before it is sent anywhere
+            display_frame.flatten_layers()
+
+            # Blend in the plugin that is on its way out
+            if transition is not None and display_frame is canvas:
+                try:
+                    transition.draw(canvas)
+                except Exception as e:
+                    self.logger.warn("Outgoing plugin threw an error whilst transitioning")
+                    self.logger.warn(e)
+                    current_playlist.end_transition()
+            frame_stats.mark("compose")
+
+            # Work out what has changed since the last frame that was sent,
+            #  which is all of it if that was a different canvas
+            if display_frame is not last_sent_frame:
+                display_frame.forget_changes()
+            changed = display_frame.commit_changes()
+            last_sent_frame = display_frame
+
+            ticks = pygame.time.get_ticks()
+            if changed or ticks - last_sent_ticks >= self.OUTPUT_REFRESH_INTERVAL:
+                if not changed:
+                    display_frame.forget_changes()
+                    display_frame.commit_changes()
+                last_sent_ticks = ticks
+                for output_device in output_devices:
+                    output_device.send_data(display_frame)
+            else:
+                for output_device in output_devices:
+                    output_device.refresh(display_frame)
 
-            for output_device in output_devices:
-                output_device.send_data(display_frame)
+            # Any input that came in over the network is now on the floor
+            if input_server is not None:
+                input_server.frame_sent()
+            frame_stats.mark("output")
 
             # Limit the framerate, we need not do it in the plugins - they really shouldn't
             #  mind that we are running at a max of 25fps
             self.clock.tick(25)
+            frame_stats.mark("wait")
+            frame_stats.end_frame()
+
+            # Take a new snapshot for anyone asking over HTTP
+            if control_server is not None:
+                control_server.update(plugin_model, frame_stats, input_server)
 
+        for output_device in output_devices:
+            output_device.close()
+        if control_server is not None:
+            control_server.stop()
         pygame.quit()
         exit()
 
+    """
+    Send each frame of a recording to the outputs, at the speed it was
+     recorded times the given speed, or as fast as they will take it if the
+     speed is 0. How long each output took is logged at the end, so this
+     doubles as a benchmark of the outputs with real frames
+    """
+
+    def run_replay(self, recording_file, speed, canvas, output_devices):
+        try:
+            recording = FrameRecording(recording_file)
+            speed = float(speed)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.error("Unable to replay %s: %s" % (recording_file, e))
+            return None
+        if recording.get_size() != canvas.get_size():
+            self.logger.warn("%s was recorded on a %dx%d floor, this one is %dx%d" %
+                             ((recording_file,) + recording.get_size() + canvas.get_size()))
+
+        # Where each recorded pixel goes on the canvas, leaving out any that
+        #  don't fit on this one
+        positions = recording.get_positions()
+        on_canvas = (positions[:, 0] < canvas.get_width()) & (positions[:, 1] < canvas.get_height())
+        xs = positions[on_canvas, 0]
+        ys = positions[on_canvas, 1]
+
+        self.logger.info("Replaying %s at %s speed" % (recording_file, speed if speed > 0 else "full"))
+        output_times = [0.0] * len(output_devices)
+        frames = 0
+        start = time.time()
+        for (timestamp, rgb) in recording.frames():
+            if speed > 0:
+                wait = start + timestamp / (1000.0 * speed) - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+            if self.gui is not None and pygame.event.peek(pygame.QUIT):
+                break
+
+            rgb = rgb[on_canvas].astype(numpy.uint32)
+            canvas.get_canvas_array()[xs, ys] = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+            canvas.commit_changes()
+            for (index, output_device) in enumerate(output_devices):
+                sent = time.time()
+                output_device.send_data(canvas)
+                output_times[index] += time.time() - sent
+            frames += 1
+            if self.gui is not None:
+                pygame.event.pump()
+
+        elapsed = time.time() - start
+        self.logger.info("Replayed %d frames in %.2fs (%.1f fps)" % (frames, elapsed, frames / max(elapsed, 1e-6)))
+        for (output_device, output_time) in zip(output_devices, output_times):
+            self.logger.info("  %s: %.3fms a frame" % (output_device.name, 1000.0 * output_time / max(frames, 1)))
+        return None
+
     def print_input_event(self, e):
         self.logger.info("%s" % e)
 
@@ -493,9 +810,9 @@ class DDRPiMaster():
         SELECT = 8
         START = 9
 
-        if pygame.event.event_name(e.type) == "JoyButtonDown":
+        if e.type == pygame.JOYBUTTONDOWN:
             self.logger.info("JoyButtonDown")
-        if pygame.event.event_name(e.type) == "JoyButtonUp":
+        if e.type == pygame.JOYBUTTONUP:
             self.logger.info("JoyButtonUp")
 
         return None
@@ -539,56 +856,43 @@ class DDRPiMaster():
     """
     Iterate over the directories passed in, and find as many plugins as we can
     A plugin is currently defined as something that has a classname that ends
-     with "VisualisationPlugin". This might not be ideal, as if we have an abstract
-        super class then we will have to have some way of saying that this is not a real
-     plugin.
-    Return a dict of class objects, keyed on the class name. This allows us to
-     create instances of these classes whenever we want
+     with "Plugin", defined at the top level of its module. This might not be
+     ideal, as if we have an abstract super class then we will have to have
+     some way of saying that this is not a real plugin.
+    The files are only parsed, not imported, and what is found is cached in
+     manifest_file so that only files that have changed are parsed next time.
+     Each module is imported when one of its plugins is first created, so a
+     plugin that is broken only affects itself, and only when it is used.
+    Return a dict of LazyPlugin objects, keyed on the class name. These can be
+     called like the class itself to create instances of it whenever we want
     """
 
-    def load_plugins(self, directory_list):
+    def load_plugins(self, directory_list, manifest_file=None):
         available_plugins = dict()
 
+        root_directory = os.path.dirname(os.path.realpath(__file__))
+        if manifest_file is not None and not os.path.isabs(manifest_file):
+            manifest_file = os.path.join(root_directory, manifest_file)
+        manifest = PluginManifest(manifest_file)
+        # Keep hold of these so that changed plugins can be found again later
+        self.plugin_manifest = manifest
+        self.plugin_directories = []
+
         for plugin_dir in directory_list:
 
             # If the directory is not fully qualified, make it relative
             #  to the DDRPi directory
             if (not os.path.isabs(plugin_dir)):
-                root_directory = os.path.dirname(os.path.realpath(__file__))
                 plugin_dir = os.path.join(root_directory, plugin_dir)
+            self.plugin_directories.append(plugin_dir)
 
             if not os.path.isdir(plugin_dir):
                 self.logger.warn("'%s' is not a directory" % (plugin_dir))
 
-            # Recursively search the given directory for .py files which
-            #  aren't commented out (start with __)
-            these_plugins = dict()
-            for root, dirs, files in os.walk(plugin_dir):
-                for fname in files:
-                    if fname.endswith(".py") and not fname.startswith("__"):
-                        # Remove the .py from the end
-                        module_name = fname.split('.', 1)[0]
-                        # Create the full path to the file
-                        fpath = os.path.join(root, fname)
-                        # Attempt to load the module dynamically
-                        try:
-                            foo = imp.load_source(module_name, fpath)
-                            # Search through the members of this module
-                            #  to find the classes used, and find the
-                            #  ones that end in "VisualisationPlugin" which
-                            #  are defined in this module
-                            for name, obj in inspect.getmembers(foo):
-                                if inspect.isclass(obj):
-                                    if name.endswith("Plugin") and obj.__module__ == module_name:
-                                        these_plugins[obj.__name__] = obj
-                        except (Exception) as e:
-                            self.logger.info("An error occurred loading plugins from %s" % (fname))
-                            self.logger.info(e)
-                            self.logger.info(sys.exc_info())
-                            exit()
-
-            # Print out a list of what plugins were loaded from each directory
-            self.logger.info("Visualisation plugins loaded from '%s':" % (plugin_dir))
+            these_plugins = manifest.scan(plugin_dir)
+
+            # Print out a list of what plugins were found in each directory
+            self.logger.info("Visualisation plugins found in '%s':" % (plugin_dir))
             if len(these_plugins) == 0:
                 self.logger.info("  None")
             else:
@@ -598,8 +902,31 @@ class DDRPiMaster():
             # Add these_plugins to our master list
             available_plugins.update(these_plugins)
 
+        manifest.save()
+
         return available_plugins
 
+    """
+    A file we are watching has changed, so reload it. Either it is one of the
+     playlists, or it is a plugin module, in which case every plugin in it is
+     swapped for a new one that will import the module again when it is next
+     created
+    """
+
+    def reload_file(self, path, plugin_model, playlist_files):
+        self.logger.info("Reloading %s" % path)
+        try:
+            if path in playlist_files:
+                plugin_model.reload_playlist_from_file(path)
+            else:
+                plugins = self.plugin_manifest.scan_file(path)
+                for plugin_name in plugins:
+                    plugin_model.reload_plugin(plugin_name, plugins[plugin_name])
+                self.plugin_manifest.save()
+        except Exception as e:
+            self.logger.warn("Unable to reload %s" % path)
+            self.logger.warn(e)
+
     """
     The commandline arguments are parsed, and a config file is created and returned to the
      rest of the programme.
@@ -639,6 +966,11 @@ class DDRPiMaster():
                             help='The classname of the one plugin to use')
         parser.add_argument('--playlist', required=False, action='append', dest='playlist', default=None,
                             help='A playlist to use')
+        # --replay plays a recording made by a recorder output, instead of running plugins
+        parser.add_argument('--replay', required=False, dest='replay', default=None,
+                            help='A recording to play to the outputs, instead of running any plugins')
+        parser.add_argument('--replay_speed', required=False, dest='replay_speed', default=None, type=float,
+                            help='How much faster than recorded to replay, or 0 for as fast as possible')
         args, unknown = parser.parse_known_args()
         self.logger.info("Just the --config argument:")
         self.logger.info("%s" % args)
@@ -739,6 +1071,8 @@ class DDRPiMaster():
         args.append("headless")
         args.append("plugin")
         args.append("playlist")
+        args.append("replay")
+        args.append("replay_speed")
         return args;
 
 # GO GO GO!
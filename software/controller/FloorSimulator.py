@@ -21,12 +21,12 @@ class FloorSimulator(object):
         f = open(config_file)
         config = yaml.load(f)
         f.close()
-        self.layout = DisplayLayout(config["modules"])
-        self.dimensions = (height, width) = self.layout.calculate_floor_size()
+        self.layout = DisplayLayout(config)
+        self.dimensions = (height, width) = (self.layout.size_x, self.layout.size_y)
         self.size = (height * 20, width * 20)
         self.pipe = open(config["system"]["pipe"])
-        lm = self.layout.layout_mapping
-        self.reverse_lm = self.__reverse_mapping__(lm)
+        # Where each pixel in the data goes on the floor, in the order it is sent
+        self.reverse_lm = self.layout.get_converter()
 
     def start(self):
         pygame.init()
@@ -72,11 +72,9 @@ class FloorSimulator(object):
     def __build_pixel_list__(self, line):
         pixels = []
 
-        (h, w) = self.dimensions
-
         index = 0
         p = 0
-        while p < (h * w):
+        while p < self.layout.pixel_count:
             r = line[index:index + 6]
             g = line[index + 6:index + 12]
             b = line[index + 12:index + 18]
@@ -87,7 +85,6 @@ class FloorSimulator(object):
         return pixels
 
     def __draw_pixels__(self, pixels):
-        (h, w) = self.dimensions
         for i in range(0, len(self.reverse_lm)):
             (r, g, b) = pixels[i]
             c = pygame.Color(r, g, b)
@@ -97,16 +94,6 @@ class FloorSimulator(object):
         self.screen.blit(self.background, (0, 0))
         pygame.display.update()
 
-    def __reverse_mapping__(self, lm):
-        pixel_coords = {}
-        (w, h) = self.dimensions
-        for x in range(0, w):
-            for y in range(0, h):
-                p = lm[x][y]
-                if p is not None:
-                    pixel_coords[p] = (x, y)
-        return pixel_coords
-
 
 def interrupt_handler(signum, frame):
     print "Received SIGINT"
@@ -42,6 +42,97 @@ class GamePlugin(object):
     def handle_event(self, e):
         return e
 
+    """
+    The types of event that handle_event() should be given, and for joystick
+     button events which buttons, or None for all of them. Anything else goes
+     straight past the plugin
+    """
+
+    EVENT_TYPES = None
+    EVENT_BUTTONS = None
+
+    """
+    The framework calls update() with a fixed amount of game time in
+     milliseconds, as many times as are needed to keep up with real time, and
+     separately from draw_frame(). Game state should move on here rather than
+     in draw_frame() or on pygame timer events, so that games run at the same
+     speed however quickly frames are drawn, and can be run without a display
+     at all. The default fires any timers that are due, so a plugin overriding
+     this should call it too
+    """
+
+    def update(self, dt):
+        timers = self.__get_timers()
+        end_time = self.get_game_time() + dt
+        while True:
+            # Fire the timers in the order they were due, with the game time
+            #  set to when each was due, so the result is the same however the
+            #  time was split up. A callback can set or cancel timers, so look
+            #  again after each one
+            due = [(timer["due"], timer["order"], name) for (name, timer) in timers.items()
+                   if timer["due"] <= end_time]
+            if len(due) == 0:
+                break
+            (due_time, order, name) = min(due)
+            self.__game_time = due_time
+            timer = timers[name]
+            timer["due"] += timer["interval"]
+            timer["callback"]()
+        self.__game_time = end_time
+
+    """
+    Call callback() every interval milliseconds of game time, replacing any
+     timer with the same name, or cancel it if interval is 0. The timers belong
+     to this plugin, and only move on when update() is called
+    """
+
+    def set_timer(self, name, interval, callback):
+        if interval <= 0:
+            self.cancel_timer(name)
+            return
+        timers = self.__get_timers()
+        self.__timer_order = getattr(self, "_GamePlugin__timer_order", 0) + 1
+        timers[name] = {
+            "interval": interval,
+            "callback": callback,
+            "due": self.get_game_time() + interval,
+            "order": self.__timer_order
+        }
+
+    """
+    Change how often a timer fires, counting from when it last fired, without
+     otherwise restarting it. As with set_timer(), an interval of 0 cancels it
+    """
+
+    def change_timer(self, name, interval):
+        if interval <= 0:
+            self.cancel_timer(name)
+            return
+        timers = self.__get_timers()
+        if name in timers:
+            timer = timers[name]
+            timer["due"] += interval - timer["interval"]
+            timer["interval"] = interval
+
+    def cancel_timer(self, name):
+        self.__get_timers().pop(name, None)
+
+    def cancel_timers(self):
+        self.__get_timers().clear()
+
+    """
+    The total game time, in milliseconds, that update() has been called with
+    """
+
+    def get_game_time(self):
+        return getattr(self, "_GamePlugin__game_time", 0)
+
+    # Plugins don't call GamePlugin.__init__(), so create the timers on first use
+    def __get_timers(self):
+        if getattr(self, "_GamePlugin__timers", None) is None:
+            self.__timers = {}
+        return self.__timers
+
     """
     Some plugins might have specific things they need to do when they start,
      for example, start a thread, or load other resources
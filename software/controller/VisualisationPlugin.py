@@ -55,6 +55,15 @@ class VisualisationPlugin(object):
     def handle_event(self, e):
         return e
 
+    """
+    The types of event that handle_event() should be given, and for joystick
+     button events which buttons, or None for all of them. Anything else goes
+     straight past the plugin
+    """
+
+    EVENT_TYPES = None
+    EVENT_BUTTONS = None
+
     """
     Some plugins might have specific things they need to do when they start,
      for example, start a thread, or load other resources
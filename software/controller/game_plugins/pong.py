@@ -2,14 +2,16 @@ __authors__ = ['Joel Wright']
 
 import logging
 import pygame
-import pygame.time
 import random
 from DDRPi import FloorCanvas
 from GamePlugin import GamePlugin
-from pygame.locals import *
 
 
 class PongGamePlugin(GamePlugin):
+    # Start/pause is 9, and 0 starts a new game when it is paused
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN, pygame.JOYAXISMOTION]
+    EVENT_BUTTONS = [0, 9]
+
     # Static map from joypad to player name
     __player__ = {
     0: 'player1',
@@ -17,24 +19,24 @@ class PongGamePlugin(GamePlugin):
     }
 
     __numbers__ = {
-    0: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 4), (x + 2, y),
+    0: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 4), (x + 2, y),
                        (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    1: lambda (x, y): [(x, y + 1), (x, y + 4), (x + 1, y), (x + 1, y + 1), (x + 1, y + 2), (x + 1, y + 3),
+    1: lambda x, y: [(x, y + 1), (x, y + 4), (x + 1, y), (x + 1, y + 1), (x + 1, y + 2), (x + 1, y + 3),
                        (x + 1, y + 4), (x + 2, y + 4)],
-    2: lambda (x, y): [(x, y), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
+    2: lambda x, y: [(x, y), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
                        (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 4)],
-    3: lambda (x, y): [(x, y), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4), (x + 2, y), (x + 2, y + 1),
+    3: lambda x, y: [(x, y), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4), (x + 2, y), (x + 2, y + 1),
                        (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    4: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2),
+    4: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2),
                        (x + 2, y + 3), (x + 2, y + 4)],
-    5: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
+    5: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
                        (x + 2, y), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    6: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
+    6: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
                        (x + 1, y + 4), (x + 2, y), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    7: lambda (x, y): [(x, y), (x + 1, y), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    8: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
+    7: lambda x, y: [(x, y), (x + 1, y), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
+    8: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
                        (x + 1, y + 4), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    9: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x + 1, y), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1),
+    9: lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x + 1, y), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1),
                        (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)]
     }
 
@@ -52,10 +54,7 @@ class PongGamePlugin(GamePlugin):
         Start the plugin.
         """
         self.game_state['state'] = "RUNNING"
-        x_speed = self.game_state['ball_x_speed']
-        pygame.time.set_timer(USEREVENT + 2, x_speed)
-        y_speed = self.game_state['ball_y_speed']
-        pygame.time.set_timer(USEREVENT + 3, y_speed)
+        self._enable_ball_events()
 
     def stop(self):
         """
@@ -71,14 +70,18 @@ class PongGamePlugin(GamePlugin):
         self.game_state['state'] = "PAUSED"
         self._disable_move_events()
 
+    def _enable_ball_events(self):
+        """
+        Start the recurring ball movement timers
+        """
+        self.set_timer("ball_x", self.game_state['ball_x_speed'], self._ball_x_motion)
+        self.set_timer("ball_y", self.game_state['ball_y_speed'], self._ball_y_motion)
+
     def _disable_move_events(self):
         """
         Disable recurring movement events
         """
-        pygame.time.set_timer(USEREVENT + 0, 0)
-        pygame.time.set_timer(USEREVENT + 1, 0)
-        pygame.time.set_timer(USEREVENT + 2, 0)
-        pygame.time.set_timer(USEREVENT + 3, 0)
+        self.cancel_timers()
 
     def resume(self):
         """
@@ -88,10 +91,7 @@ class PongGamePlugin(GamePlugin):
             self._draw_state()
         else:  # restart repeating events
             self.game_state['state'] = "RUNNING"
-            x_speed = self.game_state['ball_x_speed']
-            pygame.time.set_timer(USEREVENT + 2, x_speed)
-            y_speed = self.game_state['ball_y_speed']
-            pygame.time.set_timer(USEREVENT + 3, y_speed)
+            self._enable_ball_events()
 
     def draw_splash(self, canvas):
         """
@@ -117,10 +117,10 @@ class PongGamePlugin(GamePlugin):
             canvas.set_pixel(w - 1, y, grey)
             if not y % 2 == 0:
                 if not w % 2 == 0:
-                    canvas.set_pixel(w / 2, y, grey)
+                    canvas.set_pixel(w // 2, y, grey)
                 else:
-                    canvas.set_pixel(w / 2, y, grey)
-                    canvas.set_pixel(w / 2 - 1, y, grey)
+                    canvas.set_pixel(w // 2, y, grey)
+                    canvas.set_pixel(w // 2 - 1, y, grey)
 
         rx = random.randint(2, w - 3)
         ry = random.randint(2, h - 3)
@@ -138,55 +138,25 @@ class PongGamePlugin(GamePlugin):
         Handle the pygame event sent to the plugin from the main loop
         """
         if self.game_state['state'] == "RUNNING":
-            repeats = {
-            "player1": 0,
-            "player2": 1
-            }
             # Update the boards according to the event
-            if pygame.event.event_name(event.type) == "JoyAxisMotion":
+            if event.type == pygame.JOYAXISMOTION:
                 # Handle the move
                 joypad = event.joy
                 player = PongGamePlugin.__player__[joypad]
                 direction = int(event.value)
                 if event.axis in [0, 1]:  # Ignore extra axes from complicated controllers
                     if direction == 0:
-                        pygame.time.set_timer(USEREVENT + joypad, 0)
+                        self.cancel_timer("%s_repeat" % player)
                     else:
                         repeat_speed = self.game_state['initial_repeat_delay']
-                        pygame.time.set_timer(USEREVENT + joypad, repeat_speed)
+                        self.set_timer("%s_repeat" % player, repeat_speed, lambda: self._repeat_bat(player))
                         if player == 'player2' and event.axis == 0:
                             # Invert left/right for player 2 for face2face gaming :)
                             self.game_state[player]['direction'] = -direction
                         else:
                             self.game_state[player]['direction'] = direction
                         self._move_bat(player, self.game_state[player]['direction'])
-            elif pygame.event.event_name(event.type) == "UserEvent":
-                event_number = event.type - 24
-                if event_number < 2:  # Events 0 and 1 are the repeat moves for players
-                    player = PongGamePlugin.__player__[event_number]
-                    speed = self.game_state['button_repeat_speed']
-                    pygame.time.set_timer(USEREVENT + event_number, speed)
-                    self._move_bat(player, self.game_state[player]['direction'])
-                elif event_number == 2:  # USEREVENT+2 = x-axis ball motion
-                    speed = self.game_state['ball_x_speed']
-                    pygame.time.set_timer(USEREVENT + event_number, speed)
-                    logging.debug("PongGamePlugin: Handling x-axis ball motion")
-                    delta = self.game_state["ball_x_direction"]
-                    in_play = self._move_ball((delta, 0))
-                    if not in_play:
-                        self._player_missed()
-                elif event_number == 3:  # USEREVENT+3 = y-axis ball motion
-                    logging.debug("PongGamePlugin: Handling y-axis ball motion")
-                    # The current y-direction speed is set when the ball hits a bat
-                    # so we update the y-axis event every time it occurs in case the
-                    # speed has changed
-                    speed = self.game_state['ball_y_speed']
-                    pygame.time.set_timer(USEREVENT + event_number, speed)
-                    delta = self.game_state['ball_y_direction']
-                    in_play = self._move_ball((0, delta))  # A move in the y-axis cannot put the ball out of play
-                else:
-                    logging.debug("PongGamePlugin: Tried to handle an unknown USEREVENT")
-            elif pygame.event.event_name(event.type) == "JoyButtonDown":
+            elif event.type == pygame.JOYBUTTONDOWN:
                 # Handle the button
                 joypad = event.joy
                 button = event.button
@@ -198,7 +168,7 @@ class PongGamePlugin(GamePlugin):
             else:
                 logging.debug("PongGamePlugin: Tried to handle an unknown event type")
         elif self.game_state['state'] == "STOPPED":
-            if pygame.event.event_name(event.type) == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # Handle the start button
                 joypad = event.joy
                 button = event.button
@@ -206,7 +176,7 @@ class PongGamePlugin(GamePlugin):
                     self._reset()
                     self.start()
         elif self.game_state['state'] == "PAUSED":
-            if pygame.event.event_name(event.type) == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # Handle the start button
                 joypad = event.joy
                 button = event.button
@@ -216,16 +186,48 @@ class PongGamePlugin(GamePlugin):
                     self._reset()
                     self.start()
         elif self.game_state['state'] == "BETWEEN_POINTS":
-            if pygame.event.event_name(event.type) == "UserEvent":
-                event_number = event.type - 24
-                if event_number == 4:  # Event 4 is the restart event after a point
-                    pygame.time.set_timer(USEREVENT + 4, 0)
-                    self.resume()
-                else:
-                    logging.debug("PongGamePlugin: Unknown user event")
+            # The next point starts on a timer
+            pass
         else:
             logging.debug("PongGamePlugin: Need to handle state: " % self.__state__)
 
+    def _repeat_bat(self, player):
+        """
+        Keep moving a player's bat while they hold the stick over
+        """
+        self.change_timer("%s_repeat" % player, self.game_state['button_repeat_speed'])
+        self._move_bat(player, self.game_state[player]['direction'])
+
+    def _ball_x_motion(self):
+        """
+        Move the ball one step along the x-axis
+        """
+        self.change_timer("ball_x", self.game_state['ball_x_speed'])
+        logging.debug("PongGamePlugin: Handling x-axis ball motion")
+        delta = self.game_state["ball_x_direction"]
+        in_play = self._move_ball((delta, 0))
+        if not in_play:
+            self._player_missed()
+
+    def _ball_y_motion(self):
+        """
+        Move the ball one step along the y-axis
+        """
+        logging.debug("PongGamePlugin: Handling y-axis ball motion")
+        # The current y-direction speed is set when the ball hits a bat
+        # so we update the y-axis timer every time it fires in case the
+        # speed has changed
+        self.change_timer("ball_y", self.game_state['ball_y_speed'])
+        delta = self.game_state['ball_y_direction']
+        self._move_ball((0, delta))  # A move in the y-axis cannot put the ball out of play
+
+    def _start_next_point(self):
+        """
+        Called a little while after a point has been won to carry on playing
+        """
+        self.cancel_timer("next_point")
+        self.resume()
+
     def draw_frame(self, canvas):
         """
         Write the updated plugin state to the dance surface and blit
@@ -248,10 +250,10 @@ class PongGamePlugin(GamePlugin):
             canvas.set_pixel(w - 1, y, grey)
             if not y % 2 == 0:
                 if not w % 2 == 0:
-                    canvas.set_pixel(w / 2, y, grey)
+                    canvas.set_pixel(w // 2, y, grey)
                 else:
-                    canvas.set_pixel(w / 2, y, grey)
-                    canvas.set_pixel(w / 2 - 1, y, grey)
+                    canvas.set_pixel(w // 2, y, grey)
+                    canvas.set_pixel(w // 2 - 1, y, grey)
 
         # Draw the current player bats and position of the ball
         (bx, by) = self.game_state['ball_position']
@@ -273,12 +275,12 @@ class PongGamePlugin(GamePlugin):
         h = self.floor_size[1]
         self.game_state = {
         'player1': {
-        'position': h / 2 - 2,
+        'position': h // 2 - 2,
         'score': 0,
         'direction': 0
         },
         'player2': {
-        'position': h / 2 - 2,
+        'position': h // 2 - 2,
         'score': 0,
         'direction': 0
         },
@@ -288,7 +290,7 @@ class PongGamePlugin(GamePlugin):
         'ball_x_speed': 150,  # I expect this to remain constant
         'ball_y_direction': [1, -1][random.randint(0, 1)],
         'ball_y_speed': 150,  # Updated when the ball hits the bat, refreshed every y-move userevent
-        'ball_position': (2, h / 2 - 1),
+        'ball_position': (2, h // 2 - 1),
         'state': "RUNNING",
         'bat_size': 3
         }
@@ -432,14 +434,14 @@ class PongGamePlugin(GamePlugin):
         h = self.floor_size[1]
         if bx == 0:
             self.game_state['player2']['score'] += 1
-            self.game_state['ball_position'] = (w - 3, h / 2 - 1)
+            self.game_state['ball_position'] = (w - 3, h // 2 - 1)
             self.game_state['ball_x_direction'] = -1
         elif bx == w - 1:
             self.game_state['player1']['score'] += 1
-            self.game_state['ball_position'] = (2, h / 2 - 1)
+            self.game_state['ball_position'] = (2, h // 2 - 1)
             self.game_state['ball_x_direction'] = 1
-        self.game_state['player1']['position'] = h / 2 - 2
-        self.game_state['player2']['position'] = h / 2 - 2
+        self.game_state['player1']['position'] = h // 2 - 2
+        self.game_state['player2']['position'] = h // 2 - 2
         self.game_state['ball_x_speed'] = 150
         self.game_state['ball_y_speed'] = 150
         self.game_state['ball_y_direction'] = [1, -1][random.randint(0, 1)]
@@ -454,7 +456,7 @@ class PongGamePlugin(GamePlugin):
             winner = 'player2'
             self.game_state['state'] = "STOPPED"
         else:
-            pygame.time.set_timer(USEREVENT + 4, 2000)
+            self.set_timer("next_point", 2000, self._start_next_point)
 
         logging.debug("PongGamePlugin Score: Player 1 (%s) - Player 2 (%s)" % (p1_score, p2_score))
 
@@ -465,14 +467,14 @@ class PongGamePlugin(GamePlugin):
         w = canvas.get_width()
         h = canvas.get_height()
 
-        p1sx = (w / 2 - 3) / 2 + 1
-        p2sx = (w / 2 - 3) / 2 + w / 2
-        psy = h / 2 - 3
+        p1sx = (w // 2 - 3) // 2 + 1
+        p2sx = (w // 2 - 3) // 2 + w // 2
+        psy = h // 2 - 3
 
         p1_score = self.game_state['player1']['score']
-        p1_score_pixels = PongGamePlugin.__numbers__[p1_score]((p1sx, psy))
+        p1_score_pixels = PongGamePlugin.__numbers__[p1_score](p1sx, psy)
         p2_score = self.game_state['player2']['score']
-        p2_score_pixels = PongGamePlugin.__numbers__[p2_score]((p2sx, psy))
+        p2_score_pixels = PongGamePlugin.__numbers__[p2_score](p2sx, psy)
 
         white = (255, 255, 255)
         red = (255, 0, 0)
@@ -2,77 +2,73 @@ __authors__ = ['Joel Wright', 'Andrew Taylor']
 
 import logging
 import pygame
-import pygame.time
 import random
-from pygame.locals import *
 
-from DDRPi import FloorCanvas
+import numpy
+
 from GamePlugin import GamePlugin
 
 
 class TetrisGamePlugin(GamePlugin):
-    # Static maps to define the shape and rotation of tetrominos
+    # Static tables of the offsets, from the tetromino's position, of the
+    #  four blocks making up each shape in each orientation
     __tetrominos__ = {
-    'L': lambda o, x, y: TetrisGamePlugin.__L__[o](x, y),
-    'J': lambda o, x, y: TetrisGamePlugin.__J__[o](x, y),
-    'S': lambda o, x, y: TetrisGamePlugin.__S__[o](x, y),
-    'Z': lambda o, x, y: TetrisGamePlugin.__Z__[o](x, y),
-    'O': lambda o, x, y: TetrisGamePlugin.__O__[o](x, y),
-    'T': lambda o, x, y: TetrisGamePlugin.__T__[o](x, y),
-    'I': lambda o, x, y: TetrisGamePlugin.__I__[o](x, y)
-    }
-
-    __L__ = {
-    'N': lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x + 1, y + 2)],
-    'E': lambda x, y: [(x, y), (x, y + 1), (x + 1, y), (x + 2, y)],
-    'S': lambda x, y: [(x, y), (x + 1, y), (x + 1, y + 1), (x + 1, y + 2)],
-    'W': lambda x, y: [(x, y + 1), (x + 1, y + 1), (x + 2, y + 1), (x + 2, y)]
-    }
-
-    __J__ = {
-    'N': lambda x, y: [(x + 1, y), (x + 1, y + 1), (x + 1, y + 2), (x, y + 2)],
-    'E': lambda x, y: [(x, y), (x, y + 1), (x + 1, y + 1), (x + 2, y + 1)],
-    'S': lambda x, y: [(x, y), (x + 1, y), (x, y + 1), (x, y + 2)],
-    'W': lambda x, y: [(x, y), (x + 1, y), (x + 2, y), (x + 2, y + 1)]
-    }
-
-    __S__ = {
-    'N': lambda x, y: [(x, y + 1), (x + 1, y + 1), (x + 1, y), (x + 2, y)],
-    'E': lambda x, y: [(x, y), (x, y + 1), (x + 1, y + 1), (x + 1, y + 2)],
-    'S': lambda x, y: [(x, y + 1), (x + 1, y + 1), (x + 1, y), (x + 2, y)],  # S == N
-    'W': lambda x, y: [(x, y), (x, y + 1), (x + 1, y + 1), (x + 1, y + 2)]  # E == W
+    'L': {
+    'N': ((0, 0), (0, 1), (0, 2), (1, 2)),
+    'E': ((0, 0), (0, 1), (1, 0), (2, 0)),
+    'S': ((0, 0), (1, 0), (1, 1), (1, 2)),
+    'W': ((0, 1), (1, 1), (2, 1), (2, 0))
+    },
+    'J': {
+    'N': ((1, 0), (1, 1), (1, 2), (0, 2)),
+    'E': ((0, 0), (0, 1), (1, 1), (2, 1)),
+    'S': ((0, 0), (1, 0), (0, 1), (0, 2)),
+    'W': ((0, 0), (1, 0), (2, 0), (2, 1))
+    },
+    'S': {
+    'N': ((0, 1), (1, 1), (1, 0), (2, 0)),
+    'E': ((0, 0), (0, 1), (1, 1), (1, 2)),
+    'S': ((0, 1), (1, 1), (1, 0), (2, 0)),  # S == N
+    'W': ((0, 0), (0, 1), (1, 1), (1, 2))  # E == W
+    },
+    'Z': {
+    'N': ((0, 0), (1, 0), (1, 1), (2, 1)),
+    'E': ((1, 0), (1, 1), (0, 1), (0, 2)),
+    'S': ((0, 0), (1, 0), (1, 1), (2, 1)),  # S == N
+    'W': ((1, 0), (1, 1), (0, 1), (0, 2))  # E == W
+    },
+    'O': {
+    'N': ((0, 0), (1, 0), (0, 1), (1, 1)),
+    'E': ((0, 0), (1, 0), (0, 1), (1, 1)),
+    'S': ((0, 0), (1, 0), (0, 1), (1, 1)),
+    'W': ((0, 0), (1, 0), (0, 1), (1, 1))
+    },
+    'T': {
+    'N': ((0, 0), (1, 0), (2, 0), (1, 1)),
+    'E': ((1, 0), (1, 1), (1, 2), (0, 1)),
+    'S': ((0, 1), (1, 1), (2, 1), (1, 0)),
+    'W': ((0, 0), (0, 1), (0, 2), (1, 1))
+    },
+    'I': {
+    'N': ((0, 0), (0, 1), (0, 2), (0, 3)),
+    'E': ((0, 0), (1, 0), (2, 0), (3, 0)),
+    'S': ((0, 0), (0, 1), (0, 2), (0, 3)),  # S == N
+    'W': ((0, 0), (1, 0), (2, 0), (3, 0))  # E == W
     }
-
-    __Z__ = {
-    'N': lambda x, y: [(x, y), (x + 1, y), (x + 1, y + 1), (x + 2, y + 1)],
-    'E': lambda x, y: [(x + 1, y), (x + 1, y + 1), (x, y + 1), (x, y + 2)],
-    'S': lambda x, y: [(x, y), (x + 1, y), (x + 1, y + 1), (x + 2, y + 1)],  # S == N
-    'W': lambda x, y: [(x + 1, y), (x + 1, y + 1), (x, y + 1), (x, y + 2)]  # E == W
     }
 
-    __O__ = {
-    'N': lambda x, y: [(x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)],
-    'E': lambda x, y: [(x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)],
-    'S': lambda x, y: [(x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)],
-    'W': lambda x, y: [(x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)],
-    }
+    __shapes__ = ['L', 'J', 'S', 'Z', 'O', 'T', 'I']
 
-    __T__ = {
-    'N': lambda x, y: [(x, y), (x + 1, y), (x + 2, y), (x + 1, y + 1)],
-    'E': lambda x, y: [(x + 1, y), (x + 1, y + 1), (x + 1, y + 2), (x, y + 1)],
-    'S': lambda x, y: [(x, y + 1), (x + 1, y + 1), (x + 2, y + 1), (x + 1, y)],
-    'W': lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x + 1, y + 1)]
-    }
+    __orientations__ = ['N', 'E', 'S', 'W']
 
-    __I__ = {
-    'N': lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 3)],
-    'E': lambda x, y: [(x, y), (x + 1, y), (x + 2, y), (x + 3, y)],
-    'S': lambda x, y: [(x, y), (x, y + 1), (x, y + 2), (x, y + 3)],  # S == N
-    'W': lambda x, y: [(x, y), (x + 1, y), (x + 2, y), (x + 3, y)]  # E == W
+    # Static map from joypad button to action
+    __buttons__ = {
+    1: "rotate_clockwise",
+    2: "rotate_anticlockwise",
+    3: "drop",
+    9: "pause"
     }
 
-    __orientations__ = ['N', 'E', 'S', 'W']
-
     # Static map from joystick axis information to direction delta
     __delta__ = {
     1: {
@@ -85,6 +81,11 @@ class TetrisGamePlugin(GamePlugin):
     }
     }
 
+    # Only the buttons in __buttons__ do anything while the game is running,
+    #  and 0 starts a new game when it is paused
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYAXISMOTION]
+    EVENT_BUTTONS = [0, 1, 2, 3, 9]
+
     # Static map from joypad to player name
     __player__ = {
     0: "player1",
@@ -129,8 +130,8 @@ class TetrisGamePlugin(GamePlugin):
             floor_size_y = self.floor_size[1]
         #self.ddrpi_surface = image_surface
         (self.game_width, self.game_height, self.display_multiply_factor) = self._get_game_dimensions()
-        y_offset = (floor_size_y - self.game_height) / 2
-        p1_x_offset = (floor_size_x - self.game_width * 2) / 3
+        y_offset = (floor_size_y - self.game_height) // 2
+        p1_x_offset = (floor_size_x - self.game_width * 2) // 3
         p2_x_offset = (floor_size_x - self.game_width - p1_x_offset)
         self.p1_display_offset = (p1_x_offset, y_offset)
         self.p2_display_offset = (p2_x_offset, y_offset)
@@ -141,10 +142,7 @@ class TetrisGamePlugin(GamePlugin):
         Start writing to the surface
         """
         # Setup recurring events
-        p1_speed = self.game_state['player1']['drop_timer']
-        pygame.time.set_timer(USEREVENT + 0, p1_speed)
-        p2_speed = self.game_state['player2']['drop_timer']
-        pygame.time.set_timer(USEREVENT + 1, p2_speed)
+        self._start_drop_timers()
         self.__state__ = "RUNNING"
 
     def stop(self):
@@ -152,12 +150,7 @@ class TetrisGamePlugin(GamePlugin):
         Stop writing to the surface and clean up
         """
         # Stop recurring events
-        pygame.time.set_timer(USEREVENT + 0, 0)
-        pygame.time.set_timer(USEREVENT + 1, 0)
-        pygame.time.set_timer(USEREVENT + 2, 0)
-        pygame.time.set_timer(USEREVENT + 3, 0)
-        pygame.time.set_timer(USEREVENT + 4, 0)
-        pygame.time.set_timer(USEREVENT + 5, 0)
+        self.cancel_timers()
         self.__state__ = "STOPPED"
 
     def pause(self):
@@ -166,12 +159,7 @@ class TetrisGamePlugin(GamePlugin):
         """
         # Stop recurring events
         if not self.__state__ == "STOPPED":
-            pygame.time.set_timer(USEREVENT + 0, 0)
-            pygame.time.set_timer(USEREVENT + 1, 0)
-            pygame.time.set_timer(USEREVENT + 2, 0)
-            pygame.time.set_timer(USEREVENT + 3, 0)
-            pygame.time.set_timer(USEREVENT + 4, 0)
-            pygame.time.set_timer(USEREVENT + 5, 0)
+            self.cancel_timers()
             self.__state__ = "PAUSED"
             logging.debug("TetrisGamePlugin: Paused")
 
@@ -183,61 +171,45 @@ class TetrisGamePlugin(GamePlugin):
             self._draw_state()
         else:
             # Just restart recurring events
-            p1_speed = self.game_state['player1']['drop_timer']
-            pygame.time.set_timer(USEREVENT + 0, p1_speed)
-            p2_speed = self.game_state['player2']['drop_timer']
-            pygame.time.set_timer(USEREVENT + 1, p2_speed)
+            self._start_drop_timers()
             self.__state__ = "RUNNING"
 
+    def _start_drop_timers(self):
+        """
+        Start the recurring events that move each player's piece down
+        """
+        for player in TetrisGamePlugin.__player__.values():
+            self.set_timer("%s_drop" % player, self.game_state[player]['drop_timer'],
+                           lambda player=player: self._drop_step(player))
+
     def handle_event(self, event):
         """
         Handle the pygame event sent to the plugin from the main loop
         """
         if self.__state__ == "RUNNING":
-            # Button mappings
-            buttons = {
-            1: lambda p: self._rotate(p, 1),
-            2: lambda p: self._rotate(p, -1),
-            3: lambda p: self._drop(p),
-            9: lambda p: self.pause()
-            }
-            repeats = {
-            "player1": {
-            "axis": 2,
-            "button": 3
-            },
-            "player2": {
-            "axis": 4,
-            "button": 5
-            }
-            }
             # Update the boards according to the event
-            if pygame.event.event_name(event.type) == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # Handle the button
                 joypad = event.joy
                 button = event.button
-                if button in buttons:
+                if button in TetrisGamePlugin.__buttons__:
                     # Set repeating event
                     repeat_speed = self.game_state['initial_repeat_delay']
                     player = TetrisGamePlugin.__player__[joypad]
-                    user_event_diff = repeats[player]["button"]
                     self.game_state[player]["repeat_button"] = button
-                    pygame.time.set_timer(USEREVENT + user_event_diff, repeat_speed)
-                    landed = buttons[button](player)
-                    if landed:
-                        self._landed(player)
+                    self.set_timer("%s_button" % player, repeat_speed, lambda: self._repeat_button(player))
+                    self._press_button(player, button)
                 else:
                     logging.debug("Tetris Plugin: Button %s does nothing" % button)
-            elif pygame.event.event_name(event.type) == "JoyButtonUp":
+            elif event.type == pygame.JOYBUTTONUP:
                 # Handle the button release
                 joypad = event.joy
                 player = TetrisGamePlugin.__player__[joypad]
                 button = event.button
-                if button in buttons:
+                if button in TetrisGamePlugin.__buttons__:
                     if button == self.game_state[player]["repeat_button"]:
-                        user_event_diff = repeats[player]["button"]
-                        pygame.time.set_timer(USEREVENT + user_event_diff, 0)
-            elif pygame.event.event_name(event.type) == "JoyAxisMotion":
+                        self.cancel_timer("%s_button" % player)
+            elif event.type == pygame.JOYAXISMOTION:
                 # Handle the move
                 joypad = event.joy
                 player = TetrisGamePlugin.__player__[joypad]
@@ -246,10 +218,9 @@ class TetrisGamePlugin(GamePlugin):
                     delta = delta_axis.get(int(event.value), None)
                     if delta is not None:
                         repeat_speed = self.game_state['initial_repeat_delay']
-                        user_event_diff = repeats[player]["axis"]
                         self.game_state[player]["repeat_axis"] = event.axis
                         self.game_state[player]["repeat_delta"] = delta
-                        pygame.time.set_timer(USEREVENT + user_event_diff, repeat_speed)
+                        self.set_timer("%s_axis" % player, repeat_speed, lambda: self._repeat_axis(player))
                         landed = self._move(player, delta)
                         if landed:
                             self._landed(player)
@@ -257,53 +228,11 @@ class TetrisGamePlugin(GamePlugin):
                         self.logger.info("player state: %s" % self.game_state[player])
                         if "repeat_axis" in self.game_state[player]:
                             if event.axis == self.game_state[player]["repeat_axis"]:
-                                user_event_diff = repeats[player]["axis"]
-                                pygame.time.set_timer(USEREVENT + user_event_diff, 0)
-            elif pygame.event.event_name(event.type) == "UserEvent":
-                event_number = event.type - 24
-                if event_number < 2:  # Events 0 and 1 are the down moves for players
-                    player = TetrisGamePlugin.__player__[event_number]
-                    landed = self._move(player, (0, 1))
-                    if landed:
-                        self._landed(player)
-                elif event_number == 2:  # USEREVENT+2 = p1-axis-repeat
-                    logging.debug("TetrisGamePlugin: Handling repeating event number: %s" % event_number)
-                    speed = self.game_state['button_repeat_speed']
-                    pygame.time.set_timer(USEREVENT + 2, speed)
-                    delta = self.game_state["player1"]["repeat_delta"]
-                    landed = self._move("player1", delta)
-                    if landed:
-                        self._landed("player1")
-                elif event_number == 3:  # USEREVENT+3 = p1-button-repeat
-                    logging.debug("TetrisGamePlugin: Handling repeating event number: %s" % event_number)
-                    speed = self.game_state['button_repeat_speed']
-                    pygame.time.set_timer(USEREVENT + 3, speed)
-                    button = self.game_state["player1"]["repeat_button"]
-                    landed = buttons[button]("player1")
-                    if landed:
-                        self._landed("player1")
-                elif event_number == 4:  # USEREVENT+4 = p2-axis-repeat
-                    logging.debug("TetrisGamePlugin: Handling repeating event number: %s" % event_number)
-                    speed = self.game_state['button_repeat_speed']
-                    pygame.time.set_timer(USEREVENT + 4, speed)
-                    delta = self.game_state["player2"]["repeat_delta"]
-                    landed = self._move("player2", delta)
-                    if landed:
-                        self._landed("player2")
-                elif event_number == 5:  # USEREVENT+5 = p2-button-repeat
-                    logging.debug("TetrisGamePlugin: Handling repeating event number: %s" % event_number)
-                    speed = self.game_state['button_repeat_speed']
-                    pygame.time.set_timer(USEREVENT + 5, speed)
-                    button = self.game_state["player2"]["repeat_button"]
-                    landed = buttons[button]("player2")
-                    if landed:
-                        self._landed("player2")
-                else:
-                    logging.debug("TetrisGamePlugin: Tried to handle an unknown USEREVENT")
+                                self.cancel_timer("%s_axis" % player)
             else:
                 logging.debug("TetrisGamePlugin: Tried to handle an unknown event type")
         elif self.__state__ == "STOPPED":
-            if pygame.event.event_name(event.type) == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # Handle the start button
                 joypad = event.joy
                 button = event.button
@@ -311,7 +240,7 @@ class TetrisGamePlugin(GamePlugin):
                     self._reset()
                     self.start()
         elif self.__state__ == "PAUSED":
-            if pygame.event.event_name(event.type) == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # Handle the start button
                 joypad = event.joy
                 button = event.button
@@ -323,6 +252,50 @@ class TetrisGamePlugin(GamePlugin):
         else:
             logging.debug("TetrisGamePlugin: Need to handle state: " % self.__state__)
 
+    def _press_button(self, player, button):
+        """
+        Carry out the action for a button pressed by the given player
+        """
+        action = TetrisGamePlugin.__buttons__[button]
+        if action == "rotate_clockwise":
+            landed = self._rotate(player, 1)
+        elif action == "rotate_anticlockwise":
+            landed = self._rotate(player, -1)
+        elif action == "drop":
+            landed = self._drop(player)
+        else:
+            self.pause()
+            landed = False
+        if landed:
+            self._landed(player)
+
+    def _drop_step(self, player):
+        """
+        Recurring event to move the given player's piece down
+        """
+        landed = self._move(player, (0, 1))
+        if landed:
+            self._landed(player)
+
+    def _repeat_axis(self, player):
+        """
+        Recurring event to repeat a move while the stick is held over
+        """
+        logging.debug("TetrisGamePlugin: Repeating axis move for %s" % player)
+        self.change_timer("%s_axis" % player, self.game_state['button_repeat_speed'])
+        delta = self.game_state[player]["repeat_delta"]
+        landed = self._move(player, delta)
+        if landed:
+            self._landed(player)
+
+    def _repeat_button(self, player):
+        """
+        Recurring event to repeat a button action while it is held down
+        """
+        logging.debug("TetrisGamePlugin: Repeating button for %s" % player)
+        self.change_timer("%s_button" % player, self.game_state['button_repeat_speed'])
+        self._press_button(player, self.game_state[player]["repeat_button"])
+
     def _landed(self, player):
         """
         Game state updated required when a piece lands
@@ -344,26 +317,18 @@ class TetrisGamePlugin(GamePlugin):
         """
         total_rows_removed = self.game_state[player]['rows_removed']
         current_drop_timer = self.game_state[player]['drop_timer']
-        new_drop_timer = 1000 - ((total_rows_removed / 10) * 50)
+        new_drop_timer = 1000 - ((total_rows_removed // 10) * 50)
         if new_drop_timer < 200:
             new_drop_timer = 200
         if not current_drop_timer == new_drop_timer:
             self.game_state[player]['drop_timer'] = new_drop_timer
-            if player == "player1":
-                pygame.time.set_timer(USEREVENT, new_drop_timer)
-            else:
-                pygame.time.set_timer(USEREVENT + 1, new_drop_timer)
+            self.change_timer("%s_drop" % player, new_drop_timer)
 
     def _has_game_ended(self, player):
         """
         Test if the last piece that landed resulted in the end of the game
         """
-        blocks = self.game_state[player]['blocks']
-        for ((x, y), c) in blocks:
-            if y < 1:
-                return True
-
-        return False
+        return self.game_state[player]['board'].top_row() < 1
 
     def draw_frame(self, canvas):
         """
@@ -376,8 +341,7 @@ class TetrisGamePlugin(GamePlugin):
         # Wait (maybe paused)
         self.game_state = {
         'player1': {
-        'blocks': [],  # Triples of position and colour
-        'current_tetromino': None,
+        'board': TetrisBoard(self.game_width, self.game_height),
         'current_tetromino_shape': None,
         'current_tetromino_pos': None,
         'current_orientation': None,
@@ -389,8 +353,7 @@ class TetrisGamePlugin(GamePlugin):
         'repeat_button': None
         },
         'player2': {
-        'blocks': [],
-        'current_tetromino': None,
+        'board': TetrisBoard(self.game_width, self.game_height),
         'current_tetromino_shape': None,
         'current_tetromino_pos': None,
         'current_orientation': None,
@@ -414,23 +377,18 @@ class TetrisGamePlugin(GamePlugin):
         future_tetrominos = self.game_state[player]['future_tetrominos']
 
         if future_tetrominos == []:
-            rn = random.randint(0, 6)
-            rt = TetrisGamePlugin.__tetrominos__.keys()[rn]
-            t = TetrisGamePlugin.__tetrominos__[rt]
+            rt = random.choice(TetrisGamePlugin.__shapes__)
 
-            self.game_state[player]['current_tetromino'] = t
             self.game_state[player]['current_tetromino_shape'] = rt
-            self.game_state[player]['current_tetromino_pos'] = (self.game_width / 2, -2)
+            self.game_state[player]['current_tetromino_pos'] = (self.game_width // 2, -2)
             self.game_state[player]['current_orientation'] = 0
 
-            players = TetrisGamePlugin.__player__.values()
-            [op] = filter(lambda x: not x == player, players)
-            self.game_state[op]['future_tetrominos'].insert(0, (t, rt))
+            op = self._other_player(player)
+            self.game_state[op]['future_tetrominos'].insert(0, rt)
         else:
-            (t, rt) = self.game_state[player]['future_tetrominos'].pop()
-            self.game_state[player]['current_tetromino'] = t
+            rt = self.game_state[player]['future_tetrominos'].pop()
             self.game_state[player]['current_tetromino_shape'] = rt
-            self.game_state[player]['current_tetromino_pos'] = (self.game_width / 2, -2)
+            self.game_state[player]['current_tetromino_pos'] = (self.game_width // 2, -2)
             self.game_state[player]['current_orientation'] = 0
 
     def _drop(self, player):
@@ -475,21 +433,17 @@ class TetrisGamePlugin(GamePlugin):
 
         returns True if the block has landed
         """
-        (tx, ty) = new_position
         orient = TetrisGamePlugin.__orientations__[self.game_state[player]['current_orientation']]
-        block_positions = self.game_state[player]['current_tetromino'](orient, tx, ty)
-        current_blocks = self.game_state[player]['blocks']
-
-        # Test whether is hits an already fixed block
-        for bp in block_positions:
-            for ((x, y), c) in current_blocks:
-                if bp == (x, y):
-                    return True
+        block_positions = self._get_tetromino_blocks(player, orient, new_position)
+        board = self.game_state[player]['board']
 
-        # Test whether we've hit the bottom
         for (x, y) in block_positions:
+            # Test whether we've hit the bottom
             if y == self.game_height:
                 return True
+            # Test whether is hits an already fixed block
+            if board.is_occupied(x, y):
+                return True
 
         return False
 
@@ -498,23 +452,32 @@ class TetrisGamePlugin(GamePlugin):
         Test whether the given (new) position for the given player would
         constitute a valid move.
         """
-        (tx, ty) = pos
-        block_positions = self.game_state[player]['current_tetromino'](orient, tx, ty)
-        current_blocks = self.game_state[player]['blocks']
+        block_positions = self._get_tetromino_blocks(player, orient, pos)
+        board = self.game_state[player]['board']
 
-        # Test whether we have fallen outside of the game space
         for (x, y) in block_positions:
+            # Test whether we have fallen outside of the game space
             if x < 0 or x >= self.game_width or y >= self.game_height:
                 return False
-
-        # Test whether is hits an already fixed block
-        for bp in block_positions:
-            for ((x, y), c) in current_blocks:
-                if bp == (x, y):
-                    return False
+            # Test whether is hits an already fixed block
+            if board.is_occupied(x, y):
+                return False
 
         return True
 
+    def _get_tetromino_blocks(self, player, orient, pos):
+        """
+        The positions of the blocks making up the given player's current
+        tetromino, if it were at the given position and orientation
+        """
+        (tx, ty) = pos
+        shape = self.game_state[player]['current_tetromino_shape']
+        return [(tx + dx, ty + dy) for (dx, dy) in TetrisGamePlugin.__tetrominos__[shape][orient]]
+
+    def _other_player(self, player):
+        [op] = [p for p in TetrisGamePlugin.__player__.values() if not p == player]
+        return op
+
     def _rotate(self, player, dir_value):
         """
         Rotate the shape for the given player
@@ -538,10 +501,10 @@ class TetrisGamePlugin(GamePlugin):
         h = self.floor_size[1]
 
         # We need the game boards to be multiples of 10 wide (and we need 2) so:
-        game_width_factor = w / 20
+        game_width_factor = w // 20
         extra_space = w % 20
         if game_width_factor == 0:
-            max_width = (w - 3) / 2
+            max_width = (w - 3) // 2
             if max_width < 8:
                 logging.error("Not enough width!")
         else:
@@ -551,7 +514,7 @@ class TetrisGamePlugin(GamePlugin):
 
         # We also need sufficient height for a game (usually 20 pixels, but we'll
         # accept as low as 16 for a faster paced game
-        game_height_factor = h / 20
+        game_height_factor = h // 20
         if game_height_factor == 0:
             max_height = h - 2
             if max_height < 16:
@@ -559,6 +522,10 @@ class TetrisGamePlugin(GamePlugin):
         else:
             max_height = 20
 
+        # Never make the boards bigger than the floor itself
+        max_width = max(min(max_width, w // 2), 1)
+        max_height = max(min(max_height, h), 1)
+
         return (max_width, max_height, min(game_width_factor, game_height_factor))
 
     def _remove_rows(self, player):
@@ -567,49 +534,9 @@ class TetrisGamePlugin(GamePlugin):
 
         returns the number of rows removed
         """
-        rows_removed = 0
-        xs = range(0, self.game_width)
-
-        fixed_blocks = self.game_state[player]['blocks']
-        y = self.game_height
-        finished = False
-        while not finished:
-            fixed_block_positions = map(lambda (p, c): p, fixed_blocks)
-            line_full = True
-            for x in xs:
-                if not (x, y) in fixed_block_positions:
-                    line_full = False
-
-            # If the line is full, remove those blocks, move all those above down
-            # and leave the index of the line we're checking the same (a full row
-            # may have just moved down)
-            if line_full:
-                logging.debug("TetrisGamePlugin: Row %s is full; removing" % y)
-                rows_removed += 1
-
-                blocks_to_remove = []
-                for ((bx, by), bc) in fixed_blocks:
-                    if by == y:
-                        blocks_to_remove.append(((bx, by), bc))
-                for b in blocks_to_remove:
-                    fixed_blocks.remove(b)
-
-                new_fixed_blocks = []
-                blocks_to_remove = []
-                for ((bx, by), bc) in fixed_blocks:
-                    if by < y:
-                        blocks_to_remove.append(((bx, by), bc))
-                        new_fixed_blocks.append(((bx, by + 1), bc))
-                for b in blocks_to_remove:
-                    fixed_blocks.remove(b)
-                fixed_blocks += new_fixed_blocks
-            else:
-                y -= 1
-
-            if y == 0:
-                finished = True
-
-        self.game_state[player]['blocks'] = fixed_blocks
+        rows_removed = self.game_state[player]['board'].remove_full_rows()
+        if rows_removed > 0:
+            logging.debug("TetrisGamePlugin: Removed %d full rows" % rows_removed)
         self.game_state[player]['rows_removed'] += rows_removed
 
         # Add rows removed to the other player (4=4, otherwise n-1)
@@ -630,38 +557,30 @@ class TetrisGamePlugin(GamePlugin):
         Add the given player's current piece to their list of fixed blocks
         """
         o = TetrisGamePlugin.__orientations__[self.game_state[player]['current_orientation']]
-        (x, y) = self.game_state[player]['current_tetromino_pos']
+        pos = self.game_state[player]['current_tetromino_pos']
         shape = self.game_state[player]['current_tetromino_shape']
         c = TetrisGamePlugin.__block_colours__[shape]
-        positions_to_add = self.game_state[player]['current_tetromino'](o, x, y)
-        coloured_blocks_to_add = map((lambda p: (p, c)), positions_to_add)
-        self.game_state[player]['blocks'] += coloured_blocks_to_add
+        positions_to_add = self._get_tetromino_blocks(player, o, pos)
+        self.game_state[player]['board'].add_blocks(positions_to_add, c)
 
     def _add_penalty_rows(self, player):
         """
         Add the given number of punishment rows to the given player
         """
         # Get the number of penalty rows from the other player
-        players = TetrisGamePlugin.__player__.values()
-        [op] = filter(lambda x: not x == player, players)
+        op = self._other_player(player)
         rows_to_add = self.game_state[op]['penalty_rows_created']
         self.game_state[op]['penalty_rows_created'] = 0
 
         # Get a random hole position and the y position for the rows to be added
         hole_pos = random.randint(0, self.game_width - 1)
-        row_y = min([y for ((x, y), c) in self.game_state[player]['blocks']])
+        board = self.game_state[player]['board']
+        row_y = board.top_row()
 
-        # Create the positions to be added
-        new_positions = []
-        colours = TetrisGamePlugin.__block_colours__
-        col = colours[colours.keys()[random.randint(0, len(colours) - 1)]]
+        # Add the new rows on top of the player's existing blocks
+        col = random.choice(list(TetrisGamePlugin.__block_colours__.values()))
         for y in range(row_y - rows_to_add, row_y):
-            for x in range(0, self.game_width):
-                if not x == hole_pos:
-                    new_positions.append(((x, y), col))
-
-        # Add the new positions to the player's game state
-        self.game_state[player]['blocks'] += new_positions
+            board.add_row(y, col, hole_pos)
 
     def _draw_state(self, canvas):
         """
@@ -679,33 +598,28 @@ class TetrisGamePlugin(GamePlugin):
         p2br = (p2xtl + self.game_width - 1, p2ytl + self.game_height - 1)
         canvas.draw_box(p2tl, p2br, (0, 0, 0))
 
-        # Draw the fixed blocks
-        p1_blocks = self.game_state['player1']['blocks']
-        p1_blocks = map(lambda ((x, y), c): ((x + p1xtl, y + p1ytl), c), p1_blocks)
-        p2_blocks = self.game_state['player2']['blocks']
-        p2_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_blocks)
-
-        # Draw the current tetrominos
-        (p1_x, p1_y) = self.game_state['player1']['current_tetromino_pos']
-        p1_o = TetrisGamePlugin.__orientations__[self.game_state['player1']['current_orientation']]
-        (p2_x, p2_y) = self.game_state['player2']['current_tetromino_pos']
-        p2_o = TetrisGamePlugin.__orientations__[self.game_state['player2']['current_orientation']]
-
-        p1_shape = self.game_state['player1']['current_tetromino'](p1_o, p1_x, p1_y)
-        p1_shape_name = self.game_state['player1']['current_tetromino_shape']
-        p1_shape_blocks = map(lambda x: (x, TetrisGamePlugin.__block_colours__[p1_shape_name]), p1_shape)
-        p1_shape_blocks = map(lambda ((x, y), c): ((x + p1xtl, y + p1ytl), c), p1_shape_blocks)
-        p2_shape = self.game_state['player2']['current_tetromino'](p2_o, p2_x, p2_y)
-        p2_shape_name = self.game_state['player2']['current_tetromino_shape']
-        p2_shape_blocks = map(lambda x: (x, TetrisGamePlugin.__block_colours__[p2_shape_name]), p2_shape)
-        p2_shape_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_shape_blocks)
-
-        for ((bx, by), c) in p1_blocks + p1_shape_blocks + p2_blocks + p2_shape_blocks:
-            if by >= p1ytl:
-                canvas.set_pixel(bx, by, c)
+        # Draw the fixed blocks and the current tetrominos
+        for (player, offset) in [('player1', self.p1_display_offset), ('player2', self.p2_display_offset)]:
+            state = self.game_state[player]
+            o = TetrisGamePlugin.__orientations__[state['current_orientation']]
+            tetromino = self._get_tetromino_blocks(player, o, state['current_tetromino_pos'])
+            colour = TetrisGamePlugin.__block_colours__[state['current_tetromino_shape']]
+            self._blit_board(canvas, state['board'], offset, tetromino, colour)
 
         return canvas
 
+    def _blit_board(self, canvas, board, offset, blocks=[], colour=None):
+        """
+        Copy the player's board, with the given extra blocks on top of it, onto
+        the canvas with its top left corner at offset
+        """
+        pixels = board.get_visible_blocks()
+        for (x, y) in blocks:
+            if 0 <= y < self.game_height:
+                pixels[y, x] = TetrisBoard.pack_colour(colour)
+        (x_offset, y_offset) = offset
+        canvas.set_packed_array(pixels.T, x_offset, y_offset)
+
     def draw_splash(self, canvas):
         """
         Construct a splash screen suitable to display for a plugin selection menu
@@ -719,15 +633,12 @@ class TetrisGamePlugin(GamePlugin):
         p2br = (p2xtl + self.game_width - 1, p2ytl + self.game_height - 1)
         canvas.draw_box(p2tl, p2br, (0, 0, 0))
 
-        p1_shape = TetrisGamePlugin.__tetrominos__['L']('N', 3, 4)
-        p1_blocks = map(lambda x: (x, (255, 255, 255)), p1_shape)
-        p1_blocks = map(lambda ((x, y), c): ((x + p1xtl, y + p1ytl), c), p1_blocks)
-        p2_shape = TetrisGamePlugin.__tetrominos__['I']('W', 2, 8)
-        p2_blocks = map(lambda x: (x, (0, 255, 0)), p2_shape)
-        p2_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_blocks)
-
-        for ((bx, by), c) in p1_blocks + p2_blocks:
-            canvas.set_pixel(bx, by, c)
+        p1_shape = TetrisGamePlugin.__tetrominos__['L']['N']
+        p2_shape = TetrisGamePlugin.__tetrominos__['I']['W']
+        for (dx, dy) in p1_shape:
+            canvas.set_pixel(p1xtl + 3 + dx, p1ytl + 4 + dy, (255, 255, 255))
+        for (dx, dy) in p2_shape:
+            canvas.set_pixel(p2xtl + 2 + dx, p2ytl + 8 + dy, (0, 255, 0))
 
         return canvas
 
@@ -735,14 +646,86 @@ class TetrisGamePlugin(GamePlugin):
         """
         Add red over the losing player's pieces
         """
-        blocks = self.game_state[player]['blocks']
-        block_positions = map(lambda ((bx, by), bc): (bx, by), blocks)
-        new_blocks = map(lambda ((bx, by), bc): ((bx, by), [(cc - 192) if not (cc - 192) < 0 else 0 for cc in bc]),
-                         blocks)
-        new_blocks = map(lambda ((bx, by), (r, g, b)): ((bx, by), ((r + 192) if not (r + 192) > 255 else 255, g, b)),
-                         new_blocks)
-        for y in range(0, self.game_height):
-            for x in range(0, self.game_width):
-                if not (x, y) in block_positions:
-                    new_blocks.append(((x, y), self.__other_colours__["fill_dead"]))
-        self.game_state[player]['blocks'] = new_blocks
+        self.game_state[player]['board'].show_lost(self.__other_colours__["fill_dead"])
+
+
+class TetrisBoard(object):
+    """
+    The landed blocks for one player, as a grid of packed 0xRRGGBB colours
+    indexed [y][x] (0 meaning empty) along with a bitmask per row of which
+    cells are filled, so a full row is just one comparison.
+
+    There are a few hidden rows above the top of the board, so that blocks
+    that land before they have completely appeared still have somewhere to go
+    """
+
+    HIDDEN_ROWS = 4
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.colours = numpy.zeros((height + self.HIDDEN_ROWS, width), dtype=numpy.uint32)
+        self.row_masks = [0] * (height + self.HIDDEN_ROWS)
+
+    @staticmethod
+    def pack_colour(colour):
+        (r, g, b) = colour
+        return (int(r) << 16) | (int(g) << 8) | int(b)
+
+    def is_occupied(self, x, y):
+        row = y + self.HIDDEN_ROWS
+        if row < 0 or row >= len(self.row_masks):
+            return False
+        return (self.row_masks[row] >> x) & 1 == 1
+
+    def add_blocks(self, positions, colour):
+        packed = self.pack_colour(colour)
+        for (x, y) in positions:
+            row = y + self.HIDDEN_ROWS
+            if 0 <= row < len(self.row_masks):
+                self.row_masks[row] |= 1 << x
+                self.colours[row, x] = packed
+
+    # Fill the row, apart from the hole
+    def add_row(self, y, colour, hole):
+        row = y + self.HIDDEN_ROWS
+        if 0 <= row < len(self.row_masks):
+            self.row_masks[row] = self.full_row & ~(1 << hole)
+            self.colours[row, :] = self.pack_colour(colour)
+            self.colours[row, hole] = 0
+
+    def remove_full_rows(self):
+        """
+        Remove any full rows, moving everything above them down. Returns the
+        number of rows removed
+        """
+        keep = [row for (row, mask) in enumerate(self.row_masks) if mask != self.full_row]
+        removed = len(self.row_masks) - len(keep)
+        if removed > 0:
+            self.colours[removed:] = self.colours[keep]
+            self.colours[:removed] = 0
+            self.row_masks = [0] * removed + [self.row_masks[row] for row in keep]
+        return removed
+
+    # The y position of the highest row with anything in it, or the height of
+    #  the board if it is empty
+    def top_row(self):
+        for (row, mask) in enumerate(self.row_masks):
+            if mask != 0:
+                return row - self.HIDDEN_ROWS
+        return self.height
+
+    # A copy of the visible part of the board, indexed [y][x]
+    def get_visible_blocks(self):
+        return self.colours[self.HIDDEN_ROWS:].copy()
+
+    # Tint all the landed blocks red, and fill in the gaps
+    def show_lost(self, fill_colour):
+        occupied = self.colours != 0
+        r = numpy.minimum(numpy.maximum(((self.colours >> 16) & 0xFF).astype(int) - 192, 0) + 192, 255)
+        g = numpy.maximum(((self.colours >> 8) & 0xFF).astype(int) - 192, 0)
+        b = numpy.maximum((self.colours & 0xFF).astype(int) - 192, 0)
+        tinted = ((r << 16) | (g << 8) | b).astype(numpy.uint32)
+        self.colours = numpy.where(occupied, tinted, numpy.uint32(self.pack_colour(fill_colour)))
+        self.row_masks = [self.full_row] * len(self.row_masks)
@@ -0,0 +1,127 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+import numpy
+
+
+class Calibration(object):
+    """
+    Colour correction for the floor, worked out once from the config into a
+    lookup table for each module, so that modules from different batches can
+    be made to match. The config looks like
+
+        calibration:
+          brightness: 0.8
+          red: 1.0
+          modules:
+            4:
+              green: {gamma: 1.1, scale: 0.9}
+              blue: [0, 1, 2, ... 255]
+
+    where brightness limits everything (and can be set per module too), and
+    each channel is either a gamma, a dict of gamma and scale, or a list of
+    256 values to use as its table directly. Anything not given for a module
+    comes from the top level, and that defaults to no change at all. The
+    modules apply their own curve to match the LEDs to our eyes on top of
+    this, so this is only for the differences between them.
+
+    get_table() returns the tables as one array table[row][channel][value],
+    and get_pixel_rows() which row each pixel of the canvas uses. Outputs
+    fuse this with any filters that work on each channel separately, so that
+    everything is done with a single lookup.
+    """
+    logger = logging.getLogger(__name__)
+
+    CHANNELS = ["red", "green", "blue"]
+
+    def __init__(self, config, layout):
+        if config is None:
+            config = dict()
+        self.config = config
+
+        self.brightness = self.read_brightness(config, 1.0)
+        defaults = [self.read_channel(config, channel, None) for channel in self.CHANNELS]
+
+        # The first row is for anywhere that isn't covered by a module
+        tables = [self.build_tables(defaults, self.brightness)]
+        self.pixel_rows = numpy.zeros((layout.size_x, layout.size_y), dtype=int)
+
+        module_config = dict()
+        try:
+            module_config = dict(config["modules"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+
+        for (module, positions) in layout.get_module_converters():
+            if module in module_config:
+                settings = module_config[module]
+                brightness = self.read_brightness(settings, self.brightness)
+                curves = [self.read_channel(settings, channel, default)
+                          for (channel, default) in zip(self.CHANNELS, defaults)]
+                tables.append(self.build_tables(curves, brightness))
+                row = len(tables) - 1
+            else:
+                row = 0
+            if len(positions) > 0:
+                self.pixel_rows[positions[:, 0], positions[:, 1]] = row
+
+        self.table = numpy.array(tables, dtype=numpy.uint8)
+        self.logger.info("Calibration has %d tables for %d modules" % (len(tables), len(layout.get_module_converters())))
+
+    def read_brightness(self, config, default):
+        try:
+            return min(max(float(config["brightness"]), 0.0), 1.0)
+        except (AttributeError, ValueError, KeyError, TypeError):
+            return default
+
+    # A channel's curve, as either a (gamma, scale) pair or a table
+    def read_channel(self, config, channel, default):
+        try:
+            setting = config[channel]
+        except (AttributeError, ValueError, KeyError, TypeError):
+            return default
+
+        if isinstance(setting, dict):
+            (gamma, scale) = default if isinstance(default, tuple) else (1.0, 1.0)
+            try:
+                gamma = float(setting["gamma"])
+            except (AttributeError, ValueError, KeyError, TypeError):
+                pass
+            try:
+                scale = float(setting["scale"])
+            except (AttributeError, ValueError, KeyError, TypeError):
+                pass
+            return (gamma, scale)
+
+        if isinstance(setting, list):
+            if len(setting) != 256:
+                self.logger.error("The %s calibration table has %d values rather than 256" % (channel, len(setting)))
+                return default
+            return numpy.array(setting, dtype=numpy.float64)
+
+        try:
+            return (float(setting), 1.0)
+        except (ValueError, TypeError):
+            self.logger.error("The %s calibration '%s' was not recognised" % (channel, setting))
+            return default
+
+    def build_tables(self, curves, brightness):
+        values = numpy.arange(256, dtype=numpy.float64)
+        tables = []
+        for curve in curves:
+            if curve is None:
+                table = values
+            elif isinstance(curve, tuple):
+                (gamma, scale) = curve
+                table = 255.0 * scale * (values / 255.0) ** gamma
+            else:
+                table = curve
+            tables.append(numpy.clip(numpy.round(table * brightness), 0, 255))
+        return tables
+
+    def get_table(self):
+        return self.table
+
+    def get_pixel_rows(self):
+        return self.pixel_rows
@@ -104,14 +104,14 @@ class ControllerInput(object):
     """
 
     def map_key_to_joystick_event(self, key_event):
-        self.logger.info("Mapping key event to joystick event")
 
         event_attr = dict()
 
         event_type = None
 
         if key_event.key in self.mapping:
-            self.logger.info("%s" % self.mapping[key_event.key])
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Mapping key event to joystick event: %s" % self.mapping[key_event.key])
             event_attr["joy"] = self.mapping[key_event.key]["joy"]
             if "button" in self.mapping[key_event.key]:
                 event_attr["button"] = self.mapping[key_event.key]["button"]
@@ -0,0 +1,262 @@
+__authors__ = ['Andrew Taylor']
+
+import json
+import logging
+import threading
+import time
+
+from collections import deque, OrderedDict
+from itertools import count
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+class FrameStats(object):
+    """
+    Times each stage of the main loop. start_frame() is called at the top of
+    the loop, mark() at the end of each stage with its name, and end_frame()
+    at the bottom. The times are kept as moving averages, in ms.
+    """
+
+    # How much each new frame counts towards the averages
+    SMOOTHING = 0.1
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.frame_time = None
+        self.frame_start = None
+        self.last_mark = None
+        self.frames = 0
+
+    def start_frame(self):
+        now = time.time()
+        if self.frame_start is not None:
+            self.frame_time = self.average(self.frame_time, 1000.0 * (now - self.frame_start))
+        self.frame_start = now
+        self.last_mark = now
+
+    def mark(self, stage):
+        now = time.time()
+        self.stages[stage] = self.average(self.stages.get(stage), 1000.0 * (now - self.last_mark))
+        self.last_mark = now
+
+    def end_frame(self):
+        self.frames += 1
+
+    def average(self, average, value):
+        if average is None:
+            return value
+        return average + (value - average) * self.SMOOTHING
+
+    def get_fps(self):
+        if not self.frame_time:
+            return None
+        return 1000.0 / self.frame_time
+
+    def get_stats(self):
+        fps = self.get_fps()
+        return {
+            "frames": self.frames,
+            "fps": round(fps, 2) if fps is not None else None,
+            "stages": OrderedDict((stage, round(value, 3)) for (stage, value) in self.stages.items()),
+        }
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        control = self.server.control
+        path = self.path.split("?")[0].rstrip("/")
+        if path in ["", "/status"]:
+            self.send_json(200, control.get_status())
+        elif path == "/playlists":
+            self.send_json(200, control.get_playlists())
+        else:
+            self.send_json(404, {"error": "Unknown path %s" % path})
+
+    def do_POST(self):
+        control = self.server.control
+        parts = [part for part in self.path.split("?")[0].split("/") if part != ""]
+        try:
+            command = control.queue_command(parts[0], [int(argument) for argument in parts[1:]])
+        except (IndexError, ValueError):
+            self.send_json(400, {"error": "Unknown command %s" % self.path})
+            return None
+        # It is only applied at the start of the next frame, so all we can
+        #  say now is that it has been accepted
+        self.send_json(202, command)
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.control.logger.debug(format % args)
+
+
+class ControlServer(object):
+    """
+    A small HTTP API for seeing what the floor is doing and telling it what
+    to do next, e.g. from a web page:
+
+        GET  /status             the current playlist and plugin, how long it
+                                 has left, the frame rate and stage timings
+        GET  /playlists          every playlist and the plugins in it
+        POST /next               go on to the next plugin in the playlist
+        POST /pause, /resume     stop or start the playlist moving on
+        POST /plugin/<n>         start plugin n of the current playlist
+        POST /playlist/<n>       start playlist n
+
+    Requests are answered on threads of their own, and never touch the
+    plugin model. The status comes from a snapshot that the main loop
+    replaces each frame with update(), and commands are queued up for the
+    main loop to carry out with apply_commands() at the start of a frame.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_PORT = 8080
+
+    COMMANDS = {"next": 0, "pause": 0, "resume": 0, "plugin": 1, "playlist": 1}
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self.address = (host, port)
+        self.server = None
+        self.thread = None
+        # Appending and popping from either end of a deque is thread safe
+        self.commands = deque()
+        self.command_ids = count(1)
+        # Each of these is replaced, rather than changed, by the main loop
+        self.status = {}
+        self.playlists = []
+        self.playlists_key = None
+
+    def start(self):
+        if self.thread is not None:
+            return None
+        self.server = ThreadingHTTPServer(self.address, ControlRequestHandler)
+        self.server.control = self
+        self.logger.info("Control API listening on %s:%d" % self.server.server_address)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return None
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread = None
+        return None
+
+    def get_address(self):
+        if self.server is None:
+            return self.address
+        return self.server.server_address
+
+    # Called on the request threads
+    def get_status(self):
+        return self.status
+
+    def get_playlists(self):
+        return self.playlists
+
+    def queue_command(self, name, arguments):
+        if name not in self.COMMANDS or len(arguments) != self.COMMANDS[name]:
+            raise ValueError(name)
+        command = {"id": next(self.command_ids), "command": name, "arguments": arguments}
+        self.commands.append(command)
+        return command
+
+    # Called on the main loop
+    def apply_commands(self, plugin_model, menu):
+        while True:
+            try:
+                command = self.commands.popleft()
+            except IndexError:
+                break
+            try:
+                self.apply_command(command["command"], command["arguments"], plugin_model, menu)
+            except Exception as e:
+                self.logger.warn("Unable to carry out %s: %s" % (command, e))
+        return None
+
+    def apply_command(self, name, arguments, plugin_model, menu):
+        self.logger.info("Control API command: %s %s" % (name, arguments))
+        # The menu hangs on to the playlist it is showing, so get out of it
+        if menu.is_in_menu():
+            menu.leave_menu()
+
+        if name == "playlist":
+            if not 0 <= arguments[0] < len(plugin_model.get_all_playlists()):
+                raise IndexError("There is no playlist %d" % arguments[0])
+            plugin_model.set_current_playlist_by_index(arguments[0])
+            return None
+
+        playlist = plugin_model.get_current_playlist()
+        if playlist is None:
+            raise ValueError("There is no current playlist")
+        if name == "next":
+            outgoing = None
+            if 0 <= playlist.get_current_plugin_index() < len(playlist):
+                outgoing = playlist.get_plugins()[playlist.get_current_plugin_index()]
+            incoming = playlist.next()
+            if outgoing is not None and incoming is not None:
+                playlist.start_transition(outgoing, incoming)
+        elif name == "pause":
+            playlist.pause()
+        elif name == "resume":
+            playlist.resume()
+        elif name == "plugin":
+            if not 0 <= arguments[0] < len(playlist):
+                raise IndexError("There is no plugin %d" % arguments[0])
+            playlist.set_current_plugin_by_index(arguments[0])
+        return None
+
+    # Take a new snapshot of what is going on, once a frame
+    def update(self, plugin_model, frame_stats, input_server=None):
+        status = {
+            "playlist": plugin_model.get_current_playlist_index(),
+            "plugin": None,
+        }
+        playlist = plugin_model.get_current_playlist()
+        if playlist is not None:
+            status["state"] = playlist.state
+            index = playlist.get_current_plugin_index()
+            if 0 <= index < len(playlist):
+                plugin = playlist.get_plugins()[index]
+                status["plugin"] = {"index": index, "name": plugin.plugin_name}
+                if playlist.auto_advance:
+                    status["plugin"]["remaining_time"] = playlist.get_plugin_remaining_time()
+        status.update(frame_stats.get_stats())
+        if input_server is not None:
+            status["input_latency"] = input_server.get_latency_stats()
+        self.status = status
+
+        # The list of playlists hardly ever changes, so it is only done again
+        #  when it looks like it might have
+        playlists = plugin_model.get_all_playlists()
+        key = [(id(playlist), len(playlist)) for playlist in playlists]
+        if key != self.playlists_key:
+            self.playlists_key = key
+            self.playlists = [{
+                "index": index,
+                "number": playlist.playlist_number,
+                "file": playlist.playlist_file,
+                "plugins": [plugin.plugin_name for plugin in playlist.get_plugins()],
+            } for (index, playlist) in enumerate(playlists)]
+        return None
@@ -0,0 +1,125 @@
+__authors__ = ['Andrew Taylor']
+
+import bisect
+import logging
+
+import pygame
+
+
+class EventRouter(object):
+    """
+    Passes each event along a chain of consumers, in the order they were
+    added, but only to those that want it. Each consumer is a function that
+    takes an event and returns it, or a different event, to pass it on, or
+    None if it has been dealt with. Each one says which event types it wants,
+    and for joystick button events which buttons, or None for all of them.
+
+    Which consumers want which events is worked out when the consumers or
+    what they want change, rather than for each event, so an event only
+    costs a dictionary lookup plus a call to each consumer that wants it. If
+    a consumer hands back a different type of event, e.g. a key press mapped
+    to a joystick button, it carries on along the chain as that type.
+    """
+    logger = logging.getLogger(__name__)
+
+    BUTTON_EVENTS = frozenset([pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP])
+
+    def __init__(self):
+        # A list of [name, handler, event types, buttons] in chain order
+        self.consumers = []
+        # For each event type, the positions in the chain of the consumers
+        #  that want it, and what they want
+        self.table = dict()
+        self.catch_all = ([], [])
+
+    # Add a consumer to the end of the chain. A handler of None is skipped
+    def add_consumer(self, name, handler, event_types=None, buttons=None):
+        self.consumers.append([name, handler, self.as_set(event_types), self.as_set(buttons)])
+        self.build_table()
+        return None
+
+    # Change the function a consumer uses, e.g. when a new plugin starts
+    def set_handler(self, name, handler, event_types=None, buttons=None):
+        consumer = self.get_consumer(name)
+        wanted = [handler, self.as_set(event_types), self.as_set(buttons)]
+        if consumer[1:] != wanted:
+            consumer[1:] = wanted
+            self.build_table()
+        return None
+
+    # Change what a consumer wants, which is cheap if it wants the same
+    def set_filter(self, name, event_types=None, buttons=None):
+        consumer = self.get_consumer(name)
+        event_types = self.as_set(event_types)
+        buttons = self.as_set(buttons)
+        if consumer[2] != event_types or consumer[3] != buttons:
+            consumer[2] = event_types
+            consumer[3] = buttons
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Events for %s: %s, buttons %s" % (name, event_types, buttons))
+            self.build_table()
+        return None
+
+    def get_consumer(self, name):
+        for consumer in self.consumers:
+            if consumer[0] == name:
+                return consumer
+        raise KeyError(name)
+
+    def as_set(self, values):
+        if values is None:
+            return None
+        return frozenset(values)
+
+    def build_table(self):
+        # Button events always get entries of their own, so that a consumer
+        #  that wants every type still only gets the buttons it asked for
+        event_types = set(self.BUTTON_EVENTS)
+        for (name, handler, types, buttons) in self.consumers:
+            if types is not None:
+                event_types.update(types)
+
+        # Consumers that want every type go in every entry, as well as the
+        #  catch all for the types that nobody has asked for by name, which
+        #  is never a button event
+        self.table = dict()
+        for event_type in event_types:
+            self.table[event_type] = self.get_entry(event_type)
+        self.catch_all = self.get_entry(None)
+        return None
+
+    def get_entry(self, event_type):
+        positions = []
+        entries = []
+        for (position, (name, handler, types, buttons)) in enumerate(self.consumers):
+            if handler is None:
+                continue
+            if types is None or event_type in types:
+                if event_type not in self.BUTTON_EVENTS:
+                    buttons = None
+                positions.append(position)
+                entries.append((handler, buttons))
+        return (positions, entries)
+
+    # Pass an event along the chain, returning what comes out of the end, or
+    #  None if something dealt with it
+    def dispatch(self, event):
+        (positions, entries) = self.table.get(event.type, self.catch_all)
+        index = 0
+        while index < len(entries):
+            (handler, buttons) = entries[index]
+            if buttons is not None and event.button not in buttons:
+                index += 1
+                continue
+            event_type = event.type
+            event = handler(event)
+            if event is None:
+                return None
+            if event.type != event_type:
+                # Carry on from the next consumer along that wants this type
+                position = positions[index]
+                (positions, entries) = self.table.get(event.type, self.catch_all)
+                index = bisect.bisect_right(positions, position)
+            else:
+                index += 1
+        return event
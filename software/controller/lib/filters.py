@@ -1,5 +1,7 @@
 __author__ = 'Andrew Taylor'
 
+import numpy
+
 class Filter(object):
 
     def __init__(self, config=None):
@@ -12,6 +14,22 @@ class Filter(object):
     def modify(self, rgb):
         return rgb
 
+    """
+    Modify a whole array of RGB values at once. Filters should override this
+    to do it faster, otherwise modify() is called for each one
+    """
+    def modify_array(self, rgb):
+        return numpy.array([self.modify(int(value)) for value in rgb], dtype=rgb.dtype)
+
+    """
+    Filters that change each of red, green and blue on their own, without
+    looking at the others, can return a table[channel][value] of what each
+    value becomes, so that outputs can fold them into a single lookup.
+    Returns None if the filter can't be described this way
+    """
+    def get_channel_table(self):
+        return None
+
 class ClearFilter(Filter):
 
     """
@@ -20,6 +38,12 @@ class ClearFilter(Filter):
     def modify(self, rgb):
         return rgb
 
+    def modify_array(self, rgb):
+        return rgb
+
+    def get_channel_table(self):
+        return numpy.array([numpy.arange(256)] * 3)
+
 class NegativeFilter(Filter):
 
     """
@@ -28,10 +52,23 @@ class NegativeFilter(Filter):
     def modify(self, rgb):
         return rgb ^ 0xFFFFFF
 
+    def modify_array(self, rgb):
+        return rgb ^ 0xFFFFFF
+
+    def get_channel_table(self):
+        return numpy.array([255 - numpy.arange(256)] * 3)
+
 class NeutralDensityFilter(Filter):
 
     def __init__(self, config=None):
-        self.factor = 1
+        super(NeutralDensityFilter, self).__init__(config)
+        self.factor = 1.0
+        try:
+            self.factor = float(config["factor"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        if self.factor < 1.0:
+            self.factor = 1.0
 
     """
     Reduce the intensity of the value by the prescribed factor
@@ -42,10 +79,13 @@ class NeutralDensityFilter(Filter):
         blue = rgb & 0xFF
 
         # scale the values
-        red = red / self.factor
-        green = green / self.factor
-        blue = blue / self.factor
+        red = int(red / self.factor)
+        green = int(green / self.factor)
+        blue = int(blue / self.factor)
 
         # Reconstruct and return the RGB value
         rgb = ((red & 0xFF) << 16) + ((green & 0xFF) << 8) + (blue & 0xFF)
-        return rgb
\ No newline at end of file
+        return rgb
+
+    def get_channel_table(self):
+        return numpy.array([(numpy.arange(256) / self.factor).astype(int)] * 3)
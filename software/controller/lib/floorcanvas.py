@@ -6,6 +6,8 @@ import logging
 import math
 import colorsys
 
+import numpy
+
 
 class FloorCanvas(object):
     logger = logging.getLogger(__name__)
@@ -34,8 +36,17 @@ class FloorCanvas(object):
         if (height > 0):
             self.height = height
         self.logger.info("Creating a canvas with width=%d, height=%d" % (width, height))
-        # Create the two dimensional array for the canvas object
-        self.data = [[self.BLACK for y in range(height)] for x in range(width)]
+        # Create the two dimensional array for the canvas object. Each
+        #  element is a packed 0xRRGGBB value, and it is indexed data[x][y]
+        #  (or data[x, y]) just like the old list of lists was
+        self.data = numpy.zeros((self.width, self.height), dtype=numpy.uint32)
+        # Offscreen layers that get composited on top of this canvas, in
+        #  order, when flatten_layers() is called at the end of each frame
+        self.layers = []
+        # The frame as it was when commit_changes() was last called, and a
+        #  mask of which pixels were different from the one before it
+        self.previous_data = None
+        self.changes = None
 
     # Return an array data[x][y] of the canvas. This may or may not be
     #  the same as the internal representation, so don't get it directly,
@@ -43,6 +54,122 @@ class FloorCanvas(object):
     def get_canvas_array(self):
         return self.data
 
+    # Copy a block of (R,G,B) values into the canvas in one go.
+    # 'rgb' is an array of shape (width, height, 3), indexed [x][y] like the
+    #  canvas itself, and is clipped to the canvas if it hangs off the edge
+    def set_rgb_array(self, rgb, x=0, y=0):
+        rgb = numpy.asarray(rgb)
+        clipped = self.clip_block(rgb.shape[0], rgb.shape[1], x, y)
+        if clipped is None:
+            return None
+        (canvas_slice, block_slice) = clipped
+        block = rgb[block_slice].astype(numpy.uint32)
+        self.data[canvas_slice] = (block[:, :, 0] << 16) | (block[:, :, 1] << 8) | block[:, :, 2]
+        return None
+
+    # The same as set_rgb_array(), but for an array of shape (width, height)
+    #  of colours that are already packed as 0xRRGGBB ints
+    def set_packed_array(self, packed, x=0, y=0):
+        packed = numpy.asarray(packed)
+        clipped = self.clip_block(packed.shape[0], packed.shape[1], x, y)
+        if clipped is None:
+            return None
+        (canvas_slice, block_slice) = clipped
+        self.data[canvas_slice] = packed[block_slice]
+        return None
+
+    # Work out which part of a block of the given size, placed with its top
+    #  left corner at (x,y), lands on the canvas. Returns a pair of slices,
+    #  for the canvas and for the block, or None if none of it does
+    def clip_block(self, width, height, x, y):
+        x = int(x)
+        y = int(y)
+        x_start = max(x, 0)
+        y_start = max(y, 0)
+        x_end = min(x + width, self.width)
+        y_end = min(y + height, self.height)
+        if x_end <= x_start or y_end <= y_start:
+            return None
+        return ((slice(x_start, x_end), slice(y_start, y_end)),
+                (slice(x_start - x, x_end - x), slice(y_start - y, y_end - y)))
+
+    # Return the canvas as an array of shape (width, height, 3) of (R,G,B) values
+    def get_rgb_array(self):
+        rgb = numpy.empty((self.width, self.height, 3), dtype=numpy.uint8)
+        rgb[:, :, 0] = (self.data >> 16) & 0xFF
+        rgb[:, :, 1] = (self.data >> 8) & 0xFF
+        rgb[:, :, 2] = self.data & 0xFF
+        return rgb
+
+    # Layer methods:
+    # Return the named layer, creating it on top of any existing ones if it
+    #  doesn't exist yet. Layers keep their contents from one frame to the
+    #  next, so they can be used for trails, and are composited onto this
+    #  canvas with the given blend mode and opacity by flatten_layers()
+    def get_layer(self, name, blend="over", opacity=1.0):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        layer = CanvasLayer(name, self.width, self.height, blend, opacity)
+        self.layers.append(layer)
+        return layer
+
+    def remove_layer(self, name):
+        self.layers = [layer for layer in self.layers if layer.name != name]
+
+    def clear_layers(self):
+        self.layers = []
+
+    # Composite all of the layers onto this canvas, bottom one first
+    def flatten_layers(self):
+        if len(self.layers) == 0:
+            return self
+        base = self.get_rgb_array().astype(numpy.float32)
+        for layer in self.layers:
+            base = layer.composite(base)
+        self.set_rgb_array(numpy.clip(base, 0, 255).astype(numpy.uint8))
+        return self
+
+    # Change tracking methods:
+    # Mark the end of a frame, working out which pixels have changed since
+    #  the end of the last one. Outputs can then use get_changes() or
+    #  get_changed_box() to only redraw or resend what is different. Returns
+    #  True if anything has changed
+    def commit_changes(self):
+        if self.previous_data is None or self.previous_data.shape != self.data.shape:
+            self.changes = numpy.ones(self.data.shape, dtype=bool)
+            self.previous_data = self.data.copy()
+        else:
+            self.changes = self.data != self.previous_data
+            self.previous_data[self.changes] = self.data[self.changes]
+        return self.is_changed()
+
+    # Forget the last frame, so that every pixel counts as changed in the
+    #  next one, e.g. when the outputs were last sent a different canvas
+    def forget_changes(self):
+        self.previous_data = None
+        self.changes = None
+        return self
+
+    # A (width, height) array of bools, True for each pixel that changed in
+    #  the last frame, or None if changes aren't being tracked
+    def get_changes(self):
+        return self.changes
+
+    def is_changed(self):
+        return self.changes is None or bool(self.changes.any())
+
+    # The smallest box ((x1, y1), (x2, y2)) that holds every pixel that
+    #  changed in the last frame, inclusive, or None if nothing did
+    def get_changed_box(self):
+        if self.changes is None:
+            return ((0, 0), (self.width - 1, self.height - 1))
+        columns = numpy.flatnonzero(self.changes.any(axis=1))
+        rows = numpy.flatnonzero(self.changes.any(axis=0))
+        if len(columns) == 0:
+            return None
+        return ((int(columns[0]), int(rows[0])), (int(columns[-1]), int(rows[-1])))
+
     # See if the given pixel is on the canvas, and not off the side somewhere
     def is_in_range(self, x, y):
         if x < 0 or y < 0:
@@ -67,17 +194,7 @@ class FloorCanvas(object):
     def set_pixel(self, x, y, colour, format="RGB", alpha=1.0):
         x = int(round(x, 0))
         y = int(round(y, 0))
-        if format == "RGB":
-            # If the colour is a tuple and not an int,
-            #  unpack it into an int
-            if type(colour) is tuple:
-                colour = self.pack_colour_tuple(colour)
-        elif format == "HSV":
-            # It should always be a tuple for HSV, I'm not sure
-            #  you can do anything if it isn't
-            if type(colour) is tuple:
-                colour = self.reformat(colorsys.hsv_to_rgb(*colour))
-                colour = self.pack_colour_tuple(colour)
+        colour = self.colour_value(colour, format)
         if self.is_in_range(x, y):
 
             if alpha < 1.0:
@@ -109,7 +226,7 @@ class FloorCanvas(object):
         x = int(round(x, 0))
         y = int(round(y, 0))
         if self.is_in_range(x, y):
-            self.data[x][y] = self.pack_colour_tuple(colour)
+            self.data[x][y] = self.colour_value(colour)
 
     # Set a pixel with a float tuple value
     def set_float_pixel_tuple(self, x, y, colour):
@@ -125,7 +242,7 @@ class FloorCanvas(object):
     # Return the colour as an int (i.e the value of 0xRRGGBB)
     def get_pixel(self, x, y):
         if self.is_in_range(x, y):
-            return self.data[x][y]
+            return int(self.data[x][y])
         return None
 
     # Return the colour as (R,G,B) tuple
@@ -145,14 +262,25 @@ class FloorCanvas(object):
 
     def pack_colour_tuple(self, colour):
         (red, green, blue) = colour
-        # Ensure the values are ints
-        red = int(red)
-        green = int(green)
-        blue = int(blue)
+        # Ensure the values are ints, and keep each one in a byte so that a
+        #  colour that has gone out of range can't spill into the next one
+        red = min(max(int(red), 0), 255)
+        green = min(max(int(green), 0), 255)
+        blue = min(max(int(blue), 0), 255)
 
         value = (red << 16) + (green << 8) + blue
         return value
 
+    # Turn a colour given as either an int or an (R,G,B) tuple into an int.
+    #  An "HSV" colour is an (H,S,V) tuple of floats
+    def colour_value(self, colour, format="RGB"):
+        if type(colour) is tuple:
+            if format == "HSV":
+                colour = self.reformat(colorsys.hsv_to_rgb(*colour))
+            return self.pack_colour_tuple(colour)
+        # The canvas can only hold 0xRRGGBB, so anything negative is black
+        return max(int(colour), 0) & 0xFFFFFF
+
     def draw_box(self, top_left, bottom_right, colour):
         """
         Fill the box from top left to bottom right with the given colour
@@ -160,62 +288,149 @@ class FloorCanvas(object):
         (tlx, tly) = top_left
         (brx, bry) = bottom_right
         if tlx <= brx and tly <= bry:
-            y = tly
-            while y <= bry:
-                x = tlx
-                while x <= brx:
-                    self.set_pixel(x, y, colour)
-                    x += 1
-                y += 1
+            # Clip the box to the canvas and fill it as one slice
+            x_start = max(int(round(tlx, 0)), 0)
+            y_start = max(int(round(tly, 0)), 0)
+            x_end = min(int(round(brx, 0)) + 1, self.width)
+            y_end = min(int(round(bry, 0)) + 1, self.height)
+            if x_start < x_end and y_start < y_end:
+                self.data[x_start:x_end, y_start:y_end] = self.colour_value(colour)
+
+    def draw_span(self, from_x, to_x, y, colour):
+        """
+        Fill the horizontal run of pixels from from_x to to_x (inclusive) on row y
+        """
+        y = int(round(y, 0))
+        if y < 0 or y >= self.height:
+            return None
+        x_start = max(int(round(min(from_x, to_x), 0)), 0)
+        x_end = min(int(round(max(from_x, to_x), 0)) + 1, self.width)
+        if x_start < x_end:
+            self.data[x_start:x_end, y] = self.colour_value(colour)
+
+    # Set each of the pixels at xs[i],ys[i] to the same colour, ignoring
+    #  any that are off the canvas. xs and ys are numpy int arrays
+    def set_pixels(self, xs, ys, colour):
+        on_canvas = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.data[xs[on_canvas], ys[on_canvas]] = self.colour_value(colour)
+
+    # Set each of the pixels at xs[i],ys[i] to the (R,G,B) colour rgb[i],
+    #  ignoring any that are off the canvas
+    def set_rgb_pixels(self, xs, ys, rgb):
+        on_canvas = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        rgb = numpy.asarray(rgb, dtype=numpy.uint32)[on_canvas]
+        self.data[xs[on_canvas], ys[on_canvas]] = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+    # Mix the colour into each of the pixels at xs[i],ys[i] by alphas[i],
+    #  where 0.0 leaves the pixel as it is and 1.0 replaces it entirely.
+    #  Each pixel should only appear once in the list
+    def blend_pixels(self, xs, ys, colour, alphas):
+        on_canvas = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height) & (alphas > 0)
+        xs = xs[on_canvas]
+        ys = ys[on_canvas]
+        alphas = numpy.minimum(alphas[on_canvas], 1.0)
+        if len(xs) == 0:
+            return None
+
+        current = self.data[xs, ys]
+        new_colour = self.colour_value(colour)
+        blended = numpy.zeros(len(xs), dtype=numpy.uint32)
+        for shift in (16, 8, 0):
+            old_channel = (current >> shift) & 0xFF
+            new_channel = (new_colour >> shift) & 0xFF
+            channel = old_channel * (1.0 - alphas) + new_channel * alphas
+            blended |= channel.astype(numpy.uint32) << shift
+        self.data[xs, ys] = blended
 
     def draw_line(self, from_x, from_y, to_x, to_y, colour, aliasing=None):
-        # Work out which direction has the most pixels
-        #  so that there are no gaps in the line
-        if (from_x == to_x and from_y == to_y):
-            self.set_pixel(int(from_x), int(from_y), colour)
+        """
+        Draw a line between the two points. With aliasing=None this is a
+        plain Bresenham line, otherwise it is antialiased (Wu's algorithm),
+        each pixel either side of the true line taking a share of the colour
+        """
+        if aliasing is not None:
+            return self.draw_antialiased_line(from_x, from_y, to_x, to_y, colour)
+
+        from_x = int(round(from_x, 0))
+        from_y = int(round(from_y, 0))
+        to_x = int(round(to_x, 0))
+        to_y = int(round(to_y, 0))
+
+        # Horizontal and vertical lines are just a slice of the canvas
+        if from_y == to_y:
+            self.draw_span(from_x, to_x, from_y, colour)
             return None
-        #self.logger.verbose("(%d,%d) > (%d,%d)" % (from_x, from_y, to_x, to_y))
-        if (abs(from_x - to_x) > abs(from_y - to_y)):
-            # Make sure that to_x is >= from_x so that the range()
-            #  works properly
-            if to_x < from_x:
-                temp = to_x
-                to_x = from_x
-                from_x = temp
-
-                temp = to_y
-                to_y = from_y
-                from_y = temp
-            #self.logger.verbose("Going from x=%d to x=%d" % (from_x, to_x))
+        if from_x == to_x:
+            x = from_x
+            if x < 0 or x >= self.width:
+                return None
+            y_start = max(min(from_y, to_y), 0)
+            y_end = min(max(from_y, to_y) + 1, self.height)
+            if y_start < y_end:
+                self.data[x, y_start:y_end] = self.colour_value(colour)
+            return None
+
+        # Bresenham, stepping one pixel at a time along whichever
+        #  direction has the most pixels so that there are no gaps
+        dx = abs(to_x - from_x)
+        dy = -abs(to_y - from_y)
+        step_x = 1 if from_x < to_x else -1
+        step_y = 1 if from_y < to_y else -1
+        error = dx + dy
+        xs = []
+        ys = []
+        x = from_x
+        y = from_y
+        while True:
+            xs.append(x)
+            ys.append(y)
+            if x == to_x and y == to_y:
+                break
+            doubled_error = 2 * error
+            if doubled_error >= dy:
+                error += dy
+                x += step_x
+            if doubled_error <= dx:
+                error += dx
+                y += step_y
+        self.set_pixels(numpy.array(xs), numpy.array(ys), colour)
+        return None
+
+    def draw_antialiased_line(self, from_x, from_y, to_x, to_y, colour):
+        # Always step along the longer direction, and swap the axes around
+        #  if that is y, so the same code does both
+        steep = abs(to_y - from_y) > abs(to_x - from_x)
+        if steep:
+            (from_x, from_y, to_x, to_y) = (from_y, from_x, to_y, to_x)
+        if to_x < from_x:
+            (from_x, from_y, to_x, to_y) = (to_x, to_y, from_x, from_y)
+
+        if to_x == from_x:
+            gradient = 0.0
+        else:
             gradient = float(to_y - from_y) / float(to_x - from_x)
-            #self.logger.verbose("Gradient=%f, c=%d" % (gradient, from_y))
-            for x in range(to_x - from_x + 1):
-                y = gradient * float(x) + from_y
-                self.set_pixel(int(x + from_x), int(y), colour)
+
+        # The position of the true line in each column, split between the
+        #  pixel it falls in and the one below it according to how far down
+        #  the first pixel it is
+        major = numpy.arange(int(round(from_x, 0)), int(round(to_x, 0)) + 1)
+        minor = from_y + gradient * (major - from_x)
+        minor_floor = numpy.floor(minor)
+        coverage = minor - minor_floor
+        minor_floor = minor_floor.astype(int)
+
+        major = numpy.concatenate((major, major))
+        minor = numpy.concatenate((minor_floor, minor_floor + 1))
+        alphas = numpy.concatenate((1.0 - coverage, coverage))
+        if steep:
+            self.blend_pixels(minor, major, colour, alphas)
         else:
-            # Make sure that to_y is >= from_y so that the range()
-            #  works properly
-            if to_y < from_y:
-                temp = to_x
-                to_x = from_x
-                from_x = temp
-
-                temp = to_y
-                to_y = from_y
-                from_y = temp
-            #self.logger.verbose("Going from y=%d to y=%d" % (from_y, to_y))
-            gradient = float(to_x - from_x) / float(to_y - from_y)
-            for y in range(to_y - from_y + 1):
-                x = gradient * float(y) + from_x
-                self.set_pixel(int(x), int(y + from_y), colour)
+            self.blend_pixels(major, minor, colour, alphas)
+        return None
 
     # Set the entire canvas to a single colour
     def set_colour(self, colour):
-        if type(colour) is tuple:
-            colour = self.pack_colour_tuple(colour)
-        for x in range(self.width):
-            for y in range(self.height):
-                self.data[x][y] = colour
+        self.data.fill(self.colour_value(colour))
 
     # Text methods:
     def draw_text(self, text, colour, x_pos, y_pos, custom_text=None):
@@ -229,91 +444,174 @@ class FloorCanvas(object):
         return TextWriter.draw_text(None, text, (0, 0, 0), 0, 0)
 
     def draw_circle(self, x_centre, y_centre, radius, colour, fill, antialias=None):
+        """
+        Draw a circle of the given colour, optionally filled with another colour.
+        The outline is worked out with the midpoint algorithm, and then each row
+        is drawn as the outline pixels either side with one span of fill between
+        them, so no pixel is drawn more than once
+        """
+        # Work out the outline for one octant, 0 <= x <= y. A point stays on the
+        #  current row while the midpoint between it and the row below is still
+        #  inside the circle
+        octant = []
+        x = 0
+        y = int(round(radius, 0))
+        radius_squared = radius ** 2
+        while x <= y:
+            octant.append((x, y))
+            x += 1
+            while y > 0 and x ** 2 + (y - 0.5) ** 2 > radius_squared:
+                y -= 1
+
+        # Reflect it into the other seven around the nearest pixel to the
+        #  centre, and group the pixels by row
+        centre_x = int(math.floor(x_centre + 0.5))
+        centre_y = int(math.floor(y_centre + 0.5))
+        rows = {}
+        for (x, y) in octant:
+            for (dx, dy) in ((x, y), (-x, y), (x, -y), (-x, -y), (y, x), (-y, x), (y, -x), (-y, -x)):
+                rows.setdefault(centre_y + dy, set()).add(centre_x + dx)
+
+        outline_xs = []
+        outline_ys = []
+        for (pixel_y, row) in rows.items():
+            outline_xs.extend(row)
+            outline_ys.extend([pixel_y] * len(row))
+            if fill is not None:
+                # Find where the run of outline pixels on the left ends, and
+                #  where the one on the right starts. Fill in between them
+                left = min(row)
+                while left + 1 in row:
+                    left += 1
+                right = max(row)
+                while right - 1 in row:
+                    right -= 1
+                if left + 1 <= right - 1:
+                    self.draw_span(left + 1, right - 1, pixel_y, fill)
+        outline_xs = numpy.array(outline_xs)
+        outline_ys = numpy.array(outline_ys)
+        self.set_pixels(outline_xs, outline_ys, colour)
+
+        # Light up the pixels around the outline that the true circle passes
+        #  through, in proportion to how close they are to it
+        if antialias is not None:
+            x_start = int(math.floor(x_centre - radius - 1))
+            y_start = int(math.floor(y_centre - radius - 1))
+            x_end = int(math.ceil(x_centre + radius + 1)) + 1
+            y_end = int(math.ceil(y_centre + radius + 1)) + 1
+            (grid_x, grid_y) = numpy.mgrid[x_start:x_end, y_start:y_end]
+            distance_away = numpy.sqrt((grid_x - x_centre) ** 2 + (grid_y - y_centre) ** 2)
+            alphas = 1.0 - numpy.abs(distance_away - radius)
+
+            # Leave alone anything we have already drawn
+            drawn = numpy.zeros(grid_x.shape, dtype=bool)
+            drawn[outline_xs - x_start, outline_ys - y_start] = True
+            if fill is not None:
+                drawn |= distance_away < radius
+            candidates = (alphas > 0) & ~drawn
 
-        #radius = int(round(radius, 0))
+            self.blend_pixels(grid_x[candidates], grid_y[candidates], colour, alphas[candidates])
 
-        x = 0
-        y = int(math.sqrt(radius ** 2 - 1) + 0.5)
+        return None
 
-        all_set_pixels = set()
-        while (x <= y):
-            # The outline
-            pixels_to_set = []
-            pixels_to_set.append((x_centre - x, y_centre + y))
-            pixels_to_set.append((x_centre + x, y_centre + y))
-            pixels_to_set.append((x_centre - x, y_centre - y))
-            pixels_to_set.append((x_centre + x, y_centre - y))
 
-            pixels_to_set.append((x_centre - y, y_centre + x))
-            pixels_to_set.append((x_centre + y, y_centre + x))
-            pixels_to_set.append((x_centre - y, y_centre - x))
-            pixels_to_set.append((x_centre + y, y_centre - x))
+class CanvasLayer(FloorCanvas):
+    """
+    An offscreen canvas that is composited on top of a FloorCanvas. It can be
+    drawn on with all of the usual FloorCanvas methods.
 
-            all_set_pixels.update(pixels_to_set)
+    Each pixel has an alpha as well as a colour, kept in the top byte of its
+    packed value. A new layer is transparent, anything drawn on it outright
+    is opaque, and anything drawn with an alpha (set_pixel() with alpha < 1,
+    antialiased lines and circles) is composited over what is on the layer
+    already. The alpha, times the layer's opacity, is used by every blend mode:
 
-            for pixel in pixels_to_set:
-                (pixel_x, pixel_y) = pixel
-                self.set_pixel(pixel_x, pixel_y, colour)
+     over     - the layer is drawn over what is below it
+     add      - the layer is added to what is below it
+     max      - the brighter of the layer and what is below it, per channel
+     multiply - what is below it is scaled by the layer
+    """
+    BLEND_MODES = ["over", "add", "max", "multiply"]
 
-            # The fill
-            if fill is not None:
-                if y >= 1:
-                    y -= 1
-                    self.draw_line(int(round(x_centre - x, 0)), int(round(y_centre + y, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre + x, 0)), int(round(y_centre + y, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre - x, 0)), int(round(y_centre - y, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre - x, 0)), fill)
-                    self.draw_line(int(round(x_centre + x, 0)), int(round(y_centre - y, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre - x, 0)), fill)
-
-                    self.draw_line(int(round(x_centre - y, 0)), int(round(y_centre + x, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre + y, 0)), int(round(y_centre + x, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre - y, 0)), int(round(y_centre - x, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre - x, 0)), fill)
-                    self.draw_line(int(round(x_centre + y, 0)), int(round(y_centre - x, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre - x, 0)), fill)
+    OPAQUE = 0xFF000000
 
-            x += 1
-            if x > radius: break
-            y = int(math.sqrt(radius ** 2 - x ** 2) + 0.5)
+    def __init__(self, name, width, height, blend="over", opacity=1.0):
+        super(CanvasLayer, self).__init__(width, height)
+        if blend not in self.BLEND_MODES:
+            raise ValueError("Unknown blend mode: %s" % blend)
+        self.name = name
+        self.blend = blend
+        self.opacity = opacity
 
-        # This doesn't work that well.
-        # Basically, it attempts to see if there are any pixels that should be fractionally illuminated
-        #  by looking to see if any pixels are < 1.0 pixel away, and turn them on a bit
-        if antialias is not None:
-            self.logger.info("Total number of set pixels: %d" % (len(all_set_pixels)))
-
-            surround_pixels = set()
-            for pixel in all_set_pixels:
-                (pixel_x, pixel_y) = pixel
-                surround_pixels.add((pixel_x - 1, pixel_y))
-                surround_pixels.add((pixel_x + 1, pixel_y))
-
-                surround_pixels.add((pixel_x - 1, pixel_y + 1))
-                surround_pixels.add((pixel_x, pixel_y + 1))
-                surround_pixels.add((pixel_x + 1, pixel_y + 1))
-
-                surround_pixels.add((pixel_x - 1, pixel_y - 1))
-                surround_pixels.add((pixel_x, pixel_y - 1))
-                surround_pixels.add((pixel_x + 1, pixel_y - 1))
-
-            self.logger.info("Total number of surrounding pixels: %d" % (len(surround_pixels)))
-            # The pixels that we haven't already set
-            pixels_not_already_set = surround_pixels.difference(all_set_pixels)
-
-            for pixel in pixels_not_already_set:
-                (pixel_x, pixel_y) = pixel
-                distance_away = math.sqrt((pixel_x - x_centre) ** 2 + (pixel_y - y_centre) ** 2)
-                delta = abs(distance_away - radius)
-                #self.logger.info("%d,%d is %f off" % (pixel_x, pixel_y, delta))
-                if delta < 1.0:
-                    delta /= 1.0
-                    self.set_pixel(pixel_x, pixel_y, colour, "RGB", delta)
+    # Everything drawn outright goes through here, so is made opaque
+    def colour_value(self, colour, format="RGB"):
+        return super(CanvasLayer, self).colour_value(colour, format) | self.OPAQUE
 
-        return None
+    def set_rgb_array(self, rgb, x=0, y=0):
+        rgb = numpy.asarray(rgb).astype(numpy.uint32)
+        self.set_packed_array((rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2], x, y)
+
+    def set_packed_array(self, packed, x=0, y=0):
+        packed = numpy.asarray(packed, dtype=numpy.uint32) | numpy.uint32(self.OPAQUE)
+        super(CanvasLayer, self).set_packed_array(packed, x, y)
 
+    def set_rgb_pixels(self, xs, ys, rgb):
+        super(CanvasLayer, self).set_rgb_pixels(xs, ys, rgb)
+        on_canvas = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.data[xs[on_canvas], ys[on_canvas]] |= numpy.uint32(self.OPAQUE)
+
+    def set_pixel(self, x, y, colour, format="RGB", alpha=1.0):
+        if alpha >= 1.0:
+            return super(CanvasLayer, self).set_pixel(x, y, colour, format)
+        self.blend_pixels(numpy.array([int(round(x, 0))]), numpy.array([int(round(y, 0))]),
+                          self.colour_value(colour, format), numpy.array([alpha]))
+
+    # Composite the colour over each of the pixels at xs[i],ys[i] with alpha
+    #  alphas[i], taking into account how opaque each of them already is
+    def blend_pixels(self, xs, ys, colour, alphas):
+        on_canvas = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height) & (alphas > 0)
+        xs = xs[on_canvas]
+        ys = ys[on_canvas]
+        alphas = numpy.minimum(alphas[on_canvas], 1.0)
+        if len(xs) == 0:
+            return None
 
+        current = self.data[xs, ys]
+        current_alphas = ((current >> 24) & 0xFF) / 255.0
+        new_alphas = alphas + current_alphas * (1.0 - alphas)
+        new_colour = self.colour_value(colour)
+        blended = numpy.round(new_alphas * 255).astype(numpy.uint32) << 24
+        for shift in (16, 8, 0):
+            old_channel = (current >> shift) & 0xFF
+            new_channel = (new_colour >> shift) & 0xFF
+            channel = (old_channel * current_alphas * (1.0 - alphas) + new_channel * alphas) / new_alphas
+            blended |= numpy.minimum(channel, 255).astype(numpy.uint32) << shift
+        self.data[xs, ys] = blended
+
+    # Make the whole layer transparent again
+    def clear(self):
+        self.data.fill(0)
+
+    # Return the alpha of each pixel, as an array data[x][y] of 0.0 to 1.0
+    def get_alpha_array(self):
+        return ((self.data >> 24) & 0xFF).astype(numpy.float32) / 255.0
+
+    # Fade everything on this layer out by the given factor, e.g. 0.9 each
+    #  frame leaves a trail behind anything that moves
+    def decay(self, factor):
+        alpha = (((self.data >> 24) & 0xFF) * factor).astype(numpy.uint32)
+        self.data[:, :] = (self.data & 0xFFFFFF) | (alpha << 24)
+
+    # Return the float (width, height, 3) array 'below' with this layer blended on top
+    def composite(self, below):
+        layer = self.get_rgb_array().astype(numpy.float32)
+        alpha = self.get_alpha_array()[:, :, numpy.newaxis] * self.opacity
+        if self.blend == "over":
+            return below * (1.0 - alpha) + layer * alpha
+        elif self.blend == "add":
+            return below + layer * alpha
+        elif self.blend == "max":
+            return numpy.maximum(below, layer * alpha)
+        elif self.blend == "multiply":
+            return below * (1.0 - alpha + layer / 255.0 * alpha)
+        return below
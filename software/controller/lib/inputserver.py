@@ -0,0 +1,218 @@
+__authors__ = ['Andrew Taylor']
+
+import errno
+import json
+import logging
+import select
+import socket
+import threading
+import time
+
+from collections import deque
+
+import pygame
+
+from lib.controllers import ControllerInput
+
+
+class InputServer(object):
+    """
+    Takes controller input over the network, so that phones and other remote
+    clients can play the games. Each UDP packet is a JSON message, either
+
+        {"joy": 0, "button": "A", "pressed": true}
+        {"joy": 0, "axis": "x", "value": -1}
+
+    which become the same JOYBUTTONDOWN/JOYBUTTONUP and JOYAXISMOTION events
+    that a gamepad would give, or
+
+        {"ping": 1234}
+
+    which is answered straight away with {"pong": 1234, "latency": ms}, so a
+    client can measure the round trip, and "latency" says how long the last
+    input took from arriving to being on the floor.
+
+    The socket is looked after by a loop on a background thread, which
+    queues the events up with the time they arrived, and the main loop picks
+    them up with get_events() along with the pygame ones. Once the frame
+    they went into has been sent, frame_sent() records how long each one
+    took, and get_latency_stats() summarises it.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_PORT = 9999
+    # The most that is read from the socket in one go
+    MAX_PACKET = 1024
+    # How often the loop checks whether it should stop, in seconds
+    POLL_INTERVAL = 0.5
+    # How many latencies to keep for the stats
+    LATENCY_HISTORY = 200
+    # How often to log the stats, in seconds
+    STATS_INTERVAL = 30
+
+    BUTTONS = {
+        "x": ControllerInput.BUTTON_X,
+        "a": ControllerInput.BUTTON_A,
+        "b": ControllerInput.BUTTON_B,
+        "y": ControllerInput.BUTTON_Y,
+        "lb": ControllerInput.BUMPER_LEFT,
+        "rb": ControllerInput.BUMPER_RIGHT,
+        "select": ControllerInput.BUTTON_SELECT,
+        "start": ControllerInput.BUTTON_START,
+    }
+
+    AXES = {"x": 0, "y": 1}
+
+    # Anything for another controller is dropped, as the plugins only know
+    #  about these
+    CONTROLLERS = [ControllerInput.CONTROLLER_1, ControllerInput.CONTROLLER_2]
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self.address = (host, port)
+        self.socket = None
+        self.thread = None
+        self.serving = False
+        # Appending and popping from either end of a deque is thread safe, so
+        #  the two threads don't need to lock anything
+        self.events = deque()
+        # Events that have been handed out, waiting for their frame to be sent
+        self.in_flight = []
+        self.latencies = deque(maxlen=self.LATENCY_HISTORY)
+        self.last_latency = None
+        self.event_count = 0
+        self.last_stats_time = time.time()
+
+    def start(self):
+        if self.thread is not None:
+            return None
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.setblocking(False)
+        self.logger.info("Listening for controller input on %s:%d" % self.socket.getsockname())
+        self.serving = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        return None
+
+    def stop(self):
+        self.serving = False
+        if self.thread is not None:
+            self.thread.join(2 * self.POLL_INTERVAL)
+            self.thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        return None
+
+    def get_address(self):
+        if self.socket is None:
+            return self.address
+        return self.socket.getsockname()
+
+    def serve(self):
+        while self.serving:
+            try:
+                (readable, writable, failed) = select.select([self.socket], [], [], self.POLL_INTERVAL)
+            except (select.error, socket.error, ValueError) as e:
+                self.logger.warn("Input server stopped: %s" % e)
+                break
+            if len(readable) > 0:
+                self.read_packets()
+
+    # Read everything that is waiting
+    def read_packets(self):
+        while True:
+            try:
+                (data, sender) = self.socket.recvfrom(self.MAX_PACKET)
+            except socket.error as e:
+                if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    self.logger.warn("Unable to read controller input: %s" % e)
+                return None
+            received = time.time()
+            try:
+                message = json.loads(data.decode("utf-8"))
+                self.handle_message(message, sender, received)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.logger.debug("Ignoring controller input from %s: %s" % (sender, e))
+
+    def handle_message(self, message, sender, received):
+        if "ping" in message:
+            reply = {"pong": message["ping"], "latency": self.last_latency}
+            try:
+                self.socket.sendto(json.dumps(reply).encode("utf-8"), sender)
+            except socket.error as e:
+                self.logger.debug("Unable to reply to %s: %s" % (sender, e))
+            return None
+
+        event = self.get_event(message, received)
+        if event is not None:
+            self.events.append(event)
+        return None
+
+    # Turn a message into the event a gamepad would have given. Anything that
+    #  isn't a known controller, button or axis raises a KeyError
+    def get_event(self, message, received):
+        joy = int(message.get("joy", ControllerInput.CONTROLLER_1))
+        if joy not in self.CONTROLLERS:
+            raise KeyError("Unknown controller %s" % joy)
+        if "button" in message:
+            button = message["button"]
+            if not isinstance(button, int):
+                button = self.BUTTONS[button.lower()]
+            elif button not in self.BUTTONS.values():
+                raise KeyError("Unknown button %s" % button)
+            if message.get("pressed", True):
+                event_type = pygame.JOYBUTTONDOWN
+            else:
+                event_type = pygame.JOYBUTTONUP
+            return pygame.event.Event(event_type, {"joy": joy, "button": button, "received": received})
+        if "axis" in message:
+            axis = message["axis"]
+            if not isinstance(axis, int):
+                axis = self.AXES[axis.lower()]
+            elif axis not in self.AXES.values():
+                raise KeyError("Unknown axis %s" % axis)
+            value = max(-1.0, min(1.0, float(message.get("value", 0.0))))
+            return pygame.event.Event(pygame.JOYAXISMOTION,
+                                      {"joy": joy, "axis": axis, "value": value, "received": received})
+        return None
+
+    # The events that have arrived since this was last called
+    def get_events(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.popleft())
+            except IndexError:
+                break
+        self.in_flight.extend(events)
+        return events
+
+    # The frame that the last events went into has been sent to the floor
+    def frame_sent(self):
+        if len(self.in_flight) == 0:
+            return None
+        now = time.time()
+        for event in self.in_flight:
+            self.last_latency = 1000.0 * (now - event.received)
+            self.latencies.append(self.last_latency)
+        self.event_count += len(self.in_flight)
+        self.in_flight = []
+
+        if now - self.last_stats_time >= self.STATS_INTERVAL:
+            self.last_stats_time = now
+            self.logger.info("Controller input latency: %s" % self.get_latency_stats())
+        return None
+
+    # How long input has taken, in ms, from arriving to being on the floor
+    def get_latency_stats(self):
+        stats = {"events": self.event_count}
+        if len(self.latencies) > 0:
+            latencies = sorted(self.latencies)
+            stats["last"] = round(self.last_latency, 2)
+            stats["mean"] = round(sum(latencies) / len(latencies), 2)
+            stats["median"] = round(latencies[len(latencies) // 2], 2)
+            stats["max"] = round(latencies[-1], 2)
+        return stats
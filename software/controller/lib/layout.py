@@ -2,10 +2,45 @@ __authors__ = ['Joel Wright']
 
 import logging
 
+import numpy
+
 
 class DisplayLayout(object):
+    """
+    Works out where each pixel of the dance floor is in the serial chain of
+    modules, once, when the config is loaded. The result is held in two
+    tables:
+
+        layout_mapping[x][y]   the serial position of the canvas pixel (x,y),
+                               or -1 if there is no module there
+        serial_positions[n]    the (x,y) canvas position of the nth pixel
+                               along the chain
+
+    so an output can pick the pixels out of a canvas in the order they are
+    sent in one go, and a simulator can put them back again.
+
+    Each module is placed by taking its pixels in the order they are wired,
+    i.e. a width x height grid filled in rows from its top left corner when it
+    faces north, and applying transforms to it: a rotation for its
+    orientation, then an optional mirror, then any further transforms listed
+    in its config. Modules can be put anywhere, so the floor doesn't need to
+    be a rectangle, and anywhere without one is just a gap.
+    """
     logger = logging.getLogger(__name__)
 
+    # How many quarter turns each orientation is from north
+    ORIENTATIONS = {'N': 0, 'E': 3, 'S': 2, 'W': 1}
+
+    # Transforms that can be applied to a module's grid of serial positions,
+    #  which is indexed grid[x][y]
+    TRANSFORMS = {
+        "rotate_cw": lambda grid: numpy.rot90(grid, 3),
+        "rotate_ccw": lambda grid: numpy.rot90(grid, 1),
+        "rotate_180": lambda grid: numpy.rot90(grid, 2),
+        "mirror_x": lambda grid: grid[::-1, :],
+        "mirror_y": lambda grid: grid[:, ::-1],
+    }
+
     def __init__(self, config):
         # super(DisplayLayout, self).__init__()
         self.load_config(config)
@@ -25,26 +60,19 @@ class DisplayLayout(object):
         (self.size_x, self.size_y) = self.calculate_floor_size()
         self.calculate_mapping()
         self.rotate_layout(self.rotation)
+        self.calculate_serial_positions()
 
     def rotate_layout(self, rotation):
         # Incrementing rotation by 1 rotates the floor by 90 degrees.
         # The size stays the same, just the axes move around, so return the right combo
 
         # If the rotation is not 0, then we should shift the layout mapping around
-        if self.rotation > 0:
-
-            # Set the new size
-            original_size_x = self.size_x
-            original_size_y = self.size_y
-            if self.rotation % 2 == 1:
-                self.size_x = original_size_y
-                self.size_y = original_size_x
-
-            for i in range(self.rotation):
+        if rotation > 0:
+            for i in range(rotation):
                 self.logger.info("Rotate Layout - %d" % i)
-                # Very cunning, this. I found it on the internet
-                self.layout_mapping = zip(*self.layout_mapping[::-1])
+                self.layout_mapping = self.TRANSFORMS["rotate_cw"](self.layout_mapping)
 
+            (self.size_x, self.size_y) = self.layout_mapping.shape
             self.logger.info("Floor is now of size %d, %d" % (self.size_x, self.size_y))
 
     def draw_layout(self):
@@ -56,7 +84,7 @@ class DisplayLayout(object):
         s = ""
         for y in range(0, self.size_y):
             for x in range(0, self.size_x):
-                s += "%04s " % self.layout_mapping[x][y]
+                s += "%04s " % self.get_position(x, y)
             s += "\n"
         return s
 
@@ -66,97 +94,88 @@ class DisplayLayout(object):
     """
 
     def get_converter(self):
-        order = dict()
-        for y in range(0, self.size_y):
-            for x in range(0, self.size_x):
-                order[self.layout_mapping[x][y]] = (x, y)
+        return self.serial_positions
 
-        ordered_list = []
-        for pixel in sorted(order):
-            ordered_list.append(order[pixel])
+    """
+    Return a list of (module, converter) pairs, in the order the modules are
+    chained, where each converter is the list of (x,y) coordinates of that
+    module's pixels in the order it expects them
+    """
 
-        return ordered_list
+    def get_module_converters(self):
+        return [(module, self.serial_positions[start:end]) for (module, start, end) in self.module_ranges]
 
     def get_position(self, x, y):
         if x < 0 or y < 0 or x >= self.size_x or y >= self.size_y:
             return None
-        else:
-            return self.layout_mapping[x][y]
-
-    def add_north(self, height, width, pos_x, pos_y):
-        for y in range(pos_y, pos_y + height):
-            for x in range(pos_x, pos_x + width):
-                if self.layout_mapping[x][y] is not None:
-                    self.logger.error("The config appears to contain overlapping tiles")
-                self.layout_mapping[x][y] = self.pixel_count
-                self.pixel_count += 1
-
-    def add_east(self, height, width, pos_x, pos_y):
-        for x in range(pos_x, pos_x + height):
-            for y in reversed(range(pos_y, pos_y + width)):
-                if self.layout_mapping[x][y] is not None:
-                    self.logger.error("The config appears to contain overlapping tiles")
-                self.layout_mapping[x][y] = self.pixel_count
-                self.pixel_count += 1
-
-    def add_south(self, height, width, pos_x, pos_y):
-        for y in reversed(range(pos_y, pos_y + height)):
-            for x in reversed(range(pos_x, pos_x + width)):
-                if self.layout_mapping[x][y] is not None:
-                    self.logger.error("The config appears to contain overlapping tiles")
-                self.layout_mapping[x][y] = self.pixel_count
-                self.pixel_count += 1
-        return True
-
-    def add_west(self, height, width, pos_x, pos_y):
-        for x in reversed(range(pos_x, pos_x + height)):
-            for y in range(pos_y, pos_y + width):
-                if self.layout_mapping[x][y] is not None:
-                    self.logger.error("The config appears to contain overlapping tiles")
-                self.layout_mapping[x][y] = self.pixel_count
-                self.pixel_count += 1
-        return True
+        position = self.layout_mapping[x][y]
+        if position < 0:
+            return None
+        return int(position)
 
+    def get_module_grid(self, module_data):
+        """
+        Work out the serial positions of a module's pixels, relative to its
+        first pixel, as a grid[x][y] the way round it is on the floor.
+        """
+        module_width = module_data["width"]
+        module_height = module_data["height"]
+
+        # Facing north, the pixels go along each row in turn
+        grid = numpy.arange(module_width * module_height).reshape((module_height, module_width)).T
+
+        grid = numpy.rot90(grid, self.ORIENTATIONS[module_data["orientation"]])
+
+        mirror = module_data.get("mirror")
+        if mirror is True:
+            mirror = "x"
+        if mirror:
+            grid = self.TRANSFORMS["mirror_%s" % mirror](grid)
+
+        for transform in module_data.get("transforms", []):
+            grid = self.TRANSFORMS[transform](grid)
+
+        return grid
 
     def calculate_mapping(self):
         """
         Calculate the mapping from (x,y) dance floor coordinate to dance floor
         serial position.
         """
-        # Create a list of lists filled with None, then we can populate with
-        # the serial location if present
-        self.layout_mapping = [[None for y in range(0, self.size_y)] for x in range(0, self.size_x)]
+        # Fill the floor with -1, then we can populate with the serial
+        # location if present
+        self.layout_mapping = numpy.zeros((self.size_x, self.size_y), dtype=int) - 1
         self.pixel_count = 0
+        # Where each module's pixels are in the chain, as (module, start, end)
+        self.module_ranges = []
 
         for module in sorted(self.module_config.keys()):
             module_data = self.module_config[module]
-            module_orientation = module_data["orientation"]
-            module_height = module_data["height"]
-            module_width = module_data["width"]
-
-            if module_orientation == 'N':
-                self.add_north(module_data["height"],
-                               module_data["width"],
-                               module_data["x_position"],
-                               module_data["y_position"])
-            elif module_orientation == 'E':
-                self.add_east(module_data["height"],
-                              module_data["width"],
-                              module_data["x_position"],
-                              module_data["y_position"])
-            elif module_orientation == 'S':
-                self.add_south(module_data["height"],
-                               module_data["width"],
-                               module_data["x_position"],
-                               module_data["y_position"])
-            elif module_orientation == 'W':
-                self.add_west(module_data["height"],
-                              module_data["width"],
-                              module_data["x_position"],
-                              module_data["y_position"])
-            else:
-                self.logger.error("The orientation of a tile in the config was not recognised")
-
+            try:
+                grid = self.get_module_grid(module_data)
+            except KeyError:
+                self.logger.error("The orientation or a transform of a tile in the config was not recognised")
+                continue
+
+            pos_x = module_data["x_position"]
+            pos_y = module_data["y_position"]
+            (width, height) = grid.shape
+            area = self.layout_mapping[pos_x:pos_x + width, pos_y:pos_y + height]
+            if (area >= 0).any():
+                self.logger.error("The config appears to contain overlapping tiles")
+            area[:, :] = grid + self.pixel_count
+            self.module_ranges.append((module, self.pixel_count, self.pixel_count + grid.size))
+            self.pixel_count += grid.size
+
+    def calculate_serial_positions(self):
+        """
+        Calculate the inverse of the mapping, the (x,y) dance floor coordinate
+        of each serial position, as an array of shape (pixel_count, 2).
+        """
+        self.serial_positions = numpy.zeros((self.pixel_count, 2), dtype=int)
+        (xs, ys) = numpy.nonzero(self.layout_mapping >= 0)
+        self.serial_positions[self.layout_mapping[xs, ys]] = numpy.column_stack((xs, ys))
+        return self.serial_positions
 
     def calculate_floor_size(self):
         """
@@ -164,7 +183,8 @@ class DisplayLayout(object):
         that we do not guarantee that all pixels will be used, this simply
         returns the max x and y coordinates described.
 
-        We will deal with overlapping boards and gaps later.
+        Gaps are left empty, and overlapping boards are reported when the
+        mapping is calculated.
 
         Returns:
                 A pair containing the maximum x and y coordinated required by the
@@ -175,16 +195,13 @@ class DisplayLayout(object):
 
         for module in sorted(self.module_config.keys()):
             module_data = self.module_config[module]
-            module_orientation = module_data["orientation"]
-            module_height = module_data["height"]
-            module_width = module_data["width"]
+            try:
+                (module_x_size, module_y_size) = self.get_module_grid(module_data).shape
+            except KeyError:
+                continue
 
-            max_x, max_y = {
-            'N': (module_width + module_data["x_position"], module_height + module_data["y_position"]),
-            'E': (module_height + module_data["x_position"], module_width + module_data["y_position"]),
-            'S': (module_width + module_data["x_position"], module_height + module_data["y_position"]),
-            'W': (module_height + module_data["x_position"], module_width + module_data["y_position"]),
-            }[module_orientation]
+            max_x = module_x_size + module_data["x_position"]
+            max_y = module_y_size + module_data["y_position"]
 
             if (max_x > x_extent):
                 x_extent = max_x
@@ -192,5 +209,3 @@ class DisplayLayout(object):
                 y_extent = max_y
 
         return (x_extent, y_extent)
-
-		
@@ -94,18 +94,18 @@ class Menu(object):
             # We aren't in the menu, and we didn't go in, so it isn't for us
             return e
         else:
-            self.logger.info("In Menu")
+            self.logger.debug("In Menu")
             if (e.type == pygame.JOYBUTTONDOWN):
-                self.logger.info("Button Pressed")
+                self.logger.debug("Button Pressed")
                 # See if we should leave the menu
                 if e.button in [ControllerInput.BUTTON_SELECT]:
-                    self.logger.info("SELECT Button Pressed")
+                    self.logger.debug("SELECT Button Pressed")
                     self.logger.info("Leaving Menu")
                     self.leave_menu()
                     return None
 
                 if e.button in [ControllerInput.BUTTON_B]:
-                    self.logger.info("B Button Pressed")
+                    self.logger.debug("B Button Pressed")
                     # If we are at the root, leave the menu
                     if self.current_menu_playlist == None:
                         self.logger.info("Leaving Menu")
@@ -119,7 +119,7 @@ class Menu(object):
                 #  something
 
                 if e.button in [ControllerInput.BUMPER_LEFT]:
-                    self.logger.info("BUMPER LEFT Button Pressed")
+                    self.logger.debug("BUMPER LEFT Button Pressed")
                     # If we are in the root, then scroll the current playlist
                     #  header splash to the left (assuming we aren't at the start)
                     if self.current_menu_playlist == None:
@@ -135,7 +135,7 @@ class Menu(object):
                     return None
 
                 if e.button in [ControllerInput.BUMPER_RIGHT]:
-                    self.logger.info("BUMPER RIGHT Button Pressed")
+                    self.logger.debug("BUMPER RIGHT Button Pressed")
                     # If we are in the root, then scroll the current playlist
                     #  header splash to the right (assuming we aren't at the end)
                     if self.current_menu_playlist == None:
@@ -151,7 +151,7 @@ class Menu(object):
                     return None
 
                 if e.button in [ControllerInput.BUTTON_A]:
-                    self.logger.info("A Button Pressed")
+                    self.logger.debug("A Button Pressed")
                     # If we are in the root, enter a playlist, starting at zero
                     if self.current_menu_playlist == None:
                         playlists = self.plugin_model.get_all_playlists()
@@ -173,6 +173,13 @@ class Menu(object):
             #  this catches the event if it wasn't actually something we cared about
             return None
 
+    # The events the menu wants, as (event types, buttons). Once it is open it
+    #  takes everything, otherwise only the SELECT button that opens it
+    def get_event_filter(self):
+        if self.in_menu:
+            return (None, None)
+        return ([pygame.JOYBUTTONDOWN], [ControllerInput.BUTTON_SELECT])
+
     def leave_menu(self):
         self.in_menu = False
         if self.plugin_model.get_current_playlist() is not None:
@@ -219,9 +226,12 @@ class Menu(object):
 
     def draw_frame(self, canvas):
         if self.in_menu:
+            # Each splash starts afresh, rather than on top of any layers the
+            #  last one left behind
+            canvas.clear_layers()
             if self.current_menu_playlist == None:
                 # Draw the playlist's splash
-                self.logger.info("Drawing splash screen for playlist %d" % self.current_menu_playlist_index)
+                self.logger.debug("Drawing splash screen for playlist %d" % self.current_menu_playlist_index)
                 playlists = self.plugin_model.get_all_playlists()
                 current_menu_playlist = playlists[self.current_menu_playlist_index]
                 current_menu_playlist.draw_splash(canvas)
@@ -232,7 +242,7 @@ class Menu(object):
             else:
                 # We are in a playlist, so draw the splash of the plugin we
                 # are currently at
-                self.logger.info("Drawing splash screen for playlist %d, plugin %d" % (
+                self.logger.debug("Drawing splash screen for playlist %d, plugin %d" % (
                 self.current_menu_playlist_index, self.current_menu_playlist_entry_index))
                 # Fish the plugin we want to draw out of the right playlist
                 playlists = self.plugin_model.get_all_playlists()
@@ -253,16 +263,18 @@ class Menu(object):
 
         return None
 
+    # The scrollbar goes on a layer of its own, so that it is still on top
+    #  once any layers the splash made have been composited
     def draw_scrollbar(self, canvas, position, total):
+        scrollbar = canvas.get_layer("scrollbar")
         # Blank the bottom row for a scroller
-        for x in range(canvas.get_width()):
-            canvas.set_pixel(x, canvas.get_height() - 1, (0, 0, 0))
+        scrollbar.draw_line(0, canvas.get_height() - 1, canvas.get_width() - 1, canvas.get_height() - 1, (0, 0, 0))
 
         pixels_per_entry = canvas.get_width() / float(total)
 
         bar_start_x = int(math.floor(pixels_per_entry * position))
         bar_end_x = int(math.ceil((pixels_per_entry * position) + pixels_per_entry))
         bar_colour = (0xFF, 0xFF, 0)
-        canvas.draw_line(bar_start_x, canvas.get_height() - 1, bar_end_x, canvas.get_height() - 1, bar_colour)
+        scrollbar.draw_line(bar_start_x, canvas.get_height() - 1, bar_end_x, canvas.get_height() - 1, bar_colour)
         return canvas
 
@@ -8,6 +8,14 @@ import pygame
 from itertools import count
 import os
 import logging
+import struct
+import time
+
+import numpy
+
+from lib.udp import PacketSender
+from lib.preview import PreviewServer
+from lib.recording import FrameRecorder
 
 
 class Output(object):
@@ -20,12 +28,23 @@ class Output(object):
     def set_name(self, name):
         self.name = name
 
+    # Called with each frame that has something different in it. The canvas
+    #  says which pixels have changed with get_changes()
     def send_data(self, canvas):
         pass
 
+    # Called instead of send_data() when the frame is exactly the same as the
+    #  last one, for outputs that have something else to update
+    def refresh(self, canvas):
+        pass
+
     def clear(self):
         pass
 
+    # Called when the program is finishing, for outputs with anything to tidy up
+    def close(self):
+        pass
+
 
 class GuiOutput(Output):
     # This will provide an inbuilt windows showing the correct
@@ -49,6 +68,12 @@ class GuiOutput(Output):
 
         self.pressed_buttons = dict()
 
+        # The floor is drawn onto this, and only the cells that have changed
+        #  are drawn again each frame
+        self.floor_surface = None
+        self.floor_size = None
+        self.canvas = None
+
     def handle_event(self, event):
         if event.type in [pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP]:
             joypad = event.joy
@@ -59,7 +84,8 @@ class GuiOutput(Output):
             if event.type == pygame.JOYBUTTONUP:
                 self.pressed_buttons[joypad][event.button] = False
 
-            self.logger.info("Currently pressed buttons: %s" % self.pressed_buttons)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Currently pressed buttons: %s" % self.pressed_buttons)
 
         return event
 
@@ -140,17 +166,29 @@ class GuiOutput(Output):
 
     def send_data(self, canvas):
         self.canvas = canvas
+
+        # Redraw the floor visualisation pattern, where it has changed
+        changes = canvas.get_changes()
+        if self.floor_surface is None or self.floor_size != canvas.get_size():
+            self.floor_surface = pygame.Surface(self.gui.get_size()).convert()
+            self.floor_size = canvas.get_size()
+            changes = None
+        self.update_floor_visualisation(self.floor_surface, canvas, changes)
+
         self.redraw()
 
         return None
 
-    def redraw(self):
-        # Get an object we can draw on
-        drawable = pygame.Surface(self.gui.get_size())
-        drawable = drawable.convert()
+    # The floor hasn't changed, but the controllers and playlist info may have
+    def refresh(self, canvas):
+        if self.floor_surface is None:
+            return self.send_data(canvas)
+        self.redraw()
+        return None
 
-        # Redraw the floor visualisation pattern
-        self.update_floor_visualisation(drawable, self.canvas)
+    def redraw(self):
+        # Get an object we can draw on, starting with the floor
+        drawable = self.floor_surface.copy()
 
         # Draw the input controllers (if appropriate)
         self.draw_controllers(drawable)
@@ -346,7 +384,9 @@ class GuiOutput(Output):
         return None
 
 
-    def update_floor_visualisation(self, drawable, canvas):
+    # Only the cells that are set in 'changes' are drawn, or all of them if
+    #  it is None
+    def update_floor_visualisation(self, drawable, canvas, changes=None):
 
         # Work out how many pixels square each cell will be, as we want to
         #  maintain the aspect ratio (// rounds down). We will then pad
@@ -382,13 +422,15 @@ class GuiOutput(Output):
         # Draw the pixels of the floor canvas onto the drawable object
         # The position is determined based on the size of each cell and the padding
         #  amounts calculated previously
-        for canvas_x in range(canvas_width):
-            for canvas_y in range(canvas_height):
-                rect_pos = (canvas_x * pixels_per_cell + x_padding, canvas_y * pixels_per_cell + y_padding)
-                pygame.draw.rect(drawable, canvas.get_pixel_tuple(canvas_x, canvas_y),
-                                 pygame.Rect(canvas_x * pixels_per_cell + x_padding // 2,
-                                             canvas_y * pixels_per_cell + y_padding // 2, pixels_per_cell,
-                                             pixels_per_cell), 0)
+        if changes is None:
+            cells = [(x, y) for x in range(canvas_width) for y in range(canvas_height)]
+        else:
+            cells = zip(*numpy.nonzero(changes))
+        for (canvas_x, canvas_y) in cells:
+            pygame.draw.rect(drawable, canvas.get_pixel_tuple(canvas_x, canvas_y),
+                             pygame.Rect(canvas_x * pixels_per_cell + x_padding // 2,
+                                         canvas_y * pixels_per_cell + y_padding // 2, pixels_per_cell,
+                                         pixels_per_cell), 0)
 
         return None
 
@@ -399,10 +441,40 @@ class GuiOutput(Output):
 class FormattedByteOutput(Output):
     logger = logging.getLogger(__name__)
 
+    # Keep 0x01 and 255 out of the data, see form_pixel_data()
+    ESCAPE_BYTES = True
+
     def __init__(self):
         self.logger.info("__init__ for FormattedByteOutput")
+        super(FormattedByteOutput, self).__init__()
         self.converter = None
         self.filters = []
+        # The canvas positions of the pixels, in the order they are sent, as
+        #  a pair of arrays (xs, ys) so that they can be picked out in one go
+        self.positions = None
+        self.positions_size = None
+        # The bytes for each pixel, in the order they are sent, kept from one
+        #  frame to the next so that only the pixels that change are encoded
+        self.encoded_pixels = None
+        # Colour correction for each module, if any, and the lookup table it
+        #  is fused into along with the filters
+        self.calibration = None
+        self.encoding = None
+        # Turns down modules that would draw too much current, if set, and
+        #  which of its modules each pixel is in
+        self.power_limiter = None
+        self.power_modules = None
+
+    # The frame hasn't changed, but the bytes for it might have to. Only the
+    #  pixels that have changed are encoded again, so this is cheap
+    def refresh(self, canvas):
+        if self.needs_refresh():
+            self.send_data(canvas)
+
+    # Whether the same frame still needs sending again, e.g. because the
+    #  power limiter is still easing a module up or down
+    def needs_refresh(self):
+        return self.power_limiter is not None and not self.power_limiter.is_settled()
 
     def set_output_converter(self, converter):
         # The converter will be used to pick the
@@ -414,50 +486,125 @@ class FormattedByteOutput(Output):
         #  which, when iterated through, puts all the
         #  appropriate cells in the correct order
         self.converter = converter
+        self.positions = None
+        self.invalidate_encoding()
         pass
 
-    def format_data(self, canvas):
-        # First we need to convert the canvas into a buffer
-        # containing the bytes in the right order
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+        self.invalidate_encoding()
 
-        # Create one long string of all the bytes to send
-        output_string = ""
-        canvas_array = canvas.get_canvas_array()
-        if self.converter == None:
+    def set_power_limiter(self, power_limiter):
+        self.power_limiter = power_limiter
+        self.invalidate_encoding()
+
+    # Anything that changes how pixels are encoded means they all need to be
+    #  encoded again
+    def invalidate_encoding(self):
+        self.encoding = None
+        self.encoded_pixels = None
+        self.power_modules = None
+
+    def get_positions(self, canvas):
+        if self.converter is None:
             # Assume that pixels need to be sent in
-            #  the order they are, (0,0), (1,0), (2,0)
+            #  the order they are, (0,0), (0,1), (0,2)
             #  etc...
             # It is highly likely this is not what you
             #  want, unless your output is only a single
             #  module
-            for x in range(0, canvas.width):
-                for y in range(0, canvas.height):
-                    rgb = canvas_array[x][y]
-                    output_string += self.form_pixel_data(rgb)
-            pass
+            if self.positions is None or self.positions_size != canvas.get_size():
+                (xs, ys) = numpy.mgrid[0:canvas.width, 0:canvas.height]
+                self.positions = (xs.ravel(), ys.ravel())
+                self.positions_size = canvas.get_size()
+                self.invalidate_encoding()
+        elif self.positions is None:
+            # Pick up the right pixels in the right order
+            converter = numpy.asarray(self.converter, dtype=int).reshape((-1, 2))
+            self.positions = (converter[:, 0], converter[:, 1])
+        return self.positions
+
+    # The lookup table that turns each channel of each pixel into the byte
+    #  to send, as (table[row][channel][value], the row for each pixel, and
+    #  any filters that couldn't be folded into it)
+    def get_encoding(self, xs, ys):
+        if self.encoding is not None:
+            return self.encoding
+
+        # Filters that work on each channel separately are folded into the
+        #  table, otherwise they are all applied before it
+        channel_tables = [filter.get_channel_table() for filter in self.filters]
+        fused = numpy.array([numpy.arange(256)] * 3)
+        if any(table is None for table in channel_tables):
+            filters = list(self.filters)
         else:
-            # Iterate over the converter, picking up the right
-            #  pixels in the right order
-            for x_y in self.converter:
-                (x, y) = x_y
-                rgb = canvas_array[x][y]
-                for filter in self.filters:
-                    rgb = filter.modify(rgb)
-                output_string += self.form_pixel_data(rgb)
+            filters = []
+            for table in channel_tables:
+                fused = numpy.array([table[channel][fused[channel]] for channel in range(3)])
 
-        return output_string
+        if self.calibration is None:
+            table = fused[numpy.newaxis]
+            rows = numpy.zeros(len(xs), dtype=int)
+        else:
+            table = self.calibration.get_table()[:, numpy.arange(3)[:, numpy.newaxis], fused]
+            rows = self.calibration.get_pixel_rows()[xs, ys]
+
+        # Make sure we don't send a 0x01 or 255 (see form_pixel_data())
+        table = numpy.array(table, dtype=numpy.uint8)
+        if self.ESCAPE_BYTES:
+            table[table == 1] = 2
+            table[table == 255] = 254
+
+        self.encoding = (table, rows, filters)
+        return self.encoding
+
+    def format_data(self, canvas):
+        # First we need to convert the canvas into a buffer
+        # containing the bytes in the right order
+        (xs, ys) = self.get_positions(canvas)
+        (table, rows, filters) = self.get_encoding(xs, ys)
+        rgb = canvas.get_canvas_array()[xs, ys]
+
+        changes = canvas.get_changes()
+        if self.encoded_pixels is None or changes is None:
+            changed = None
+        else:
+            # Only the pixels that have changed need to be encoded again
+            changed = numpy.flatnonzero(changes[xs, ys])
+            rgb = rgb[changed]
+            rows = rows[changed]
+
+        for filter in filters:
+            rgb = filter.modify_array(rgb)
+        pixels = self.form_pixel_array(rgb, table, rows)
+
+        if changed is None:
+            self.encoded_pixels = pixels
+        else:
+            self.encoded_pixels[changed] = pixels
+
+        pixels = self.encoded_pixels
+        if self.power_limiter is not None:
+            if self.power_modules is None:
+                self.power_modules = self.power_limiter.get_pixel_modules()[xs, ys]
+            pixels = self.power_limiter.limit(pixels, self.power_modules)
+
+        # Create one long string of all the bytes to send
+        return pixels.tobytes()
 
     """
     Append filter and return self so that you can chain additions
     """
     def append_filter(self, filter):
         self.filters.append(filter)
+        self.invalidate_encoding()
         return self
 
     """
     Pop filter from the list and return it
     """
     def pop_filter(self):
+        self.invalidate_encoding()
         return self.filters.pop()
 
     """
@@ -466,6 +613,7 @@ class FormattedByteOutput(Output):
     def clear_filters(self):
         filters = self.filters
         self.filters = []
+        self.invalidate_encoding()
         return filters
 
     def form_pixel_data(self, rgb):
@@ -502,6 +650,20 @@ class FormattedByteOutput(Output):
 
         return output_string
 
+    # The same as form_pixel_data(), for an array of RGB values, returning an
+    #  array of shape (n, 3) of the bytes to send. If a lookup table from
+    #  get_encoding() is given, each channel is looked up in it instead
+    def form_pixel_array(self, rgb, table=None, rows=None):
+        rgb = numpy.asarray(rgb, dtype=numpy.uint32)
+        channels = numpy.column_stack(((rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF)).astype(int)
+        if table is not None:
+            return table[rows[:, numpy.newaxis], numpy.arange(3), channels]
+        pixels = channels.astype(numpy.uint8)
+        # Make sure we don't send a 0x01, which is the sync signal, or 255
+        pixels[pixels == 1] = 2
+        pixels[pixels == 255] = 254
+        return pixels
+
 
 class SerialOutput(FormattedByteOutput):
     def __init__(self, config):
@@ -529,7 +691,7 @@ class SerialOutput(FormattedByteOutput):
         formatted_data = self.format_data(canvas)
 
         # Add the sync pulse
-        formatted_data += chr(1)
+        formatted_data += b"\x01"
         # Send all the data
         self.serial_port.write(formatted_data)
 
@@ -537,6 +699,287 @@ class SerialOutput(FormattedByteOutput):
         pass
 
 
+class AddressedSerialOutput(SerialOutput):
+    """
+    Sends the floor to a chain of modules as a packet for each one, rather
+    than one long stream of bytes that every module counts its way through.
+    Each packet is
+
+        0xFF, module id, then the RGB bytes for that module's 48 pixels
+
+    and only modules that have changed are sent, apart from once every
+    KEEPALIVE_INTERVAL so that they don't give up and start cycling colours.
+    Neither 0xFF nor 0x01 can appear in the pixel data, so a module can always
+    find the start of the next packet.
+
+    Module ids are given out by the modules themselves: a packet to module 0
+    holds a single byte, the first id, which each module takes for itself and
+    passes on one higher. This is sent every ENUMERATE_INTERVAL, so that a
+    module that has been reset gets its id back. The ids follow the order of
+    the modules in the layout, so several of these outputs can drive a floor
+    split across buses, each given the list of module numbers on its bus.
+    """
+    logger = logging.getLogger(__name__)
+
+    CMD_MODULE_DATA = 0xFF
+    ENUMERATE_ADDRESS = 0
+    FIRST_MODULE_ID = 2
+    # Ids go up to 253, so that no module passes on an id of 0xFF
+    MAX_MODULES = 252
+    # The firmware has room for this many pixels per module
+    MODULE_PIXELS = 48
+
+    # In ms
+    KEEPALIVE_INTERVAL = 500
+    ENUMERATE_INTERVAL = 5000
+
+    def __init__(self, config):
+        super(AddressedSerialOutput, self).__init__(config)
+        # The module numbers on this bus, or None for all of them
+        self.bus_modules = None
+        if "modules" in config:
+            self.bus_modules = list(config["modules"])
+        # A list of (module id, first byte, last byte) for each module
+        self.modules = []
+        # When each module was last sent anything, and what
+        self.last_sent = dict()
+        self.last_data = dict()
+        self.last_enumerated = None
+
+    def set_output_layout(self, layout):
+        converter = []
+        self.modules = []
+        self.last_sent = dict()
+        self.last_data = dict()
+        data_offset = 0
+        for (module, positions) in layout.get_module_converters():
+            if self.bus_modules is not None and module not in self.bus_modules:
+                continue
+            if len(self.modules) >= self.MAX_MODULES:
+                self.logger.error("Too many modules on one bus, module %s will not be sent anything" % module)
+                continue
+            if len(positions) != self.MODULE_PIXELS:
+                self.logger.warn("Module %s has %d pixels, the firmware expects %d" %
+                                 (module, len(positions), self.MODULE_PIXELS))
+            module_id = self.FIRST_MODULE_ID + len(self.modules)
+            self.modules.append((module_id, data_offset, data_offset + 3 * len(positions)))
+            data_offset += 3 * len(positions)
+            converter.append(positions)
+            self.logger.info("Module %s is id %d" % (module, module_id))
+        if len(converter) > 0:
+            self.set_output_converter(numpy.concatenate(converter))
+        else:
+            self.set_output_converter(numpy.zeros((0, 2), dtype=int))
+        self.last_enumerated = None
+
+    # Modules that are due a keepalive, or to be enumerated, are sent them
+    #  even when the frame hasn't changed
+    def needs_refresh(self):
+        if super(AddressedSerialOutput, self).needs_refresh():
+            return True
+        ticks = pygame.time.get_ticks()
+        if self.last_enumerated is None or ticks - self.last_enumerated >= self.ENUMERATE_INTERVAL:
+            return True
+        for (module_id, start, end) in self.modules:
+            last_sent = self.last_sent.get(module_id)
+            if last_sent is None or ticks - last_sent >= self.KEEPALIVE_INTERVAL:
+                return True
+        return False
+
+    def send_data(self, canvas):
+        ticks = pygame.time.get_ticks()
+
+        if self.last_enumerated is None or ticks - self.last_enumerated >= self.ENUMERATE_INTERVAL:
+            self.serial_port.write(bytes(bytearray([self.CMD_MODULE_DATA, self.ENUMERATE_ADDRESS,
+                                                    self.FIRST_MODULE_ID])))
+            self.last_enumerated = ticks
+
+        formatted_data = self.format_data(canvas)
+
+        # Only send the modules that have changed, or haven't been sent
+        #  anything in a while. This goes by the bytes rather than the canvas,
+        #  as a module can also be turned up or down by the power limiter
+        packets = []
+        for (module_id, start, end) in self.modules:
+            module_data = formatted_data[start:end]
+            last_sent = self.last_sent.get(module_id)
+            if last_sent is None or ticks - last_sent >= self.KEEPALIVE_INTERVAL or \
+                    module_data != self.last_data.get(module_id):
+                packets.append(bytes(bytearray([self.CMD_MODULE_DATA, module_id])) + module_data)
+                self.last_sent[module_id] = ticks
+                self.last_data[module_id] = module_data
+
+        if len(packets) > 0:
+            self.serial_port.write(b"".join(packets))
+
+
+class UdpOutput(FormattedByteOutput):
+    """
+    Sends the floor over the network to LED controllers, in the same order
+    as the serial output, as either DDP packets or Art-Net DMX universes.
+    The config can have
+
+        protocol    ddp (the default) or artnet
+        host        where to send it, which can be a broadcast address
+        port        defaults to the standard port for the protocol
+        broadcast   True to allow sending to a broadcast address
+        universe    the first Art-Net universe, the rest follow on from it
+
+    Every packet for a frame is sent in one go. Art-Net frames end with an
+    ArtSync, so that controllers that support it show all the universes at
+    the same time.
+    """
+    logger = logging.getLogger(__name__)
+
+    # Network controllers don't need the serial protocol's bytes kept clear
+    ESCAPE_BYTES = False
+
+    DDP_PORT = 4048
+    DDP_VERSION = 0x40
+    DDP_PUSH = 0x01
+    DDP_TYPE_RGB = 0x0B
+    DDP_DEVICE = 1
+    # 480 pixels per packet keeps it inside an ethernet frame
+    DDP_MAX_DATA = 1440
+
+    ARTNET_PORT = 6454
+    ARTNET_HEADER = b"Art-Net\x00"
+    ARTNET_OP_DMX = 0x5000
+    ARTNET_OP_SYNC = 0x5200
+    ARTNET_VERSION = 14
+    # 170 whole pixels per universe
+    ARTNET_MAX_DATA = 510
+
+    def __init__(self, config):
+        super(UdpOutput, self).__init__()
+        self.protocol = config.get("protocol", "ddp")
+        if self.protocol not in ["ddp", "artnet"]:
+            self.logger.error("Unknown UDP protocol '%s', using ddp" % self.protocol)
+            self.protocol = "ddp"
+        default_port = self.DDP_PORT if self.protocol == "ddp" else self.ARTNET_PORT
+        host = config.get("host", "255.255.255.255")
+        port = int(config.get("port", default_port))
+        broadcast = config.get("broadcast", host.endswith(".255"))
+        self.universe = int(config.get("universe", 0))
+        self.sequence = 0
+        self.logger.info("Sending %s to %s:%d" % (self.protocol, host, port))
+        self.sender = PacketSender(host, port, broadcast)
+
+    def send_data(self, canvas):
+        formatted_data = self.format_data(canvas)
+        if self.protocol == "ddp":
+            packets = self.get_ddp_packets(formatted_data)
+        else:
+            packets = self.get_artnet_packets(formatted_data)
+        self.sender.send(packets)
+
+    def get_ddp_packets(self, data):
+        # DDP sequence numbers go from 1 to 15
+        self.sequence = self.sequence % 15 + 1
+        packets = []
+        for offset in range(0, max(len(data), 1), self.DDP_MAX_DATA):
+            chunk = data[offset:offset + self.DDP_MAX_DATA]
+            flags = self.DDP_VERSION
+            # Tell the controller to show the frame with the last packet
+            if offset + self.DDP_MAX_DATA >= len(data):
+                flags |= self.DDP_PUSH
+            header = struct.pack(">BBBBIH", flags, self.sequence, self.DDP_TYPE_RGB, self.DDP_DEVICE,
+                                 offset, len(chunk))
+            packets.append(header + chunk)
+        return packets
+
+    def get_artnet_packets(self, data):
+        # Art-Net sequence numbers go from 1 to 255
+        self.sequence = self.sequence % 255 + 1
+        packets = []
+        for (index, offset) in enumerate(range(0, max(len(data), 1), self.ARTNET_MAX_DATA)):
+            chunk = data[offset:offset + self.ARTNET_MAX_DATA]
+            # The length has to be even
+            if len(chunk) % 2 == 1:
+                chunk += b"\x00"
+            universe = self.universe + index
+            header = self.ARTNET_HEADER + struct.pack("<HBBBBBB", self.ARTNET_OP_DMX, 0, self.ARTNET_VERSION,
+                                                      self.sequence, 0, universe & 0xFF, (universe >> 8) & 0x7F)
+            packets.append(header + struct.pack(">H", len(chunk)) + chunk)
+        packets.append(self.ARTNET_HEADER + struct.pack("<HBBBB", self.ARTNET_OP_SYNC, 0, self.ARTNET_VERSION, 0, 0))
+        return packets
+
+    def clear(self):
+        pass
+
+
+class PreviewOutput(Output):
+    """
+    Shows what is on the floor in a web browser, for when there is no gui,
+    e.g. at http://localhost:8081/. The config can have
+
+        host    the address to listen on, all of them by default
+        port    defaults to 8081
+        rate    the most frames a second that are sent to viewers
+        scale   how many pixels across each cell of the floor is
+
+    All that is done here is to take a copy of the frame. The images are
+    made and sent by a PreviewServer on threads of its own.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, config):
+        super(PreviewOutput, self).__init__()
+        self.server = PreviewServer(config.get("host", "0.0.0.0"),
+                                    int(config.get("port", PreviewServer.DEFAULT_PORT)),
+                                    float(config.get("rate", PreviewServer.DEFAULT_RATE)),
+                                    int(config.get("scale", PreviewServer.DEFAULT_SCALE)))
+        self.server.start()
+
+    def send_data(self, canvas):
+        self.server.put_frame(canvas.get_canvas_array().copy())
+
+    def clear(self):
+        pass
+
+
+class RecorderOutput(Output):
+    """
+    Records what is shown on the floor to a file, which can be played back
+    with --replay. The config has
+
+        file    where to record to, which can include time.strftime()
+                codes, e.g. recordings/%Y%m%d-%H%M%S.rec
+
+    Frames are recorded as the raw colours of the pixels, in the order
+    they are sent to the floor, before any filters or calibration.
+    Only frames that were sent are recorded, so a still floor takes up
+    very little room.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_FILE = "ddrpi-%Y%m%d-%H%M%S.rec"
+
+    def __init__(self, config):
+        super(RecorderOutput, self).__init__()
+        self.path = time.strftime(config.get("file", self.DEFAULT_FILE))
+        self.recorder = None
+        self.xs = None
+        self.ys = None
+
+    def set_output_layout(self, layout):
+        self.close()
+        positions = layout.get_converter()
+        self.xs = positions[:, 0]
+        self.ys = positions[:, 1]
+        self.recorder = FrameRecorder(self.path, positions, (layout.size_x, layout.size_y))
+
+    def send_data(self, canvas):
+        if self.recorder is not None:
+            # Picking out the pixels makes a copy that is the recorder's to keep
+            self.recorder.add_frame(pygame.time.get_ticks(), canvas.get_canvas_array()[self.xs, self.ys])
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+
 class PipeOutput(FormattedByteOutput):
     # This is similar, if not identical to the SerialOutput
     # class as it's intended use is for replicating the
@@ -558,9 +1001,9 @@ class PipeOutput(FormattedByteOutput):
         formatted_data = self.format_data(canvas)
         if self.pipe is not None:
             s = ""
-            # Take every character in the string and convert it to a hex value
-            for i in formatted_data:
-                v = hex(ord(i))[2:]
+            # Take every byte and convert it to a hex value
+            for i in bytearray(formatted_data):
+                v = hex(i)[2:]
                 if len(v) < 2:
                     s += "'\\x0%s'" % v
                 else:
@@ -0,0 +1,142 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+import numpy
+
+from lib.floorcanvas import CanvasLayer
+
+
+class ParticleSystem(object):
+    """
+    A fixed number of particle slots, with everything about each particle
+    held in one numpy array per property rather than one object per particle,
+    so that moving, ageing and drawing all of them is a handful of array
+    operations no matter how many there are.
+
+    Positions and velocities are in canvas pixels and pixels per second,
+    ages and lifetimes are in seconds and colours are (R,G,B) in 0-255.
+    A particle that is emitted with a delay has a negative age, and doesn't
+    move or get drawn until its age reaches zero.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, capacity, gravity=(0.0, 0.0), fade=1.0):
+        self.capacity = capacity
+        # Acceleration applied to every live particle, in pixels/s/s
+        self.gravity = numpy.array(gravity, dtype=numpy.float32)
+        # Brightness is (1 - age/lifetime) ** fade, so higher values fade out quicker
+        self.fade = fade
+
+        self.position = numpy.zeros((capacity, 2), dtype=numpy.float32)
+        self.velocity = numpy.zeros((capacity, 2), dtype=numpy.float32)
+        self.colour = numpy.zeros((capacity, 3), dtype=numpy.float32)
+        self.age = numpy.zeros(capacity, dtype=numpy.float32)
+        self.lifetime = numpy.ones(capacity, dtype=numpy.float32)
+        # Velocity is multiplied by exp(-drag * dt) each update
+        self.drag = numpy.zeros(capacity, dtype=numpy.float32)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+
+    def count(self):
+        return int(numpy.count_nonzero(self.alive))
+
+    def clear(self):
+        self.alive[:] = False
+
+    def emit(self, count, position, velocity=(0.0, 0.0), colour=(0xFF, 0xFF, 0xFF), lifetime=1.0, drag=0.0,
+             delay=0.0):
+        """
+        Start up to 'count' new particles in free slots and return the indices
+        of the slots used. Each of the properties can either be a single value
+        for all of them, or an array with one entry per particle. If there
+        aren't enough free slots, as many as will fit are emitted
+        """
+        slots = numpy.flatnonzero(~self.alive)[:count]
+        used = len(slots)
+        if used < count:
+            self.logger.debug("Particle system full, only emitted %d of %d" % (used, count))
+        if used == 0:
+            return slots
+
+        self.position[slots] = self.__take(position, used, 2)
+        self.velocity[slots] = self.__take(velocity, used, 2)
+        self.colour[slots] = self.__take(colour, used, 2)
+        self.lifetime[slots] = self.__take(lifetime, used, 1)
+        self.drag[slots] = self.__take(drag, used, 1)
+        self.age[slots] = -self.__take(delay, used, 1)
+        self.alive[slots] = True
+        return slots
+
+    # A property given with one entry per particle (ndim dimensions, e.g. an
+    #  (n, 2) array of positions) is cut down to the number we are actually
+    #  emitting, anything else is a single value broadcast to all of them
+    @staticmethod
+    def __take(value, used, ndim):
+        value = numpy.asarray(value, dtype=numpy.float32)
+        if value.ndim == ndim:
+            return value[:used]
+        return value
+
+    def update(self, dt):
+        """
+        Move all of the live particles on by dt seconds. Returns the indices of
+        the particles that reached the end of their lifetime in this update, so
+        that their position and colour can still be read before the slots are
+        reused
+        """
+        self.age[self.alive] += dt
+        moving = self.alive & (self.age >= 0)
+
+        self.position[moving] += self.velocity[moving] * dt
+        self.velocity[moving] += self.gravity * dt
+        self.velocity[moving] *= numpy.exp(-self.drag[moving] * dt)[:, numpy.newaxis]
+
+        expired = numpy.flatnonzero(self.alive & (self.age >= self.lifetime))
+        self.alive[expired] = False
+        return expired
+
+    def brightness(self, indices):
+        remaining = 1.0 - self.age[indices] / numpy.maximum(self.lifetime[indices], 1e-6)
+        return numpy.clip(remaining, 0.0, 1.0) ** self.fade
+
+    def splat(self, canvas):
+        """
+        Add every visible particle onto the canvas (or a canvas layer). Each
+        one is spread over the four pixels around its position in proportion
+        to how close it is to each, so particles move smoothly between pixels
+        rather than jumping, and overlapping particles add up. Only the
+        pixels the particles land on are changed, so on a layer everything
+        else is left as transparent as it was
+        """
+        visible = numpy.flatnonzero(self.alive & (self.age >= 0))
+        if len(visible) == 0:
+            return canvas
+
+        (width, height) = canvas.get_size()
+        colours = self.colour[visible] * self.brightness(visible)[:, numpy.newaxis]
+
+        # Centre of pixel (x,y) is at (x,y), so find the pixel up and to the
+        #  left of each particle, and how far across it the particle is
+        position = self.position[visible]
+        corner = numpy.floor(position)
+        fraction = position - corner
+        corner = corner.astype(int)
+
+        accumulated = canvas.get_rgb_array().astype(numpy.float32)
+        if isinstance(canvas, CanvasLayer):
+            # Add to what can be seen of the layer, which is then opaque
+            accumulated *= canvas.get_alpha_array()[:, :, numpy.newaxis]
+        touched = numpy.zeros((width, height), dtype=bool)
+        for (dx, dy) in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            xs = corner[:, 0] + dx
+            ys = corner[:, 1] + dy
+            weight = (fraction[:, 0] if dx else 1.0 - fraction[:, 0]) * \
+                     (fraction[:, 1] if dy else 1.0 - fraction[:, 1])
+            on_canvas = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            numpy.add.at(accumulated, (xs[on_canvas], ys[on_canvas]),
+                         colours[on_canvas] * weight[on_canvas][:, numpy.newaxis])
+            touched[xs[on_canvas], ys[on_canvas]] = True
+
+        (xs, ys) = numpy.nonzero(touched)
+        canvas.set_rgb_pixels(xs, ys, numpy.clip(accumulated[xs, ys], 0, 255).astype(numpy.uint8))
+        return canvas
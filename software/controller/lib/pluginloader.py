@@ -0,0 +1,194 @@
+__authors__ = ['Andrew Taylor']
+
+import ast
+import imp
+import json
+import logging
+import os
+import threading
+
+
+class PluginManifest(object):
+    """
+    Finds the plugins in a set of directories without importing them, by
+    reading the class definitions out of each file's syntax tree. What was
+    found in each file is cached on disk along with its modification time and
+    size, so on the next start only the files that have changed are parsed.
+
+    A plugin is a class defined at the top level of a module, whose name ends
+    in "Plugin". Each one is returned as a LazyPlugin, which only imports its
+    module when the plugin is first created.
+    """
+    logger = logging.getLogger(__name__)
+
+    # Bump this if what is stored for each file changes
+    VERSION = 1
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        # Keyed on the file path, each entry has the file's mtime and size,
+        #  and a dict of the plugin class names in it to their base class names
+        self.files = dict()
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.files = data["files"]
+        except (IOError, OSError, ValueError, KeyError, AttributeError) as e:
+            self.logger.warn("Ignoring unreadable plugin manifest %s: %s" % (self.cache_file, e))
+        return None
+
+    def save(self):
+        if self.cache_file is None or not self.changed:
+            return None
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump({"version": self.VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+            self.changed = False
+        except (IOError, OSError) as e:
+            self.logger.warn("Unable to save plugin manifest %s: %s" % (self.cache_file, e))
+        return None
+
+    def scan(self, plugin_dir):
+        """
+        Return a dict of LazyPlugins for every plugin found under plugin_dir,
+        keyed on the class name. Files that can't be parsed are logged and
+        skipped, rather than stopping the rest from loading
+        """
+        plugins = dict()
+        # Recursively search the given directory for .py files which
+        #  aren't commented out (start with __)
+        for root, dirs, files in os.walk(plugin_dir):
+            for fname in sorted(files):
+                if fname.endswith(".py") and not fname.startswith("__"):
+                    plugins.update(self.scan_file(os.path.join(root, fname)))
+        return plugins
+
+    # The LazyPlugins for the plugins in one file, keyed on the class name.
+    #  These are new each time, so a file that has changed since the last
+    #  scan is imported again when its plugins are next created
+    def scan_file(self, fpath):
+        plugins = dict()
+        # Remove the .py from the end
+        module_name = os.path.basename(fpath).split('.', 1)[0]
+        for class_name, bases in self.get_classes(fpath).items():
+            plugins[class_name] = LazyPlugin(class_name, module_name, fpath, bases, self)
+        return plugins
+
+    # The plugin classes in the given file, parsed again only if it has
+    #  changed since the manifest was last saved
+    def get_classes(self, fpath):
+        try:
+            stat = os.stat(fpath)
+        except OSError as e:
+            self.logger.warn("Unable to read %s: %s" % (fpath, e))
+            if self.files.pop(fpath, None) is not None:
+                self.changed = True
+            return dict()
+        entry = self.files.get(fpath)
+        if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return entry["classes"]
+
+        self.logger.info("Parsing %s for plugins" % fpath)
+        try:
+            with open(fpath) as f:
+                tree = ast.parse(f.read(), fpath)
+        except (IOError, SyntaxError, ValueError, TypeError) as e:
+            self.logger.warn("Skipping plugins in %s, it can't be parsed: %s" % (fpath, e))
+            return dict()
+
+        classes = dict()
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name.endswith("Plugin"):
+                classes[node.name] = [self.get_base_name(base) for base in node.bases]
+        self.files[fpath] = {"mtime": stat.st_mtime, "size": stat.st_size, "classes": classes}
+        self.changed = True
+        return classes
+
+    # The last part of a base class name, e.g. "VisualisationPlugin" for both
+    #  VisualisationPlugin and somemodule.VisualisationPlugin
+    @staticmethod
+    def get_base_name(node):
+        if isinstance(node, ast.Name):
+            return node.id
+        elif isinstance(node, ast.Attribute):
+            return node.attr
+        return None
+
+    # Work out the base plugin type from the class names alone, following
+    #  plugins that extend other plugins through the manifest
+    def get_type(self, bases, seen=None):
+        if seen is None:
+            seen = set()
+        for base in bases:
+            if base in ("VisualisationPlugin", "GamePlugin"):
+                return base
+            if base is None or base in seen:
+                continue
+            seen.add(base)
+            for entry in self.files.values():
+                if base in entry["classes"]:
+                    found = self.get_type(entry["classes"][base], seen)
+                    if found is not None:
+                        return found
+        return None
+
+
+class LazyPlugin(object):
+    """
+    Stands in for a plugin class until the plugin is first created. Calling
+    it imports the module the class is defined in, and then creates an
+    instance of the class. If the import fails then the error is kept and
+    raised again on every call, without trying to import it again
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, class_name, module_name, module_path, bases, manifest=None):
+        self.__name__ = class_name
+        self.module_name = module_name
+        self.module_path = module_path
+        self.bases = bases
+        self.manifest = manifest
+        self.plugin_class = None
+        self.error = None
+        # Plugins can be created on the prewarming thread as well as the main one
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        return self.load_class()(*args, **kwargs)
+
+    def load_class(self):
+        with self.lock:
+            if self.plugin_class is not None:
+                return self.plugin_class
+            if self.error is not None:
+                raise self.error
+            self.logger.info("Importing %s from %s" % (self.__name__, self.module_path))
+            try:
+                module = imp.load_source(self.module_name, self.module_path)
+                plugin_class = getattr(module, self.__name__)
+            except Exception as e:
+                self.logger.warn("Unable to import %s from %s" % (self.__name__, self.module_path))
+                self.error = e
+                raise
+            self.plugin_class = plugin_class
+            return plugin_class
+
+    def is_loaded(self):
+        return self.plugin_class is not None
+
+    # "VisualisationPlugin" or "GamePlugin", without importing the module if
+    #  it hasn't been imported already. None if it can't be worked out
+    def get_type(self):
+        if self.manifest is not None:
+            return self.manifest.get_type(self.bases)
+        return None
+
+    def __repr__(self):
+        return "<LazyPlugin %s from %s>" % (self.__name__, self.module_path)
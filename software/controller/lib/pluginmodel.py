@@ -3,20 +3,33 @@ __authors__ = ['Andrew Taylor']
 import logging
 import yaml
 import os
+import gc
+import threading
 import pygame
 
 # For counting instances of output classes
 from itertools import count
+from collections import OrderedDict
 
 from VisualisationPlugin import VisualisationPlugin
 from GamePlugin import GamePlugin
+from lib.floorcanvas import FloorCanvas
+from lib.pluginloader import LazyPlugin
+from lib.sandbox import SandboxedPlugin
+from lib.transitions import Transition
 
 # from DDRPi import FloorCanvas
 
 class PluginModel(object):
     logger = logging.getLogger(__name__)
 
-    def __init__(self, surface_size):
+    def __init__(self, surface_size, memory_limit=None, sandbox=None):
+        # Plugins are only created when they are first needed, and idle ones
+        #  are thrown away again if we are using too much memory
+        self.instance_cache = PluginInstanceCache(memory_limit)
+        # Either True to run every plugin in a sandbox process of its own, or
+        #  a list of the names of the plugins that should be
+        self.sandbox = sandbox
         self.reset_model()
         self.surface_size = surface_size
         pass
@@ -24,6 +37,7 @@ class PluginModel(object):
     def reset_model(self):
         # Keep track of all the available plugin names and objects
         self.plugins = dict()
+        self.instance_cache.clear()
         self.playlists = []
         # All the plugins are add to a special PluginPlaylist that
         #  occupies the first slot. This should be displayed differently,
@@ -44,6 +58,7 @@ class PluginModel(object):
         for idx, plugin in enumerate(all_plugins.get_plugins()):
             if plugin.plugin_name == plugin_name:
                 self.logger.info("Starting requested plugin: %s at #%d" % (plugin_name, idx))
+                self._leave_current_playlist(all_plugins)
                 self.current_playlist = all_plugins
                 return all_plugins.start_plugin(idx)
         return None
@@ -53,6 +68,7 @@ class PluginModel(object):
     """
 
     def set_current_playlist_by_index(self, idx):
+        self._leave_current_playlist(self.playlists[idx])
         self.current_playlist = self.playlists[idx]
         self.current_playlist._reset_playlist_state()
         return self.current_playlist
@@ -60,6 +76,12 @@ class PluginModel(object):
     def get_current_playlist(self):
         return self.current_playlist
 
+    # The plugin that was running in the playlist we are leaving is now idle,
+    #  so it can be released if we need the memory
+    def _leave_current_playlist(self, new_playlist):
+        if self.current_playlist is not None and self.current_playlist is not new_playlist:
+            self.current_playlist.idle_current_plugin()
+
     #	def get_available_plugins(self, plugin_type=None):
     #		#TODO: Implement get_available_plugins()
     #		if (plugin_type is None):
@@ -110,6 +132,28 @@ class PluginModel(object):
         return len(self.playlists) -1
 
     def add_playlist_from_file(self, playlist_file):
+        playlist = self.load_playlist_from_file(playlist_file)
+        if playlist is None:
+            return None
+        return self.add_playlist(playlist)
+
+    """
+    Load the playlist file again, and update the playlist that was loaded
+     from it before with whatever has changed, see PluginPlaylist.update().
+     If the file has become unreadable then the old playlist is left as it is
+    """
+    def reload_playlist_from_file(self, playlist_file):
+        playlist = self.load_playlist_from_file(playlist_file)
+        if playlist is None:
+            return None
+        for idx, old_playlist in enumerate(self.playlists):
+            if old_playlist.playlist_file == playlist_file:
+                self.logger.info("Reloading playlist #%d from %s" % (old_playlist.playlist_number, playlist_file))
+                old_playlist.update(playlist)
+                return idx
+        return self.add_playlist(playlist)
+
+    def load_playlist_from_file(self, playlist_file):
         if not os.path.exists(playlist_file):
             self.logger.error("Unable to load playlist, it doesn't exist: %s" % playlist_file)
             return None
@@ -122,6 +166,26 @@ class PluginModel(object):
             return None
 
         playlist = PluginPlaylist(PluginPlaylist.USER)
+        playlist.playlist_file = playlist_file
+
+        # How many seconds before each plugin finishes to get the next one ready
+        try:
+            playlist.prewarm_time = int(1000 * float(data["prewarm_time"]))
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+
+        # How to move from one plugin to the next, and over how many seconds
+        try:
+            if data["transition"] in Transition.MODES:
+                playlist.transition_mode = data["transition"]
+            else:
+                self.logger.warn("Unknown transition %s in playlist %s" % (data["transition"], playlist_file))
+        except (AttributeError, KeyError, TypeError):
+            pass
+        try:
+            playlist.transition_time = int(1000 * float(data["transition_time"]))
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
 
         if "plugins" in data:
             playlist_entries = data["plugins"]
@@ -138,29 +202,55 @@ class PluginModel(object):
                     continue
                 details["obj"] = self.plugins[plugin_name]
                 details["size"] = self.surface_size
+                if "sandbox" not in details:
+                    details["sandbox"] = self.is_sandboxed(plugin_name)
                 self.logger.info("Adding plugin to playlist: %s" % details)
                 try:
-                    playlist.add_plugin(Plugin(plugin_name, self.plugins[plugin_name], details))
+                    playlist.add_plugin(Plugin(plugin_name, self.plugins[plugin_name], details, self.instance_cache))
                 except Exception as e:
                     self.logger.warn(e)
                     self.logger.warn("Failed to add %s found in playlist %s" % (plugin_name, playlist_file))
 
         self.logger.info("Created playlist of size %d" % playlist.get_size())
-        return self.add_playlist(playlist)
+        return playlist
 
     def add_plugin(self, plugin_name, plugin_object):
         self.logger.info("Adding plugin %s to the menu list" % plugin_name)
         self.plugins[plugin_name] = plugin_object
-        config = {"size": self.surface_size}
-        # This could throw an exception if the plugin cannot be configured (which
-        #  is done in __init__ of Plugin
+        config = {"size": self.surface_size, "sandbox": self.is_sandboxed(plugin_name)}
+        # The plugin isn't created or configured until it is first needed, so
+        #  a plugin that can't be configured will only show up then
         try:
-            self.all_plugins_playlist.add_plugin(Plugin(plugin_name, plugin_object, config))
+            self.all_plugins_playlist.add_plugin(Plugin(plugin_name, plugin_object, config, self.instance_cache))
         except Exception as e:
             self.logger.warn(e)
             self.logger.warn("Failed to add %s to the plugin model" % plugin_name)
         return None
 
+    """
+    Replace the class object for a plugin, e.g. once its module has changed,
+     and rebuild every playlist entry that uses it. A plugin that we haven't
+     seen before is added to the menu list
+    """
+    def reload_plugin(self, plugin_name, plugin_object):
+        if plugin_name not in self.plugins:
+            return self.add_plugin(plugin_name, plugin_object)
+        self.logger.info("Reloading plugin %s" % plugin_name)
+        self.plugins[plugin_name] = plugin_object
+        for playlist in self.playlists:
+            for plugin in playlist.get_plugins():
+                if plugin.plugin_name == plugin_name:
+                    plugin.set_plugin_object(plugin_object)
+        return None
+
+    def is_sandboxed(self, plugin_name):
+        if self.sandbox is True:
+            return True
+        try:
+            return plugin_name in self.sandbox
+        except TypeError:
+            return False
+
     def add_plugins(self, plugins):
         self.logger.info("%s" % plugins)
         for plugin_name in sorted(plugins.keys()):
@@ -189,12 +279,24 @@ class PluginPlaylist(object):
     states = ["STOPPED", "RUNNING", "PAUSED"]
     loop_modes = ["LOOP", "ONCE"]
 
+    # Milliseconds before the current plugin is due to finish that the next
+    #  one is created, configured and started in the background, so that
+    #  moving on to it doesn't hold up drawing frames. Nothing is got ready
+    #  early unless the playlist sets prewarm_time
+    DEFAULT_PREWARM_TIME = 0
+
+    # Milliseconds that it takes to transition from one plugin to the next.
+    #  There is no transition, just a cut, unless the playlist sets one
+    DEFAULT_TRANSITION_TIME = 1000
+
     logger = logging.getLogger(__name__)
 
     def __init__(self, playlist_type=1):
         self.plugins = []
         self.playlist_type = playlist_type
         self.playlist_number = next(self._ids)
+        # The file the playlist was loaded from, if it was
+        self.playlist_file = None
         self.logger.info("Creating playlist #%d", self.playlist_number)
         self._reset_playlist_state()
 
@@ -208,6 +310,15 @@ class PluginPlaylist(object):
 
         self.loop_mode = "LOOP"
 
+        self.prewarm_time = self.DEFAULT_PREWARM_TIME
+        self.prewarm_thread = None
+        self.prewarm_index = None
+
+        # One of Transition.MODES, or None to cut straight to the next plugin
+        self.transition_mode = None
+        self.transition_time = self.DEFAULT_TRANSITION_TIME
+        self.transition = None
+
         pass
 
     def _reset_playlist_state(self):
@@ -218,6 +329,72 @@ class PluginPlaylist(object):
         self.plugins.append(plugin)
         return len(self.plugins)-1
 
+    # Config keys that only matter to the playlist, so a change to them
+    #  doesn't need the plugin to be created again
+    PLAYLIST_KEYS = ["duration"]
+
+    """
+    Take on the settings and entries of the same playlist loaded again, e.g.
+     after its file has changed. Entries that are the same as before, apart
+     from their duration, keep their Plugin, and its instance, so the plugin
+     that is running carries on undisturbed. Only the entries that are new
+     or changed use the Plugins from the new playlist, and the old Plugins
+     that are left over are released. If the running plugin was one of
+     those then whatever is now in its place is started
+    """
+    def update(self, playlist):
+        self.prewarm_time = playlist.prewarm_time
+        self.transition_mode = playlist.transition_mode
+        self.transition_time = playlist.transition_time
+        self.finish_prewarm()
+
+        current_plugin = None
+        if 0 <= self.current_position < len(self.plugins):
+            current_plugin = self.plugins[self.current_position]
+
+        left_over = list(self.plugins)
+        plugins = []
+        kept_count = 0
+        for new_plugin in playlist.get_plugins():
+            kept = None
+            for old_plugin in left_over:
+                if old_plugin.plugin_name == new_plugin.plugin_name and \
+                        self.get_plugin_config(old_plugin) == self.get_plugin_config(new_plugin):
+                    kept = old_plugin
+                    break
+            if kept is None:
+                plugins.append(new_plugin)
+            else:
+                left_over.remove(kept)
+                kept_count += 1
+                kept.config = new_plugin.config
+                plugins.append(kept)
+        self.logger.info("Kept %d of %d plugins in playlist #%d" % (kept_count, len(plugins), self.playlist_number))
+        self.plugins = plugins
+
+        if self.transition is not None and self.transition.outgoing in left_over:
+            self.transition = None
+        if current_plugin in plugins:
+            self.current_position = plugins.index(current_plugin)
+        elif current_plugin is not None:
+            position = self.current_position
+            self.current_position = -1
+            if len(plugins) > 0:
+                self.start_plugin(min(position, len(plugins) - 1))
+        else:
+            self.current_position = min(self.current_position, len(plugins) - 1)
+
+        for plugin in left_over:
+            plugin.idle()
+            plugin.release()
+        return None
+
+    def get_plugin_config(self, plugin):
+        try:
+            return dict((key, value) for (key, value) in plugin.config.items() if key not in self.PLAYLIST_KEYS)
+        except AttributeError:
+            return plugin.config
+
     # Two sets of access methods.
     # 1: For when the playlist is running, and handles moving between
     #  the plugins.
@@ -245,7 +422,11 @@ class PluginPlaylist(object):
                 if self.loop_mode == "LOOP" or self.current_position < len(self.plugins) - 1:
                     if plugin_duration_so_far > plugin_duration:
                         self.logger.info("Plugin has exceeded intended duration")
+                        outgoing_plugin = current_plugin
                         current_plugin = self.next()
+                        self.start_transition(outgoing_plugin, current_plugin)
+                    elif plugin_duration_so_far > plugin_duration - self.prewarm_time:
+                        self.prewarm(self.get_next_index())
                 else:
                     pass
 
@@ -267,19 +448,92 @@ class PluginPlaylist(object):
         #  is only one. Leave it running so that it isn't
         #  continually reconfigured and restarted
         if len(self.plugins) > 0:
-            self.current_position += 1
-            if self.current_position >= len(self.plugins):
-                self.current_position = 0
+            self.current_position = self.get_next_index()
 
             self.logger.info("We need to start a new plugin")
             current_plugin = self.start_plugin(self.current_position)
 
         return current_plugin
 
+    def get_next_index(self):
+        next_index = self.current_position + 1
+        if next_index >= len(self.plugins):
+            next_index = 0
+        return next_index
+
+    """
+    Get the plugin at the given index ready to go on a background thread, if
+     it isn't already. The plugin that is running now can't be prewarmed,
+     which is the case if it is the only one in the playlist
+    """
+    def prewarm(self, index):
+        if self.prewarm_index == index or index == self.current_position:
+            return None
+        self.finish_prewarm()
+        self.logger.info("Prewarming plugin #%d" % index)
+        self.prewarm_index = index
+        # If there is going to be a transition then the first frame is drawn
+        #  now as well, so the transition doesn't have to draw two from scratch
+        self.prewarm_thread = threading.Thread(target=self.plugins[index].prewarm,
+                                               args=(self.transition_mode is not None,))
+        self.prewarm_thread.daemon = True
+        self.prewarm_thread.start()
+        return None
+
+    """
+    Wait for any prewarming that is going on to finish, and then undo it
+     unless it was for the plugin at keep_index
+    """
+    def finish_prewarm(self, keep_index=None):
+        if self.prewarm_thread is not None:
+            self.prewarm_thread.join()
+            self.prewarm_thread = None
+        if self.prewarm_index is not None and self.prewarm_index != keep_index:
+            self.plugins[self.prewarm_index].cancel_prewarm()
+        self.prewarm_index = None
+        return None
+
+    """
+    Start blending from the outgoing plugin to the incoming one, if this
+     playlist has a transition
+    """
+    def start_transition(self, outgoing, incoming):
+        if self.transition_mode is None or outgoing is incoming:
+            return None
+        self.transition = Transition(self.transition_mode, self.transition_time, outgoing)
+        # It is still drawing while it fades out, so it mustn't be released
+        outgoing.active = True
+        return None
+
+    """
+    The transition that is in progress, or None if there isn't one
+    """
+    def get_transition(self):
+        if self.transition is not None and self.transition.is_finished():
+            self.end_transition()
+        return self.transition
+
+    def end_transition(self):
+        if self.transition is not None:
+            if self.transition.outgoing is not self.plugins[self.current_position]:
+                self.transition.outgoing.idle()
+            self.transition = None
+        return None
+
     def start_plugin(self, index):
         self.logger.info("start_plugin(%d)" % (index))
         new_plugin = self.plugins[index]
 
+        # If this is the plugin we have been getting ready then it has already
+        #  been reset and started, so switching to it is all that's left
+        self.finish_prewarm(index)
+        self.end_transition()
+
+        # Whatever was running before is now idle
+        if 0 <= self.current_position < len(self.plugins):
+            if self.plugins[self.current_position] is not new_plugin:
+                self.plugins[self.current_position].idle()
+
         # The plugin may not have been re-created, so
         #  we need to reset it
         new_plugin.reset()
@@ -314,6 +568,12 @@ class PluginPlaylist(object):
     def is_running(self):
         return (self.state == "RUNNING")
 
+    def idle_current_plugin(self):
+        self.finish_prewarm()
+        self.end_transition()
+        if 0 <= self.current_position < len(self.plugins):
+            self.plugins[self.current_position].idle()
+
     # Playlist interrogation methods
     def get_plugins(self):
         # Sort the plugins by plugin name
@@ -388,25 +648,193 @@ class Plugin(object):
 
     DEFAULT_DURATION = 5000
 
-    def __init__(self, plugin_name, plugin_object, config=None):
+    def __init__(self, plugin_name, plugin_object, config=None, instance_cache=None):
         self.plugin_name = plugin_name
         self.plugin_object = plugin_object
-        self.instance = plugin_object()
-        self.configure(config)
+        self.config = config
+        self.instance_cache = instance_cache
+        # The plugin object itself is only created the first time it is
+        #  needed, i.e. when it is started or its splash screen is drawn
+        self._instance = None
+        # Set if the last attempt to create the plugin failed
+        self.failed = False
+        # Set when the plugin has just been created and configured, so
+        #  there is no need to configure it again when it is started
+        self.freshly_configured = False
+        # Set while the plugin is the one running, so it won't be released
+        self.active = False
+        # Set when the plugin has been reset and started in the background,
+        #  ready for the playlist to switch to it
+        self.prewarmed = False
+        # The first frame, if one was drawn while the plugin was prewarmed
+        self.prewarmed_frame = None
+        # The plugin can be created and prewarmed on a background thread
+        self.lock = threading.RLock()
         pass
 
+    """
+    The plugin object, which is created and configured if it doesn't exist
+     yet. This is None if the plugin couldn't be created
+    """
+    @property
+    def instance(self):
+        if self._instance is None:
+            self.load()
+        elif self.instance_cache is not None:
+            self.instance_cache.touch(self)
+        return self._instance
+
+    def load(self):
+        with self.lock:
+            # It may have been created while we were waiting for the lock
+            if self._instance is not None:
+                return self._instance
+            self.logger.info("Creating plugin %s" % self.plugin_name)
+            try:
+                if self.is_sandboxed():
+                    instance = SandboxedPlugin(self.plugin_object)
+                else:
+                    instance = self.plugin_object()
+                instance.configure(self.config)
+            except Exception as e:
+                self.logger.warn(e)
+                self.logger.warn("Failed to create and configure %s" % self.plugin_name)
+                self.failed = True
+                return None
+            self.failed = False
+            self.freshly_configured = True
+            self._instance = instance
+        if self.instance_cache is not None:
+            self.instance_cache.add(self)
+        return instance
+
+    """
+    Throw away the plugin object, it will be created again if it is needed
+    """
+    def release(self):
+        if self._instance is None:
+            return None
+        self.logger.info("Releasing plugin %s" % self.plugin_name)
+        try:
+            self._instance.stop()
+        except Exception as e:
+            self.logger.warn(e)
+        self._instance = None
+        self.freshly_configured = False
+        self.prewarmed = False
+        self.prewarmed_frame = None
+        if self.instance_cache is not None:
+            self.instance_cache.remove(self)
+        return None
+
+    def is_loaded(self):
+        return self._instance is not None
+
+    # Whether the plugin is to be run in a process of its own
+    def is_sandboxed(self):
+        try:
+            return self.config["sandbox"] is True
+        except (TypeError, KeyError):
+            return False
+
+    """
+    Swap in a new class object for the plugin. The old plugin object is
+     thrown away, and if it was running then a new one is started straight
+     away in its place
+    """
+    def set_plugin_object(self, plugin_object):
+        with self.lock:
+            restart = self.active and not self.prewarmed and self._instance is not None
+            self.release()
+            self.plugin_object = plugin_object
+            self.failed = False
+            if restart:
+                self.reset()
+                self.start()
+        return None
+
     def configure(self, config):
         self.config = config
-        self.instance.configure(self.config)
+        if self._instance is not None:
+            self._instance.configure(self.config)
         return None
 
     def reset(self):
-        if self.config is not None:
-            self.instance.configure(self.config)
+        if self.prewarmed:
+            return None
+        instance = self.instance
+        if self.freshly_configured:
+            self.freshly_configured = False
+        elif instance is not None and self.config is not None:
+            instance.configure(self.config)
         return None
 
     def start(self):
-        self.instance.start()
+        self.active = True
+        if self.prewarmed:
+            self.prewarmed = False
+            return None
+        instance = self.instance
+        if instance is not None:
+            instance.start()
+        return None
+
+    """
+    Reset and start the plugin ahead of it being needed, so that when the
+     playlist gets to it, reset() and start() have nothing left to do, and
+     optionally draw its first frame too. This is run on a background thread
+    """
+    def prewarm(self, draw_first_frame=False):
+        with self.lock:
+            try:
+                self.reset()
+                self.start()
+                self.prewarmed = True
+                if draw_first_frame:
+                    self.prewarmed_frame = self.draw_first_frame()
+            except Exception as e:
+                self.logger.warn(e)
+                self.logger.warn("Failed to prewarm %s" % self.plugin_name)
+                self.active = False
+        return None
+
+    def draw_first_frame(self):
+        instance = self.instance
+        if instance is None or self.config is None or "size" not in self.config:
+            return None
+        (width, height) = self.config["size"]
+        return instance.draw_frame(FloorCanvas(width, height))
+
+    """
+    Put the frame drawn while the plugin was prewarmed onto the canvas,
+     along with any layers the plugin made. Returns the canvas, or None if
+     there is no frame, in which case the plugin needs to draw it as usual
+    """
+    def take_prewarmed_frame(self, canvas):
+        frame = self.prewarmed_frame
+        self.prewarmed_frame = None
+        if frame is None or frame.get_size() != canvas.get_size():
+            return None
+        canvas.set_packed_array(frame.get_canvas_array())
+        canvas.layers = frame.layers
+        return canvas
+
+    """
+    Stop a plugin that was prewarmed, but was then not switched to
+    """
+    def cancel_prewarm(self):
+        with self.lock:
+            self.prewarmed_frame = None
+            if self.prewarmed:
+                self.prewarmed = False
+                self.active = False
+                if self._instance is not None:
+                    self._instance.stop()
+        return None
+
+    def idle(self):
+        self.active = False
+        self.prewarmed_frame = None
         return None
 
     def get_duration(self):
@@ -422,9 +850,20 @@ class Plugin(object):
         return duration
 
     def get_type(self):
-        if isinstance(self.instance, VisualisationPlugin):
+        # This doesn't need the plugin to have been created, or even imported
+        plugin_class = self.plugin_object
+        if isinstance(plugin_class, LazyPlugin):
+            if not plugin_class.is_loaded():
+                plugin_type = plugin_class.get_type()
+                if plugin_type is not None:
+                    return plugin_type
+            try:
+                plugin_class = plugin_class.load_class()
+            except Exception:
+                return "UnknownPlugin"
+        if issubclass(plugin_class, VisualisationPlugin):
             return "VisualisationPlugin"
-        elif isinstance(self.instance, GamePlugin):
+        elif issubclass(plugin_class, GamePlugin):
             return "GamePlugin"
         else:
             return "UnknownPlugin"
@@ -438,11 +877,78 @@ class Plugin(object):
     def get_plugin_type(self):
         pass
 
+    # The plugin may be being prewarmed on another thread, so wait for that
+    #  to finish rather than use the same instance at the same time
     def draw_splash(self, canvas):
-        if self.instance is not None:
-            return self.instance.draw_splash(canvas)
+        with self.lock:
+            instance = self.instance
+            if instance is not None:
+                self.freshly_configured = False
+                return instance.draw_splash(canvas)
         return None
 
     def __str__(self):
         return "%s - %s" % (self.get_type(), self.plugin_name)
 
+
+class PluginInstanceCache(object):
+    """
+    Keeps track of which plugins have been created, least recently used first,
+    and releases the least recently used idle ones whenever the process is
+    using more memory than the limit. The plugin that is running is never
+    released
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_MEMORY_LIMIT = 128 * 1024 * 1024
+
+    def __init__(self, memory_limit=None):
+        if memory_limit is None:
+            memory_limit = self.DEFAULT_MEMORY_LIMIT
+        self.memory_limit = memory_limit
+        self.plugins = OrderedDict()
+        # Plugins can be created on the prewarming thread as well as the main one
+        self.lock = threading.RLock()
+
+    def add(self, plugin):
+        with self.lock:
+            self.plugins.pop(id(plugin), None)
+            self.plugins[id(plugin)] = plugin
+            self.trim()
+
+    def touch(self, plugin):
+        # Move it to the most recently used end
+        with self.lock:
+            if id(plugin) in self.plugins:
+                self.plugins[id(plugin)] = self.plugins.pop(id(plugin))
+
+    def remove(self, plugin):
+        with self.lock:
+            self.plugins.pop(id(plugin), None)
+
+    def clear(self):
+        with self.lock:
+            self.plugins = OrderedDict()
+
+    def trim(self):
+        resident = self.get_resident_memory()
+        while resident is not None and resident > self.memory_limit:
+            # The least recently used plugin that isn't running, other than
+            #  the one that has just been used
+            idle = [plugin for plugin in list(self.plugins.values())[:-1] if not plugin.active]
+            if len(idle) == 0:
+                break
+            self.logger.info("Using %d bytes, limit is %d" % (resident, self.memory_limit))
+            idle[0].release()
+            gc.collect()
+            resident = self.get_resident_memory()
+
+    # How much memory this process is using, or None if we can't tell
+    @staticmethod
+    def get_resident_memory():
+        try:
+            with open("/proc/self/statm") as statm:
+                resident_pages = int(statm.read().split()[1])
+            return resident_pages * os.sysconf("SC_PAGE_SIZE")
+        except (IOError, OSError, ValueError, IndexError, AttributeError):
+            return None
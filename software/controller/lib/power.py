@@ -0,0 +1,185 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import math
+
+import numpy
+import pygame
+
+
+class PowerLimiter(object):
+    """
+    Keeps the floor within what its power supplies can provide, by working
+    out how much current each module will draw for a frame and turning down
+    only the modules that would draw too much. The config looks like
+
+        power:
+          channel_current: [20, 20, 20]
+          module_limit: 600
+          attack_time: 0
+          release_time: 1000
+          supplies:
+            left:
+              limit: 2000
+              modules: [1, 2, 3]
+
+    where channel_current is the mA for a red, green and blue LED at full
+    brightness, module_limit is the most any one module may draw, and each
+    supply has a limit for the modules on it, all in mA. A module that is
+    over is turned down straight away by default (attack_time, in ms), and
+    eased back up again over release_time ms once it is under, so that it
+    doesn't flicker.
+
+    The estimate is made from the bytes that are sent to the modules, which
+    light one colour at a time through a roughly exponential curve, so a
+    value of 128 draws much less than half the current of 255.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_CHANNEL_CURRENT = 20.0
+    DEFAULT_ATTACK_TIME = 0
+    DEFAULT_RELEASE_TIME = 1000
+    # Only one of red, green and blue is on at any one time
+    DUTY_CYCLE = 1.0 / 3.0
+    # The modules' brightness curves go from 15 to 4095 in an exponential
+    MIN_LEVEL = 15.0
+    MAX_LEVEL = 4095.0
+
+    def __init__(self, config, layout):
+        if config is None:
+            config = dict()
+
+        channel_current = [self.DEFAULT_CHANNEL_CURRENT] * 3
+        try:
+            current = config["channel_current"]
+            if isinstance(current, list):
+                channel_current = [float(c) for c in current[:3]]
+            else:
+                channel_current = [float(current)] * 3
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+
+        self.module_limit = None
+        try:
+            self.module_limit = float(config["module_limit"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        self.attack_time = self.DEFAULT_ATTACK_TIME
+        try:
+            self.attack_time = float(config["attack_time"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        self.release_time = self.DEFAULT_RELEASE_TIME
+        try:
+            self.release_time = float(config["release_time"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+
+        # Which module each pixel of the canvas is in, as an index into the
+        #  list of modules, or the number of modules if it isn't in one
+        self.modules = [module for (module, positions) in layout.get_module_converters()]
+        module_count = len(self.modules)
+        self.pixel_modules = numpy.zeros((layout.size_x, layout.size_y), dtype=int) + module_count
+        for (index, (module, positions)) in enumerate(layout.get_module_converters()):
+            if len(positions) > 0:
+                self.pixel_modules[positions[:, 0], positions[:, 1]] = index
+
+        # A list of (limit, module indexes) for each supply
+        self.supplies = []
+        try:
+            supplies = config["supplies"].items()
+        except (AttributeError, KeyError, TypeError):
+            supplies = []
+        for (name, supply) in supplies:
+            try:
+                indexes = [self.modules.index(module) for module in supply["modules"] if module in self.modules]
+                self.supplies.append((float(supply["limit"]), numpy.array(indexes, dtype=int)))
+            except (AttributeError, ValueError, KeyError, TypeError):
+                self.logger.error("Power supply %s needs a limit and a list of modules" % name)
+
+        # The fraction of the time the LEDs are on for each value that can
+        #  be sent, and the current that draws for each channel
+        values = numpy.arange(256, dtype=numpy.float64)
+        self.duty = self.MIN_LEVEL * numpy.exp((values - 1) * math.log(self.MAX_LEVEL / self.MIN_LEVEL) / 254.0)
+        self.duty[0] = 0.0
+        self.duty /= self.MAX_LEVEL
+        self.current_table = self.duty[:, numpy.newaxis] * numpy.array(channel_current) * self.DUTY_CYCLE
+
+        # What each module was last estimated to draw, and how far it is
+        #  turned down
+        self.currents = numpy.zeros(module_count)
+        self.gains = numpy.ones(module_count)
+        self.targets = numpy.ones(module_count)
+        self.last_ticks = numpy.zeros(module_count) - 1
+
+    def get_pixel_modules(self):
+        return self.pixel_modules
+
+    # The current, in mA, each module would draw for the given bytes, and
+    #  which of the modules any of the pixels were in
+    def estimate(self, pixels, modules):
+        module_count = len(self.modules)
+        current = self.current_table[pixels, numpy.arange(3)].sum(axis=1)
+        currents = numpy.bincount(modules, weights=current, minlength=module_count + 1)[:module_count]
+        present = numpy.bincount(modules, minlength=module_count + 1)[:module_count] > 0
+        return (currents, present)
+
+    # The gain each module should have to keep within the limits
+    def get_targets(self):
+        targets = numpy.ones(len(self.modules))
+        if self.module_limit is not None:
+            targets = numpy.minimum(targets, self.module_limit / numpy.maximum(self.currents, 1e-6))
+        for (limit, indexes) in self.supplies:
+            total = (self.currents[indexes] * targets[indexes]).sum()
+            if total > limit:
+                targets[indexes] *= limit / total
+        return targets
+
+    """
+    Take an array of shape (n, 3) of the bytes for each pixel, and the index
+    of the module each is in (from get_pixel_modules()), and return them
+    turned down as much as is needed
+    """
+    def limit(self, pixels, modules, ticks=None):
+        if ticks is None:
+            ticks = pygame.time.get_ticks()
+
+        (currents, present) = self.estimate(pixels, modules)
+        self.currents[present] = currents[present]
+        targets = self.get_targets()
+        self.targets = targets
+
+        # Move each gain towards its target, as quickly as the attack or
+        #  release time allows. Modules that haven't been seen before go
+        #  straight there
+        elapsed = numpy.where(self.last_ticks < 0, numpy.inf, ticks - self.last_ticks)
+        attack = self.get_smoothing(elapsed, self.attack_time)
+        release = self.get_smoothing(elapsed, self.release_time)
+        smoothing = numpy.where(targets < self.gains, attack, release)
+        self.gains[present] += ((targets - self.gains) * smoothing)[present]
+        self.last_ticks[present] = ticks
+
+        if (self.gains[present] >= 0.999).all():
+            return pixels
+
+        # Find the value that gives the turned down amount of light
+        gains = numpy.append(self.gains, 1.0)[modules]
+        wanted = self.duty[pixels] * gains[:, numpy.newaxis]
+        limited = numpy.searchsorted(self.duty, wanted, side="right") - 1
+        limited = numpy.clip(limited, 0, 255).astype(numpy.uint8)
+        # Keep clear of the sync signal
+        limited[limited == 1] = 2
+        return limited
+
+    # Whether every module has got to its gain, or is still being eased
+    #  towards it and needs limit() to be called again to carry on
+    def is_settled(self):
+        return bool((numpy.abs(self.targets - self.gains) < 0.001).all())
+
+    def get_smoothing(self, elapsed, time_constant):
+        if time_constant <= 0:
+            return numpy.ones(elapsed.shape)
+        return 1.0 - numpy.exp(-elapsed / float(time_constant))
+
+    def get_gains(self):
+        return dict(zip(self.modules, [float(gain) for gain in self.gains]))
@@ -0,0 +1,213 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import struct
+import threading
+import time
+import zlib
+
+import numpy
+
+from lib.controlserver import ThreadingHTTPServer
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+
+    PAGE = b"""<!DOCTYPE html>
+<html><head><title>DDRPi</title></head>
+<body style="background: #000; margin: 0; text-align: center">
+<img src="/stream" style="image-rendering: pixelated; height: 100vh">
+</body></html>
+"""
+
+    BOUNDARY = "ddrpiframe"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/":
+            self.send_body(200, "text/html", self.PAGE)
+        elif path == "/preview.png":
+            (sequence, image) = self.server.preview.get_image()
+            if image is None:
+                self.send_body(503, "text/plain", b"No frame yet\n")
+            else:
+                self.send_body(200, "image/png", image)
+        elif path == "/stream":
+            self.stream()
+        else:
+            self.send_body(404, "text/plain", b"Not found\n")
+
+    def send_body(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Keep sending each new image as a part of a multipart response, which
+    #  browsers show in an <img> as it arrives
+    def stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=%s" % self.BOUNDARY)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sequence = None
+        try:
+            while True:
+                (sequence, image) = self.server.preview.wait_for_image(sequence)
+                if image is None:
+                    break
+                header = "--%s\r\nContent-Type: image/png\r\nContent-Length: %d\r\n\r\n" % (self.BOUNDARY, len(image))
+                self.wfile.write(header.encode("ascii") + image + b"\r\n")
+                self.wfile.flush()
+        except (IOError, OSError):
+            # The viewer has gone away
+            pass
+
+    def log_message(self, format, *args):
+        self.server.preview.logger.debug(format % args)
+
+
+class PreviewServer(object):
+    """
+    Serves what is on the floor to web browsers, as
+
+        /               a page showing the stream
+        /stream         a multipart stream of PNGs, one per new frame
+        /preview.png    the latest frame
+
+    The render loop only hands over a copy of each frame with put_frame().
+    A worker thread turns the latest one into a PNG, at most rate times a
+    second and only when it has changed, and every viewer is sent that same
+    image, so it is encoded once however many are watching.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_PORT = 8081
+    DEFAULT_RATE = 5.0
+    # How many pixels across each cell of the floor is in the image
+    DEFAULT_SCALE = 10
+    # Fast and still small, as the images are mostly flat colour
+    COMPRESSION_LEVEL = 6
+    # How long a viewer waits for a new frame before checking whether the
+    #  server is stopping
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, rate=DEFAULT_RATE, scale=DEFAULT_SCALE):
+        self.address = (host, port)
+        self.interval = 1.0 / max(float(rate), 0.1)
+        self.scale = max(int(scale), 1)
+        self.server = None
+        self.serving = False
+        # The latest frame from the render loop, replaced whole each time
+        self.frame = None
+        self.frame_ready = threading.Event()
+        # The latest image, and a count of them, which viewers wait on
+        self.image = None
+        self.sequence = 0
+        self.image_ready = threading.Condition()
+
+    def start(self):
+        if self.serving:
+            return None
+        self.server = ThreadingHTTPServer(self.address, PreviewRequestHandler)
+        self.server.preview = self
+        self.serving = True
+        self.logger.info("Serving a preview of the floor on %s:%d" % self.server.server_address)
+        for target in [self.server.serve_forever, self.encode_frames]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return None
+
+    def stop(self):
+        if not self.serving:
+            return None
+        self.serving = False
+        self.frame_ready.set()
+        with self.image_ready:
+            self.image_ready.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        return None
+
+    def get_address(self):
+        if self.server is None:
+            return self.address
+        return self.server.server_address
+
+    # Called by the render loop with an array data[x][y] of packed 0xRRGGBB
+    #  colours, which mustn't be changed afterwards
+    def put_frame(self, data):
+        self.frame = data
+        self.frame_ready.set()
+
+    def get_image(self):
+        return (self.sequence, self.image)
+
+    # Wait for an image newer than the given sequence number. The image is
+    #  None if the server is stopping
+    def wait_for_image(self, sequence):
+        with self.image_ready:
+            while self.serving and (self.image is None or self.sequence == sequence):
+                self.image_ready.wait(self.POLL_INTERVAL)
+            if not self.serving:
+                return (sequence, None)
+            return (self.sequence, self.image)
+
+    def encode_frames(self):
+        last_frame = None
+        while self.serving:
+            self.frame_ready.wait(self.POLL_INTERVAL)
+            self.frame_ready.clear()
+            frame = self.frame
+            if frame is None or frame is last_frame:
+                continue
+            started = time.time()
+            if last_frame is None or frame.shape != last_frame.shape or (frame != last_frame).any():
+                try:
+                    image = self.encode_png(frame)
+                except Exception as e:
+                    self.logger.warn("Unable to encode the preview: %s" % e)
+                    image = None
+                if image is not None:
+                    with self.image_ready:
+                        self.image = image
+                        self.sequence += 1
+                        self.image_ready.notify_all()
+            last_frame = frame
+            # Leave it at least the interval until the next one
+            time.sleep(max(self.interval - (time.time() - started), 0))
+
+    # Turn an array data[x][y] of packed colours into a PNG, with each cell
+    #  scale pixels square
+    def encode_png(self, data):
+        data = numpy.asarray(data, dtype=numpy.uint32).T
+        rgb = numpy.empty(data.shape + (3,), dtype=numpy.uint8)
+        rgb[:, :, 0] = (data >> 16) & 0xFF
+        rgb[:, :, 1] = (data >> 8) & 0xFF
+        rgb[:, :, 2] = data & 0xFF
+        rgb = rgb.repeat(self.scale, axis=0).repeat(self.scale, axis=1)
+        (height, width) = rgb.shape[:2]
+
+        # Each row starts with its filter type, which is none
+        rows = numpy.zeros((height, 1 + 3 * width), dtype=numpy.uint8)
+        rows[:, 1:] = rgb.reshape(height, 3 * width)
+
+        return b"".join([
+            b"\x89PNG\r\n\x1a\n",
+            self.png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+            self.png_chunk(b"IDAT", zlib.compress(rows.tobytes(), self.COMPRESSION_LEVEL)),
+            self.png_chunk(b"IEND", b""),
+        ])
+
+    def png_chunk(self, chunk_type, data):
+        crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
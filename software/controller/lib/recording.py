@@ -0,0 +1,185 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import struct
+import threading
+import time
+import zlib
+
+from collections import deque
+
+import numpy
+
+
+class FrameRecorder(object):
+    """
+    Writes frames to a file, along with when they were shown, so that they
+    can be played back later with FrameRecording. The file starts with
+
+        "DDRPIREC", version, canvas width and height, pixel count
+        the (x, y) canvas position of each pixel, in DisplayLayout order
+
+    and then has chunks of frames, each a frame count and a length followed
+    by that many bytes of zlib compressed frames. A frame is the ms since
+    the first one, then the raw (R,G,B) of each pixel in the same order.
+
+    add_frame() only queues the frame up; a background thread packs,
+    compresses and writes the chunks. A chunk is written every CHUNK_FRAMES
+    frames or CHUNK_INTERVAL seconds, whichever is first, so that not much
+    is lost if the program stops without close() being called.
+    """
+    logger = logging.getLogger(__name__)
+
+    MAGIC = b"DDRPIREC"
+    VERSION = 1
+    HEADER = ">BHHI"
+    CHUNK_HEADER = ">II"
+    FRAME_HEADER = ">I"
+
+    CHUNK_FRAMES = 250
+    CHUNK_INTERVAL = 10.0
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, path, positions, size):
+        self.path = path
+        self.positions = numpy.asarray(positions, dtype=int).reshape(-1, 2)
+        self.file = open(path, "wb")
+        self.file.write(self.MAGIC)
+        self.file.write(struct.pack(self.HEADER, self.VERSION, size[0], size[1], len(self.positions)))
+        self.file.write(self.positions.astype(">u2").tobytes())
+        self.file.flush()
+
+        self.first_ticks = None
+        self.frame_count = 0
+        # Appending and popping from either end of a deque is thread safe
+        self.frames = deque()
+        self.frames_ready = threading.Event()
+        self.writing = True
+        self.thread = threading.Thread(target=self.write_frames)
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info("Recording frames to %s" % path)
+
+    # Queue up a frame, given as an array of the packed 0xRRGGBB colour of
+    #  each pixel, in the same order as the positions. It mustn't be
+    #  changed afterwards
+    def add_frame(self, ticks, packed):
+        if not self.writing:
+            return None
+        if self.first_ticks is None:
+            self.first_ticks = ticks
+        self.frames.append((ticks - self.first_ticks, packed))
+        self.frames_ready.set()
+        return None
+
+    def write_frames(self):
+        chunk = []
+        chunk_started = time.time()
+        while True:
+            self.frames_ready.wait(self.CHUNK_INTERVAL)
+            self.frames_ready.clear()
+            while True:
+                try:
+                    (timestamp, packed) = self.frames.popleft()
+                except IndexError:
+                    break
+                chunk.append(self.pack_frame(timestamp, packed))
+                if len(chunk) >= self.CHUNK_FRAMES:
+                    self.write_chunk(chunk)
+                    chunk = []
+                    chunk_started = time.time()
+            if not self.writing:
+                break
+            if len(chunk) > 0 and time.time() - chunk_started >= self.CHUNK_INTERVAL:
+                self.write_chunk(chunk)
+                chunk = []
+                chunk_started = time.time()
+        self.write_chunk(chunk)
+
+    def pack_frame(self, timestamp, packed):
+        rgb = numpy.empty((len(packed), 3), dtype=numpy.uint8)
+        rgb[:, 0] = (packed >> 16) & 0xFF
+        rgb[:, 1] = (packed >> 8) & 0xFF
+        rgb[:, 2] = packed & 0xFF
+        return struct.pack(self.FRAME_HEADER, timestamp & 0xFFFFFFFF) + rgb.tobytes()
+
+    def write_chunk(self, chunk):
+        if len(chunk) == 0:
+            return None
+        data = zlib.compress(b"".join(chunk), self.COMPRESSION_LEVEL)
+        try:
+            self.file.write(struct.pack(self.CHUNK_HEADER, len(chunk), len(data)))
+            self.file.write(data)
+            self.file.flush()
+            self.frame_count += len(chunk)
+        except (IOError, OSError) as e:
+            self.logger.error("Unable to write to %s: %s" % (self.path, e))
+        return None
+
+    # Write out whatever is left and close the file
+    def close(self):
+        if not self.writing:
+            return None
+        self.writing = False
+        self.frames_ready.set()
+        self.thread.join()
+        self.file.close()
+        self.logger.info("Recorded %d frames to %s" % (self.frame_count, self.path))
+        return None
+
+
+class FrameRecording(object):
+    """
+    Reads back a file written by FrameRecorder. get_positions() says where
+    on the canvas each pixel goes, and frames() gives each frame in turn as
+    (ms since the first frame, array of shape (n, 3) of (R,G,B) values),
+    reading and decompressing one chunk at a time.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.read_header(f)
+
+    def read_header(self, f):
+        magic = f.read(len(FrameRecorder.MAGIC))
+        if magic != FrameRecorder.MAGIC:
+            raise ValueError("%s is not a recording" % self.path)
+        header = f.read(struct.calcsize(FrameRecorder.HEADER))
+        (version, size_x, size_y, pixel_count) = struct.unpack(FrameRecorder.HEADER, header)
+        if version != FrameRecorder.VERSION:
+            raise ValueError("%s is a version %d recording, only version %d can be read" %
+                             (self.path, version, FrameRecorder.VERSION))
+        self.size = (size_x, size_y)
+        positions = f.read(4 * pixel_count)
+        self.positions = numpy.frombuffer(positions, dtype=">u2").reshape(pixel_count, 2).astype(int)
+        self.data_offset = f.tell()
+
+    def get_size(self):
+        return self.size
+
+    def get_positions(self):
+        return self.positions
+
+    def frames(self):
+        frame_size = struct.calcsize(FrameRecorder.FRAME_HEADER) + 3 * len(self.positions)
+        chunk_header_size = struct.calcsize(FrameRecorder.CHUNK_HEADER)
+        with open(self.path, "rb") as f:
+            f.seek(self.data_offset)
+            while True:
+                header = f.read(chunk_header_size)
+                if len(header) < chunk_header_size:
+                    break
+                (frame_count, length) = struct.unpack(FrameRecorder.CHUNK_HEADER, header)
+                data = f.read(length)
+                try:
+                    data = zlib.decompress(data)
+                except zlib.error as e:
+                    # Most likely the end of a recording that was cut short
+                    self.logger.warn("Stopping at a damaged chunk in %s: %s" % (self.path, e))
+                    break
+                frames = numpy.frombuffer(data, dtype=numpy.uint8).reshape(frame_count, frame_size)
+                timestamps = frames[:, :4].copy().view(">u4").reshape(frame_count)
+                for (timestamp, frame) in zip(timestamps, frames):
+                    yield (int(timestamp), frame[4:].reshape(-1, 3))
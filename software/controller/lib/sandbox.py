@@ -0,0 +1,365 @@
+__authors__ = ['Andrew Taylor']
+
+import ctypes
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+import numpy
+import pygame
+
+from lib.floorcanvas import FloorCanvas
+from GamePlugin import GamePlugin
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxedPlugin(object):
+    """
+    Runs a plugin in a child process of its own, and stands in for it in this
+    one. The child draws each frame into a canvas in shared memory, and the
+    framework only waits up to a deadline for it. A frame that isn't ready in
+    time is replaced by the last good one, so a plugin that hangs or is slow
+    can't stall the floor. After too many missed frames in a row, or if the
+    child dies, it is restarted, and after too many restarts draw_frame()
+    raises a SandboxError so the framework shows its error screen instead.
+
+    The next frame is asked for as soon as the last one arrives, so the child
+    draws while the framework is busy with everything else. Events, and
+    configure(), start() etc. are passed on without waiting for them. A game
+    is updated by the child with the time that has passed before each frame.
+    """
+    logger = logging.getLogger(__name__)
+
+    # How long to wait for each frame, in milliseconds
+    FRAME_DEADLINE = 20
+    # How long to wait for a splash screen, which only happens in the menu
+    SPLASH_DEADLINE = 1000
+    # Restart the child after this many frames in a row were late
+    MAX_MISSES = 25
+    # Give up on the plugin after it has been restarted this many times
+    MAX_RESTARTS = 3
+    # Forget about earlier restarts after this many good frames in a row, so
+    #  that a few hiccups hours apart don't add up
+    RESTART_AMNESTY_FRAMES = 1500
+
+    # Each child gets the next core along, leaving the first for the framework
+    _next_cpu = 0
+
+    def __init__(self, plugin_object, config=None):
+        self.plugin_object = plugin_object
+        self.config = config
+        self.deadline = self.FRAME_DEADLINE
+        self.memory_limit = None
+        self.read_sandbox_config(config)
+        self.cpu = self.get_next_cpu()
+        # Only send the child the events the plugin wants, if its class has
+        #  been loaded in this process to say which
+        plugin_class = getattr(plugin_object, "plugin_class", plugin_object)
+        self.EVENT_TYPES = getattr(plugin_class, "EVENT_TYPES", None)
+        self.EVENT_BUTTONS = getattr(plugin_class, "EVENT_BUTTONS", None)
+
+        self.process = None
+        self.connection = None
+        self.shared = None
+        self.frame = None
+        self.size = None
+        # Sent again to a restarted child to get it back where it was
+        self.started = False
+
+        # The sequence number of the frame we have asked for, if any
+        self.pending = None
+        self.sequence = 0
+        self.last_frame = None
+        self.misses = 0
+        self.restarts = 0
+        self.good_frames = 0
+        # Splash screens don't change, so the child only draws it once
+        self.splash_frame = None
+
+    def read_sandbox_config(self, config):
+        if config is None:
+            return None
+        try:
+            self.deadline = int(config["sandbox_deadline"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        try:
+            self.memory_limit = int(config["sandbox_memory_limit"]) * 1024 * 1024
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    @classmethod
+    def get_next_cpu(cls):
+        try:
+            cpus = multiprocessing.cpu_count()
+        except NotImplementedError:
+            return None
+        if cpus < 2:
+            return None
+        cpu = 1 + cls._next_cpu % (cpus - 1)
+        cls._next_cpu += 1
+        return cpu
+
+    # Plugin methods, passed on to the child
+    def configure(self, config):
+        self.config = config
+        self.read_sandbox_config(config)
+        self.send("call", "configure", self.get_child_config())
+
+    def start(self):
+        self.started = True
+        self.send("call", "start")
+
+    def stop(self):
+        self.started = False
+        self.shutdown()
+
+    def pause(self):
+        self.send("call", "pause")
+
+    def resume(self):
+        self.send("call", "resume")
+
+    def handle_event(self, e):
+        # We can't wait to find out whether the plugin wanted it, so assume so
+        self.send("event", e.type, dict(e.dict))
+        return None
+
+    def draw_frame(self, canvas):
+        self.check_process(canvas.get_size())
+
+        if self.pending is None:
+            self.request("draw")
+        if self.wait_for_frame(self.deadline / 1000.0):
+            self.misses = 0
+            self.good_frames += 1
+            if self.restarts > 0 and self.good_frames >= self.RESTART_AMNESTY_FRAMES:
+                self.logger.info("Plugin in sandbox has been fine for %d frames" % self.good_frames)
+                self.restarts = 0
+            self.last_frame = self.frame.copy()
+            # Get the child going on the next frame straight away
+            self.request("draw")
+        else:
+            self.misses += 1
+            self.good_frames = 0
+            if self.misses >= self.MAX_MISSES:
+                self.logger.warn("Plugin in sandbox has missed %d frames, restarting it" % self.misses)
+                self.restart(canvas.get_size())
+
+        if self.last_frame is not None:
+            canvas.set_packed_array(self.last_frame)
+        return canvas
+
+    def draw_splash(self, canvas):
+        if self.splash_frame is None or self.splash_frame.shape != canvas.get_size():
+            self.check_process(canvas.get_size())
+            # Throw away any frame that is on its way, it isn't wanted now
+            if self.pending is not None:
+                self.wait_for_frame(self.deadline / 1000.0)
+                self.pending = None
+            self.request("splash")
+            if not self.wait_for_frame(self.SPLASH_DEADLINE / 1000.0):
+                self.pending = None
+                return None
+            self.splash_frame = self.frame.copy()
+            # Don't keep a process going just for the menu
+            if not self.started:
+                self.shutdown()
+        canvas.set_packed_array(self.splash_frame)
+        return canvas
+
+    # Child process management
+    def check_process(self, size):
+        if self.process is not None and not self.process.is_alive():
+            self.logger.warn("Plugin in sandbox has died, restarting it")
+            self.restart(size)
+        elif self.process is None or size != self.size:
+            self.spawn(size)
+
+    def restart(self, size):
+        self.restarts += 1
+        self.good_frames = 0
+        if self.restarts > self.MAX_RESTARTS:
+            self.shutdown(False)
+            raise SandboxError("Plugin in sandbox has been restarted too many times")
+        # It's stuck or dead, so there's no point asking it to exit
+        self.shutdown(False)
+        self.spawn(size)
+
+    def spawn(self, size):
+        self.shutdown()
+        (width, height) = size
+        self.size = size
+        self.shared = multiprocessing.RawArray(ctypes.c_uint32, width * height)
+        self.frame = numpy.frombuffer(self.shared, dtype=numpy.uint32).reshape((width, height))
+        (self.connection, child_connection) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_sandbox,
+                                               args=(self.plugin_object, child_connection, self.shared, size,
+                                                     self.cpu, self.memory_limit))
+        self.process.daemon = True
+        self.process.start()
+        self.logger.info("Started sandbox process %d for %s" % (self.process.pid, self.plugin_object.__name__))
+        self.misses = 0
+        self.pending = None
+
+        # Get it back to where the plugin was
+        if self.config is not None:
+            self.send("call", "configure", self.get_child_config())
+        if self.started:
+            self.send("call", "start")
+
+    # The config as it is sent to the child. Playlist entries include the
+    #  plugin's class object, which doesn't need to go
+    def get_child_config(self):
+        try:
+            return dict((key, value) for (key, value) in self.config.items() if key != "obj")
+        except AttributeError:
+            return self.config
+
+    def shutdown(self, wait=True):
+        if self.process is None:
+            return None
+        if wait:
+            self.send("exit")
+            self.process.join(0.5)
+        if self.process.is_alive():
+            self.logger.info("Terminating sandbox process %d" % self.process.pid)
+            self.process.terminate()
+            self.process.join(0.5)
+        self.connection.close()
+        self.process = None
+        self.connection = None
+        self.pending = None
+        return None
+
+    def send(self, command, *args):
+        if self.connection is None:
+            return None
+        try:
+            self.connection.send((command, args))
+        except (IOError, OSError, EOFError, ValueError) as e:
+            self.logger.warn("Unable to send %s to sandbox: %s" % (command, e))
+        return None
+
+    def request(self, command):
+        self.sequence += 1
+        self.pending = self.sequence
+        self.send(command, self.sequence)
+
+    # Wait up to 'timeout' seconds for the frame we asked for, returning True
+    #  if it is now in self.frame. Replies to earlier requests are thrown away
+    def wait_for_frame(self, timeout):
+        end = time.time() + timeout
+        while self.pending is not None and self.connection is not None:
+            try:
+                if not self.connection.poll(max(end - time.time(), 0)):
+                    return False
+                (reply, sequence, message) = self.connection.recv()
+            except (IOError, OSError, EOFError) as e:
+                self.logger.warn("Lost connection to sandbox: %s" % e)
+                return False
+            if sequence != self.pending:
+                continue
+            self.pending = None
+            if reply == "error":
+                raise SandboxError(message)
+            return reply == "frame"
+        return False
+
+
+# The memory this process has of its own, in bytes. Its resident size would
+#  include all the pages it shares with the parent it was forked from, which
+#  is most of the framework. If the kernel can't say, use how much the
+#  resident size has grown since 'baseline'
+def get_private_memory(baseline=None):
+    try:
+        private = 0
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                if line.startswith("Private_Clean:") or line.startswith("Private_Dirty:"):
+                    private += int(line.split()[1]) * 1024
+        return private
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    # This can't be imported at the top, as pluginmodel imports this module
+    from lib.pluginmodel import PluginInstanceCache
+    resident = PluginInstanceCache.get_resident_memory()
+    if resident is None or baseline is None:
+        return None
+    return resident - baseline
+
+
+# This is what runs in the child process
+def run_sandbox(plugin_object, connection, shared, size, cpu, memory_limit):
+    logger = logging.getLogger(__name__)
+    # This can't be imported at the top either
+    from lib.pluginmodel import PluginInstanceCache
+
+    # pygame turns SIGTERM into a quit event, which nothing is listening for
+    #  in here, so put it back to how it was so that the child can be stopped
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # Keep the child off the framework's core, if we can say which one to use
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, [cpu])
+        except OSError:
+            pass
+
+    baseline = PluginInstanceCache.get_resident_memory()
+
+    (width, height) = size
+    frame = numpy.frombuffer(shared, dtype=numpy.uint32).reshape((width, height))
+    canvas = FloorCanvas(width, height)
+    instance = plugin_object()
+    last_update_ticks = pygame.time.get_ticks()
+
+    while True:
+        (command, args) = connection.recv()
+        if command == "exit":
+            break
+        try:
+            if command == "draw" or command == "splash":
+                if command == "draw":
+                    if isinstance(instance, GamePlugin):
+                        ticks = pygame.time.get_ticks()
+                        instance.update(ticks - last_update_ticks)
+                        last_update_ticks = ticks
+                    result = instance.draw_frame(canvas)
+                else:
+                    result = instance.draw_splash(canvas)
+                if result is None:
+                    connection.send(("none", args[0], None))
+                else:
+                    result.flatten_layers()
+                    frame[:, :] = result.get_canvas_array()
+                    connection.send(("frame", args[0], None))
+            elif command == "event":
+                instance.handle_event(pygame.event.Event(args[0], args[1]))
+            elif command == "call":
+                getattr(instance, args[0])(*args[1:])
+        except Exception as e:
+            logger.warn("Plugin in sandbox threw an error whilst running %s" % command)
+            logger.warn(e)
+            if command == "draw" or command == "splash":
+                connection.send(("error", args[0], "%s" % e))
+
+        # A plugin that is leaking memory is stopped before it takes the
+        #  rest of the floor with it, and will be restarted
+        if memory_limit is not None:
+            used = get_private_memory(baseline)
+            if used is not None and used > memory_limit:
+                logger.warn("Plugin in sandbox is using %d bytes, limit is %d" % (used, memory_limit))
+                break
+
+    try:
+        instance.stop()
+    except Exception as e:
+        logger.warn(e)
+    connection.close()
@@ -0,0 +1,194 @@
+__authors__ = ['Andrew Taylor']
+
+import ctypes
+import imp
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+import numpy
+
+
+class TileRenderer(object):
+    """
+    Renders a canvas whose pixels can all be worked out independently, by
+    splitting it into tiles and sharing them out between a pool of worker
+    processes, which write straight into a frame in shared memory.
+
+    A plugin hands render() a render function and a dict of parameters for
+    this frame. The function must be defined at the top level of its module,
+    must only depend on what it is given, and is called as
+
+        render_tile(xs, ys, params)
+
+    where xs and ys are float arrays of shape (tile_width, tile_height)
+    holding the x and y coordinate of each pixel in the tile. It returns an
+    array of shape (tile_width, tile_height, 3) of (R,G,B) values in 0-255.
+
+    The pool is shared by every plugin and is kept between frames. A canvas
+    smaller than MIN_PARALLEL_PIXELS isn't worth sending to other processes,
+    so it is rendered here as a single tile, as is everything if the pool
+    can't be started, e.g. inside a sandbox process.
+    """
+    logger = logging.getLogger(__name__)
+
+    TILE_SIZE = 32
+    MIN_PARALLEL_PIXELS = 4096
+
+    _shared_renderer = None
+    _shared_lock = threading.Lock()
+
+    # The one renderer that everything uses
+    @classmethod
+    def get_renderer(cls):
+        with cls._shared_lock:
+            if cls._shared_renderer is None:
+                cls._shared_renderer = TileRenderer()
+            return cls._shared_renderer
+
+    def __init__(self, processes=None, tile_size=TILE_SIZE, min_parallel_pixels=MIN_PARALLEL_PIXELS):
+        if processes is None:
+            try:
+                processes = multiprocessing.cpu_count()
+            except NotImplementedError:
+                processes = 1
+        self.processes = processes
+        self.tile_size = tile_size
+        self.min_parallel_pixels = min_parallel_pixels
+        self.pool = None
+        self.pool_failed = False
+        self.size = None
+        self.frame = None
+        self.lock = threading.Lock()
+
+    def render(self, canvas, render_tile, params):
+        (width, height) = canvas.get_size()
+        if width == 0 or height == 0:
+            return canvas
+
+        with self.lock:
+            if width * height >= self.min_parallel_pixels and self.processes > 1 and self.get_pool(width, height):
+                spec = get_function_spec(render_tile)
+                jobs = [(spec, params, tile) for tile in self.get_tiles(width, height)]
+                try:
+                    self.pool.map(render_shared_tile, jobs)
+                    canvas.set_packed_array(self.frame)
+                    return canvas
+                except Exception as e:
+                    self.logger.warn("Unable to render tiles in parallel: %s" % e)
+
+        # Do it all in one go here instead
+        (xs, ys) = numpy.mgrid[0:width, 0:height].astype(numpy.float64)
+        canvas.set_rgb_array(clip_rgb(render_tile(xs, ys, params)))
+        return canvas
+
+    def get_tiles(self, width, height):
+        return [(x, min(x + self.tile_size, width), y, min(y + self.tile_size, height))
+                for x in range(0, width, self.tile_size) for y in range(0, height, self.tile_size)]
+
+    # The pool, with a shared frame of the right size, started if needed.
+    #  Returns False if it can't be started
+    def get_pool(self, width, height):
+        if self.pool_failed:
+            return False
+        if self.pool is not None and self.size == (width, height):
+            return True
+        self.close()
+        try:
+            shared = multiprocessing.RawArray(ctypes.c_uint32, width * height)
+            self.pool = multiprocessing.Pool(self.processes, init_tile_worker, (shared, (width, height)))
+        except (AssertionError, OSError, ValueError) as e:
+            # Daemon processes, such as sandboxes, can't have children
+            self.logger.warn("Unable to start tile rendering processes: %s" % e)
+            self.pool_failed = True
+            return False
+        self.size = (width, height)
+        self.frame = numpy.frombuffer(shared, dtype=numpy.uint32).reshape((width, height))
+        self.logger.info("Started %d tile rendering processes for %dx%d" % (self.processes, width, height))
+        return True
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.size = None
+        self.frame = None
+
+
+# Render functions are passed to the workers by where they are defined
+#  rather than pickled, as the plugin modules are loaded from files that
+#  aren't on the path. The mtime makes sure a reloaded module is loaded again
+def get_function_spec(function):
+    module = sys.modules[function.__module__]
+    path = os.path.abspath(module.__file__)
+    if path.endswith(".pyc"):
+        path = path[:-1]
+    return (function.__module__, path, os.path.getmtime(path), function.__name__)
+
+
+def clip_rgb(rgb):
+    return numpy.clip(numpy.asarray(rgb), 0, 255).astype(numpy.uint8)
+
+
+# What each worker process keeps hold of
+_worker_frame = None
+_worker_modules = dict()
+
+
+def init_tile_worker(shared, size):
+    global _worker_frame
+    # pygame turns SIGTERM into a quit event, so put it back to how it was
+    #  so that the pool can be terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_frame = numpy.frombuffer(shared, dtype=numpy.uint32).reshape(size)
+
+
+def render_shared_tile(job):
+    ((module_name, path, mtime, function_name), params, (x0, x1, y0, y1)) = job
+    module = _worker_modules.get((path, mtime))
+    if module is None:
+        module = sys.modules.get(module_name)
+        if module is None or os.path.getmtime(path) != mtime:
+            module = imp.load_source(module_name, path)
+        _worker_modules[(path, mtime)] = module
+    render_tile = getattr(module, function_name)
+
+    (xs, ys) = numpy.mgrid[x0:x1, y0:y1].astype(numpy.float64)
+    rgb = clip_rgb(render_tile(xs, ys, params)).astype(numpy.uint32)
+    _worker_frame[x0:x1, y0:y1] = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+
+
+# Colour conversions, the same as the ones in colorsys, but for arrays of
+#  values from 0-1 rather than single values
+def hsv_to_rgb(h, s, v):
+    (h, s, v) = numpy.broadcast_arrays(*[numpy.asarray(c, dtype=numpy.float64) for c in (h, s, v)])
+    i = numpy.floor(h * 6.0)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(int) % 6
+    r = numpy.choose(i, [v, q, p, p, t, v])
+    g = numpy.choose(i, [t, v, v, q, p, p])
+    b = numpy.choose(i, [p, p, t, v, v, q])
+    return numpy.stack([r, g, b], axis=-1)
+
+
+def hls_to_rgb(h, l, s):
+    (h, l, s) = numpy.broadcast_arrays(*[numpy.asarray(c, dtype=numpy.float64) for c in (h, l, s)])
+    m2 = numpy.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+    rgb = numpy.stack([_hls_value(m1, m2, h + 1.0 / 3.0), _hls_value(m1, m2, h), _hls_value(m1, m2, h - 1.0 / 3.0)],
+                      axis=-1)
+    # No saturation is grey
+    return numpy.where((s == 0.0)[..., numpy.newaxis], l[..., numpy.newaxis], rgb)
+
+
+def _hls_value(m1, m2, hue):
+    hue = hue % 1.0
+    return numpy.select([hue < 1.0 / 6.0, hue < 0.5, hue < 2.0 / 3.0],
+                        [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2.0 / 3.0 - hue) * 6.0], m1)
@@ -0,0 +1,99 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+import numpy
+import pygame
+
+from lib.floorcanvas import FloorCanvas
+
+
+class Transition(object):
+    """
+    Blends the plugin that is finishing into the one that has just started,
+    over 'duration' milliseconds. The outgoing plugin carries on drawing into
+    a canvas of its own, and each frame that is blended with the incoming
+    plugin's canvas in one pass, with the result left in the incoming canvas
+    ready to be sent to the outputs.
+
+    Modes:
+     crossfade - the whole floor fades from one to the other
+     wipe      - the incoming plugin sweeps across the floor from the left
+     dissolve  - the incoming plugin appears a few pixels at a time, in a
+                 random order
+    """
+    logger = logging.getLogger(__name__)
+
+    MODES = ["crossfade", "wipe", "dissolve"]
+
+    # How many pixels wide the edge of a wipe is
+    WIPE_EDGE = 2.0
+    # The fraction of the transition that each pixel takes to dissolve
+    DISSOLVE_EDGE = 0.1
+
+    def __init__(self, mode, duration, outgoing, start_ticks=None):
+        if mode not in self.MODES:
+            raise ValueError("Unknown transition: %s" % mode)
+        self.mode = mode
+        self.duration = max(duration, 1)
+        # The Plugin that is being transitioned away from
+        self.outgoing = outgoing
+        if start_ticks is None:
+            start_ticks = pygame.time.get_ticks()
+        self.start_ticks = start_ticks
+        # The canvas the outgoing plugin draws into, created when it is needed
+        self.canvas = None
+        # The order the pixels dissolve in, a number from 0-1 for each
+        self.dissolve_order = None
+
+    def get_progress(self, ticks=None):
+        if ticks is None:
+            ticks = pygame.time.get_ticks()
+        return min(max(float(ticks - self.start_ticks) / self.duration, 0.0), 1.0)
+
+    def is_finished(self, ticks=None):
+        return self.get_progress(ticks) >= 1.0
+
+    # Hand what was on the floor, and any layers, over to the outgoing plugin
+    #  so that it carries on from exactly where it left off
+    def take_over(self, canvas):
+        self.canvas = FloorCanvas(canvas.get_width(), canvas.get_height())
+        self.canvas.set_packed_array(canvas.get_canvas_array())
+        self.canvas.layers = canvas.layers
+        canvas.layers = []
+
+    def draw(self, canvas, ticks=None):
+        """
+        Draw the next frame of the outgoing plugin, and blend it with the
+        frame that the incoming plugin has drawn on the given canvas
+        """
+        if self.canvas is None or self.canvas.get_size() != canvas.get_size():
+            self.canvas = FloorCanvas(canvas.get_width(), canvas.get_height())
+        instance = self.outgoing.instance
+        if instance is not None:
+            instance.draw_frame(self.canvas)
+        self.canvas.flatten_layers()
+        return self.blend(self.canvas, canvas, self.get_progress(ticks))
+
+    def blend(self, outgoing, incoming, progress):
+        weight = self.get_weights(incoming.get_width(), incoming.get_height(), progress)
+        below = outgoing.get_rgb_array().astype(numpy.float32)
+        above = incoming.get_rgb_array().astype(numpy.float32)
+        blended = below + (above - below) * weight
+        incoming.set_rgb_array(numpy.clip(blended + 0.5, 0, 255).astype(numpy.uint8))
+        return incoming
+
+    # How much of the incoming plugin to show, from 0-1. Either a single
+    #  value for the whole floor, or an array that broadcasts to (w, h, 3)
+    def get_weights(self, width, height, progress):
+        if self.mode == "wipe":
+            edge = progress * (width + self.WIPE_EDGE)
+            weight = numpy.clip((edge - numpy.arange(width)) / self.WIPE_EDGE, 0.0, 1.0)
+            return weight[:, numpy.newaxis, numpy.newaxis]
+        elif self.mode == "dissolve":
+            if self.dissolve_order is None or self.dissolve_order.shape != (width, height):
+                self.dissolve_order = numpy.random.random_sample((width, height))
+            edge = progress * (1.0 + self.DISSOLVE_EDGE)
+            weight = numpy.clip((edge - self.dissolve_order) / self.DISSOLVE_EDGE, 0.0, 1.0)
+            return weight[:, :, numpy.newaxis]
+        return progress
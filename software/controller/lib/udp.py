@@ -0,0 +1,125 @@
+__authors__ = ['Andrew Taylor']
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(iovec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+class PacketSender(object):
+    """
+    Sends UDP packets to one address, over a socket that is kept open between
+    frames. All of a frame's packets are handed to the kernel in one go with
+    sendmmsg() where the C library has it (Linux), and one at a time
+    otherwise. The address can be a broadcast address if broadcast is set.
+
+    Errors are logged rather than raised, as there may be nothing listening
+    yet and the floor should carry on regardless.
+    """
+    logger = logging.getLogger(__name__)
+
+    # The most messages sendmmsg() will take at once
+    MAX_BATCH = 1024
+
+    _sendmmsg = None
+    _sendmmsg_checked = False
+
+    def __init__(self, host, port, broadcast=False):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if broadcast:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # Connecting a UDP socket just fixes where packets go, so they don't
+        #  need an address each
+        self.socket.connect(self.address)
+        self.sendmmsg = self.get_sendmmsg()
+
+    @classmethod
+    def get_sendmmsg(cls):
+        if not cls._sendmmsg_checked:
+            cls._sendmmsg_checked = True
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                sendmmsg = libc.sendmmsg
+                sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+                sendmmsg.restype = ctypes.c_int
+                cls._sendmmsg = sendmmsg
+            except (OSError, AttributeError, TypeError):
+                cls.logger.info("sendmmsg() is not available, sending packets one at a time")
+        return cls._sendmmsg
+
+    def send(self, packets):
+        if self.socket is None or len(packets) == 0:
+            return None
+        if self.sendmmsg is not None:
+            for start in range(0, len(packets), self.MAX_BATCH):
+                if not self.send_batch(packets[start:start + self.MAX_BATCH]):
+                    return None
+        else:
+            for packet in packets:
+                try:
+                    self.socket.send(packet)
+                except (socket.error, OSError) as e:
+                    self.log_error(e.errno, e)
+                    return None
+        return None
+
+    # Send a list of packets with one sendmmsg(), returning False if it failed
+    def send_batch(self, packets):
+        count = len(packets)
+        buffers = [ctypes.create_string_buffer(packet, len(packet)) for packet in packets]
+        vectors = (iovec * count)()
+        messages = (mmsghdr * count)()
+        for (index, buffer) in enumerate(buffers):
+            vectors[index].iov_base = ctypes.cast(buffer, ctypes.c_void_p)
+            vectors[index].iov_len = len(packets[index])
+            messages[index].msg_hdr.msg_iov = ctypes.pointer(vectors[index])
+            messages[index].msg_hdr.msg_iovlen = 1
+
+        sent = 0
+        while sent < count:
+            result = self.sendmmsg(self.socket.fileno(), ctypes.addressof(messages) + sent * ctypes.sizeof(mmsghdr),
+                                   count - sent, 0)
+            if result < 0:
+                error = ctypes.get_errno()
+                if error == errno.EINTR:
+                    continue
+                self.log_error(error, os.strerror(error))
+                return False
+            sent += result
+        return True
+
+    def log_error(self, error, message):
+        # Nothing listening on the other end is reported on the next send,
+        #  but isn't worth more than a debug message
+        if error == errno.ECONNREFUSED:
+            self.logger.debug("Nothing listening on %s:%d" % self.address)
+        else:
+            self.logger.warn("Unable to send to %s:%d: %s" % (self.address[0], self.address[1], message))
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
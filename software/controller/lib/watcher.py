@@ -0,0 +1,92 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+
+
+class FileWatcher(object):
+    """
+    Polls a set of files, and the .py files in a set of directories, on a
+    background thread, and queues up the path of each one that changes, is
+    created or is removed. Nothing is done about a change on the background
+    thread itself, the main loop picks the changes up with get_changes()
+    when it is ready to deal with them, between frames.
+    """
+    logger = logging.getLogger(__name__)
+
+    DEFAULT_INTERVAL = 1.0
+
+    def __init__(self, files=None, directories=None, interval=DEFAULT_INTERVAL):
+        self.files = list(files or [])
+        self.directories = list(directories or [])
+        self.interval = interval
+        # Appending and popping from either end of a deque is thread safe
+        self.changes = deque()
+        self.mtimes = self.get_mtimes()
+        self.thread = None
+        self.watching = False
+
+    def start(self):
+        if self.thread is not None:
+            return None
+        self.watching = True
+        self.thread = threading.Thread(target=self.watch)
+        self.thread.daemon = True
+        self.thread.start()
+        return None
+
+    def stop(self):
+        self.watching = False
+        if self.thread is not None:
+            self.thread.join(2 * self.interval)
+            self.thread = None
+        return None
+
+    def watch(self):
+        while self.watching:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                self.logger.warn("Error watching for file changes: %s" % e)
+
+    # Compare the mtime of everything we are watching with what it was last
+    #  time, and queue up anything that is different
+    def poll(self):
+        mtimes = self.get_mtimes()
+        for path in sorted(set(mtimes) | set(self.mtimes)):
+            if mtimes.get(path) != self.mtimes.get(path):
+                self.logger.info("File changed: %s" % path)
+                self.changes.append(path)
+        self.mtimes = mtimes
+        return None
+
+    def get_mtimes(self):
+        mtimes = dict()
+        paths = list(self.files)
+        for directory in self.directories:
+            for root, dirs, files in os.walk(directory):
+                for fname in files:
+                    if fname.endswith(".py") and not fname.startswith("__"):
+                        paths.append(os.path.join(root, fname))
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                # It doesn't exist (any more)
+                pass
+        return mtimes
+
+    # Return the paths that have changed since this was last called, each one
+    #  only once, in the order they changed
+    def get_changes(self):
+        changes = []
+        while len(self.changes) > 0:
+            path = self.changes.popleft()
+            if path not in changes:
+                changes.append(path)
+        return changes
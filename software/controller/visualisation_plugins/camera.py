@@ -3,27 +3,76 @@ from VisualisationPlugin import VisualisationPlugin
 import pygame
 import pygame.camera
 import logging
+import threading
+
+import numpy
 
 from DDRPi import FloorCanvas
 from lib.controllers import ControllerInput
 
 
+def box_downscale(pixels, width, height):
+    """
+    Area-average (box filter) an array of shape (src_width, src_height, 3) down
+    to (width, height, 3). Each output pixel is the mean of the block of source
+    pixels that falls inside it, so the source need not be an exact multiple of
+    the destination size.
+    """
+    (src_width, src_height) = pixels.shape[0:2]
+    width = min(width, src_width)
+    height = min(height, src_height)
+
+    x_edges = (numpy.arange(width) * src_width) // width
+    y_edges = (numpy.arange(height) * src_height) // height
+
+    # Sum each block of columns, then each block of rows
+    sums = numpy.add.reduceat(pixels, x_edges, axis=0, dtype=numpy.uint32)
+    sums = numpy.add.reduceat(sums, y_edges, axis=1)
+
+    # How many source pixels went into each output pixel
+    x_counts = numpy.diff(numpy.append(x_edges, src_width))
+    y_counts = numpy.diff(numpy.append(y_edges, src_height))
+    counts = numpy.outer(x_counts, y_counts)[:, :, numpy.newaxis]
+
+    return (sums // counts).astype(numpy.uint8)
+
+
 class CameraVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN]
+
+    # The floor is tiny compared to any webcam, so ask for the smallest frame
+    #  we can get. The camera driver negotiates the nearest mode it supports,
+    #  so asking for the floor size gets us its smallest supported resolution.
+    #  This is only used if we haven't been told the floor size.
+    DEFAULT_CAPTURE_SIZE = (24, 18)
+
     def __init__(self):
         self.clock = pygame.time.Clock()
         self.webcam = None
         self.webcam_index = None
 
+        self.config = None
+        self.target_size = self.DEFAULT_CAPTURE_SIZE
+
+        # The capture thread writes the most recent downscaled frame here, and
+        #  draw_frame() only ever reads it, so it never waits on the device
+        self.latest_frame = None
+        self.capture_thread = None
+        self.capturing = False
+
     # Nothing specific to be done before this starts, although we could
     # set self.clock here. Stash any config so we can use it later
     def configure(self, config):
         self.config = config
         self.logger.info("Config: %s" % config)
 
-    # This will just keep running, nothing specific to do for start(), stop(),
-    #  pause() or resume()
+        try:
+            self.target_size = tuple(self.config["size"])
+        except (TypeError, KeyError):
+            pass
+
     def start(self):
         pygame.camera.init()
         camera_list = pygame.camera.list_cameras()  # list available cameras
@@ -31,15 +80,11 @@ class CameraVisualisationPlugin(VisualisationPlugin):
         if len(camera_list) > 0:
             for camera in camera_list:
                 self.logger.info("CAMERA: %s" % camera)
-            #			# Choose the first webcam
-            self.webcam_index = 0
-            self.webcam = pygame.camera.Camera(camera_list[0], (800, 600))
-            #
-            self.webcam.start()  # start camera
-        pass
+            # Choose the first webcam
+            self.open_camera(camera_list, 0)
 
     def stop(self):
-        self.webcam.stop()
+        self.close_camera()
 
     def pause(self):
         self.stop()
@@ -47,43 +92,78 @@ class CameraVisualisationPlugin(VisualisationPlugin):
     def resume(self):
         self.start()
 
+    def open_camera(self, camera_list, index):
+        self.webcam_index = index
+        self.webcam = pygame.camera.Camera(camera_list[index], self.target_size)
+        self.logger.info("Starting camera: %s" % self.webcam)
+        self.webcam.start()
+
+        # Start pulling frames in the background
+        self.capturing = True
+        self.capture_thread = threading.Thread(target=self.capture, args=(self.webcam,))
+        self.capture_thread.daemon = True
+        self.capture_thread.start()
+
+    def close_camera(self):
+        self.capturing = False
+        if self.capture_thread is not None:
+            self.capture_thread.join(1.0)
+            self.capture_thread = None
+        if self.webcam is not None:
+            self.logger.info("Stopping current camera: %s" % self.webcam)
+            self.webcam.stop()
+            self.webcam = None
+
+    def capture(self, webcam):
+        # The size we actually got may not be the one we asked for, so let the
+        #  camera create a surface of the right size and format once, and then
+        #  have it fill that in for every frame rather than allocating a new one
+        buffer_surface = None
+
+        while self.capturing:
+            try:
+                buffer_surface = webcam.get_image(buffer_surface)
+                # pixels3d is a view straight onto the surface, not a copy. It
+                #  locks the surface, so let go of it before the next capture
+                pixels = pygame.surfarray.pixels3d(buffer_surface)
+                (width, height) = self.target_size
+                self.latest_frame = box_downscale(pixels, width, height)
+                del pixels
+            except Exception as e:
+                self.logger.warn("Unable to capture from camera: %s" % e)
+                self.capturing = False
+
     def handle_event(self, event):
 
         try:
 
-            if (pygame.event.event_name(event.type) == "JoyButtonDown"):
+            if (event.type == pygame.JOYBUTTONDOWN):
                 # iterate over the attached cameras if there are more than one
                 if (event.button == ControllerInput.BUMPER_RIGHT):
                     camera_list = pygame.camera.list_cameras()
                     if len(camera_list) > 0:
                         # Stop the existing one
-                        self.logger.info("Stopping current camera: %s" % self.webcam)
-                        self.webcam.stop()
+                        self.close_camera()
                         if self.webcam_index is not None:
-                            self.webcam_index += 1
+                            webcam_index = self.webcam_index + 1
                         else:
-                            self.webcam_index = 0
-                        if self.webcam_index >= len(camera_list):
-                            self.webcam_index = 0
-                        self.webcam = pygame.camera.Camera(camera_list[self.webcam_index], (800, 600))
-                        self.logger.info("starting new camera: %s" % self.webcam)
-                        self.webcam.start()
+                            webcam_index = 0
+                        if webcam_index >= len(camera_list):
+                            webcam_index = 0
+                        self.open_camera(camera_list, webcam_index)
         except Exception as e:
             self.logger.warn(e)
 
     def draw_frame(self, surface):
 
-        if self.webcam is not None:
-            self.logger.info("Getting image from webcam %s" % self.webcam)
-            image = self.webcam.get_image()
-            resized_image = pygame.transform.scale(image, (surface.get_width(), surface.get_height()))
-
-            pixel_array = pygame.surfarray.pixels3d(resized_image)
-            #self.logger.info(pixel_array)
-            for row, row_data in enumerate(pixel_array):
-                for column, pixel_data in enumerate(row_data):
-                    surface.set_pixel(row, column, (pixel_data[0], pixel_data[1], pixel_data[2]))
+        # If the floor isn't the size we were configured for, then the capture
+        #  thread will pick up the new size on its next frame
+        if self.target_size != surface.get_size():
+            self.target_size = surface.get_size()
 
+        frame = self.latest_frame
+        if frame is not None:
+            surface.set_rgb_array(frame)
 
         # Limit the frame rate.
         # This sleeps so that at least 25ms has passed since tick()
@@ -102,4 +182,3 @@ class CameraVisualisationPlugin(VisualisationPlugin):
         canvas.set_colour(FloorCanvas.BLUE)
         # Return the canvas
         return canvas
-
@@ -1,9 +1,9 @@
 __authors__ = ['Andrew Taylor']
 
-import random
 import time
 import pygame
-import math
+
+import numpy
 
 from VisualisationPlugin import VisualisationPlugin
 from lib.controllers import ControllerInput
@@ -14,6 +14,8 @@ import logging
 class DiscoFloorVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN, pygame.JOYAXISMOTION]
+
     # Colours
     __colours__ = {
     "black": (0, 0, 0),
@@ -55,6 +57,9 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
     def __init__(self):
         self.clock = pygame.time.Clock()
         self.current_colours = None
+        # The last floor drawn, and what it was drawn from
+        self.current_frame = None
+        self.current_frame_key = None
         self.last_beat = 0
         self.colour_selection = self.all_floor_colours
         self.brightness = 1.0
@@ -65,9 +70,6 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
         self.config = config
         self.logger.info("Config: %s" % config)
 
-        # Seed the random function with the current time
-        random.seed()
-
         self.fps = 2
         self.square_size = 2
 
@@ -93,9 +95,7 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
         joypad = action = action_value = event_name = None
 
         try:
-            event_name_temp = pygame.event.event_name(event.type)
-
-            if (event_name_temp == "JoyButtonDown"):
+            if (event.type == pygame.JOYBUTTONDOWN):
                 # button = self.__buttons__[event.button]
                 button = event.button
                 if (button != None):
@@ -121,7 +121,7 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
                         if (self.fps < self.max_fps):
                             self.fps += 1
 
-            elif (event_name_temp == "JoyAxisMotion"):
+            elif (event.type == pygame.JOYAXISMOTION):
                 if event.axis == 1:
                     # The axis is upside down, -1 = up
                     if event.value < -0.5:
@@ -155,13 +155,14 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
         self.logger.info("Brightness: %f" % self.brightness)
         return None
 
-    def regenerate_colours(self, colour_set, size):
-
-        colours = []
-        for i in range(size):
-            new_colour = self.__colours__[colour_set[random.randint(0, len(colour_set) - 1)]]
-            colours.append(new_colour)
-        return colours
+    def regenerate_colours(self, colour_set, size, random_state=numpy.random):
+        """
+        Pick a random colour from colour_set for each square. 'size' is the
+        number of squares in each direction, and the result is an array of
+        shape (x_squares, y_squares, 3)
+        """
+        palette = numpy.array([self.__colours__[name] for name in colour_set], dtype=numpy.uint8)
+        return palette[random_state.randint(0, len(palette), size)]
 
     def draw_frame(self, canvas):
         """
@@ -170,43 +171,48 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
 
         w = canvas.get_width()
         h = canvas.get_height()
+        squares = self.get_square_count(w, h, self.square_size)
 
-        # If there are no colours yet, regenerate
-        if ((self.current_colours is None) or (self.force_regenerate_colours == True)):
-            self.current_colours = self.regenerate_colours(self.colour_selection, int(w * h))
+        # If there are no colours yet, or the squares have changed size, regenerate
+        if ((self.current_colours is None) or (self.force_regenerate_colours == True) or
+                (self.current_colours.shape[0:2] != squares)):
+            self.current_colours = self.regenerate_colours(self.colour_selection, squares)
+            self.current_frame_key = None
             self.force_regenerate_colours = False
         else:
             # If we are on static, don't regenerated
             if self.fps > 0:
                 # Regenerate the colours on each beat.
-                current_beat = pygame.time.get_ticks() // (1000 / self.fps)
+                current_beat = pygame.time.get_ticks() // (1000 // self.fps)
                 if current_beat != self.last_beat:
-                    self.current_colours = self.regenerate_colours(self.colour_selection, int(w * h))
+                    self.current_colours = self.regenerate_colours(self.colour_selection, squares)
+                    self.current_frame_key = None
                     self.last_beat = current_beat
 
-        self.draw_floor(canvas, self.current_colours, self.square_size)
+        # Only work out the floor again if something has changed since the
+        #  last frame, otherwise just put the same one back on the canvas
+        frame_key = (self.brightness, self.square_size, w, h)
+        if frame_key != self.current_frame_key:
+            self.current_frame = self.render_floor(self.current_colours, self.square_size, w, h)
+            self.current_frame_key = frame_key
+        canvas.set_rgb_array(self.current_frame)
 
         self.clock.tick(25)
         return canvas
 
-    def draw_floor(self, canvas, colours, square_size):
+    # The maximum number of squares (rounded up) displayable on each side
+    def get_square_count(self, w, h, square_size):
+        return (-(-w // square_size), -(-h // square_size))
 
-        w = canvas.get_width()
-        h = canvas.get_height()
-
-        # The maximum number of squares (rounded up) displayable on each side
-        x_squares = math.ceil(w // float(square_size))
-        y_squares = math.ceil(h // float(square_size))
-
-        for x in range(w):
-            for y in range(h):
-                row = (x // square_size )
-                column = (y // square_size)
-                index = int(row * y_squares + column)
-                (r, g, b) = colours[index]
-                adjusted_brightness = (r * self.brightness, g * self.brightness, b * self.brightness)
-                canvas.set_pixel(x, y, adjusted_brightness)
+    # Apply the brightness to one colour per square, and then blow that up so
+    #  that each square covers square_size x square_size pixels
+    def render_floor(self, colours, square_size, w, h):
+        adjusted_brightness = (colours * self.brightness).astype(numpy.uint8)
+        pixels = numpy.repeat(numpy.repeat(adjusted_brightness, square_size, axis=0), square_size, axis=1)
+        return pixels[0:w, 0:h]
 
+    def draw_floor(self, canvas, colours, square_size):
+        canvas.set_rgb_array(self.render_floor(colours, square_size, canvas.get_width(), canvas.get_height()))
         return canvas
 
     def draw_splash(self, canvas):
@@ -217,12 +223,9 @@ class DiscoFloorVisualisationPlugin(VisualisationPlugin):
         h = canvas.get_height()
 
         # Use a defined seed
-        random.seed(0)
-
-        colours = self.regenerate_colours(self.all_floor_colours, int(w * h))
+        colours = self.regenerate_colours(self.all_floor_colours, self.get_square_count(w, h, 2),
+                                          numpy.random.RandomState(0))
 
         self.draw_floor(canvas, colours, 2)
 
         return canvas
-
-		
@@ -2,17 +2,20 @@ from VisualisationPlugin import VisualisationPlugin
 
 import pygame
 import logging
-import colorsys
 import math
-import random
+
+import numpy
 
 from DDRPi import FloorCanvas
 from lib.controllers import ControllerInput
+from lib.particles import ParticleSystem
 
 
 class FireworksVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN]
+
     def __init__(self):
         self.clock = pygame.time.Clock()
 
@@ -20,7 +23,10 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
         self.mode_index = 0
         self.mode = self.modes[self.mode_index]
 
-        self.fireworks = None
+        self.trail_opacity = 1.0
+
+        self.show = None
+        self.last_ticks = 0
 
     # Nothing specific to be done before this starts, although we could
     # set self.clock here. Stash any config so we can use it later
@@ -35,6 +41,12 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
         except (AttributeError, KeyError):
             pass
 
+        # How bright the trails behind the rockets are, from 0 to 1
+        try:
+            self.trail_opacity = min(max(float(self.config["trail_opacity"]), 0.0), 1.0)
+        except (AttributeError, ValueError, KeyError, TypeError):
+            pass
+
     # This will just keep running, nothing specific to do for start(), stop(),
     #  pause() or resume()
     def start(self):
@@ -53,7 +65,7 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
 
         try:
 
-            if (pygame.event.event_name(event.type) == "JoyButtonDown"):
+            if (event.type == pygame.JOYBUTTONDOWN):
                 # iterate over the attached cameras if there are more than one
                 if (event.button == ControllerInput.BUMPER_RIGHT):
                     self.mode_index += 1
@@ -64,77 +76,32 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
         except Exception as e:
             self.logger.warn(e)
 
-    def new_firework(self, colour=(0xFF, 0, 0), x=12, explode_height=8.0):
-
-        firework = dict()
-        firework["colour"] = colour
-        firework["start_time"] = pygame.time.get_ticks()
-        firework["explode_time"] = None
-        firework["explode_radius"] = 3.0
-        firework["explode_speed"] = 5.0
-        firework["decay_speed"] = 4.0
-        firework["x"] = x
-        firework["target_height"] = explode_height
-        firework["speed"] = 4.0
-        firework["tail"] = 5.0
-        # Options: LAUNCH, EXPLODE
-        firework["mode"] = "LAUNCH"
-
-        return firework
-
-    def new_random_firework(self, limit_x, limit_y):
-
-        firework_colours = [(0xFF, 0, 0), (0, 0xFF, 0), (0, 0, 0xFF), (0xFF, 0xFF, 0), (0, 0xFF, 0xFF), (0xFF, 0, 0xFF),
-                            (0xFF, 0xFF, 0xFF)]
-
-        firework = dict()
-        firework["colour"] = firework_colours[random.randint(0, len(firework_colours) - 1)]
-        firework["start_time"] = pygame.time.get_ticks()
-        firework["explode_time"] = None
-        firework["explode_radius"] = random.randint(20, 70) / 10.0
-        firework["explode_speed"] = random.randint(30, 50) / 10.0
-        firework["decay_speed"] = 4.0
-        firework["x"] = random.randint(0, int(limit_x))
-        firework["speed"] = random.randint(50, 80) / 10.0
-        firework["tail"] = random.randint(60, 70) / 10.0
-        # Options: LAUNCH, EXPLODE, DEAD
-        # If we just want explosions, no trails, then
-        if self.mode == "EXPLOSIONS":
-            firework["mode"] = "EXPLODE"
-            firework["target_height"] = random.randint(0, int(limit_y))
-            firework["explode_time"] = pygame.time.get_ticks()
-            firework["delay"] = random.randint(0, 5000)
-        else:
-            firework["mode"] = "LAUNCH"
-            firework["target_height"] = random.randint(4, int(limit_y))
-            firework["delay"] = random.randint(0, 5000)
-
-        return firework
-
-
     def draw_frame(self, canvas):
 
-        if self.fireworks is None:
-            self.fireworks = []
-
+        if self.show is None:
             quantity = 20
             # Get the number of fireworks requested from the config, if
             #  set
             try:
                 quantity = int(self.config["quantity"])
-            except (AttributeError, ValueError, KeyError):
+            except (AttributeError, ValueError, KeyError, TypeError):
                 pass
 
-            for i in range(quantity):
-                self.fireworks.append(self.new_random_firework(canvas.get_width(), canvas.get_height() * 0.8))
+            self.show = FireworkShow(canvas.get_width(), canvas.get_height(), quantity)
+            self.last_ticks = pygame.time.get_ticks()
+
+        # Move everything on by however long it has been since the last frame,
+        #  but don't let everything jump if we've been paused for a while
+        t = pygame.time.get_ticks()
+        dt = min((t - self.last_ticks) / 1000.0, 0.1)
+        self.last_ticks = t
 
-        # See if any fireworks have finished, and we need new ones
-        for idx, firework in enumerate(self.fireworks):
-            if firework["mode"] == "DEAD":
-                self.fireworks[idx] = self.new_random_firework(canvas.get_width(), canvas.get_height())
+        self.show.mode = self.mode
+        self.show.trail_opacity = self.trail_opacity
+        self.show.step(dt)
 
         # Draw whatever this plugin does.
-        canvas = self.draw_surface(canvas, self.fireworks, pygame.time.get_ticks())
+        canvas = self.show.draw(canvas, dt)
 
         # Limit the frame rate.
         # This sleeps so that at least 25ms has passed since tick()
@@ -145,155 +112,128 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
         return canvas
 
     def draw_splash(self, canvas):
+        # Always draw the same thing: a firework that has just exploded in
+        #  the middle, and another on its way up to the right of it
+        show = FireworkShow(canvas.get_width(), canvas.get_height(), 0, numpy.random.RandomState(0))
+        show.burst((canvas.get_width() // 2, canvas.get_height() // 2), (0xFF, 0, 0), 3.0, 5.0)
+        show.launch_rocket(int(canvas.get_width() * 0.80), canvas.get_height() // 2, 4.0, (0xFF, 0xFF, 0))
+        # The rocket's trail builds up on a layer as it goes
+        for i in range(25):
+            show.step(1 / 25.0)
+            show.draw(canvas, 1 / 25.0)
+        return canvas
 
-        fireworks = []
-
-        firework = dict()
-        firework["colour"] = (0xFF, 0, 0)
-        firework["start_time"] = -3000
-        firework["explode_time"] = -1000
-        firework["explode_radius"] = 3.0
-        firework["explode_speed"] = 5.0
-        firework["decay_speed"] = 4.0
-        firework["x"] = canvas.get_width() // 2
-        firework["target_height"] = canvas.get_height() // 2
-        firework["speed"] = 4.0
-        firework["tail"] = 5.0
-        # Options: LAUNCH, EXPLODE
-        firework["mode"] = "EXPLODE"
-
-        fireworks.append(firework)
-
-        firework = dict()
-        firework["colour"] = (0xFF, 0xFF, 0)
-        firework["start_time"] = -3000
-        firework["explode_time"] = None
-        firework["explode_radius"] = 3.0
-        firework["explode_speed"] = 5.0
-        firework["decay_speed"] = 4.0
-        firework["x"] = int(canvas.get_width() * 0.80)
-        firework["target_height"] = canvas.get_height() // 2
-        firework["speed"] = 4.0
-        firework["tail"] = 5.0
-        # Options: LAUNCH, EXPLODE
-        firework["mode"] = "LAUNCH"
-
-        fireworks.append(firework)
-
-        return self.draw_surface(canvas, fireworks, 0)
-
-    # Normalization method, so the colors are in the range [0, 1]
-    def normalize(self, color):
-        return color[0] / 255.0, color[1] / 255.0, color[2] / 255.0
-
-    def reformat(self, colour):
-        return int(round(colour[0] * 255)) % 256, \
-               int(round(colour[1] * 255)) % 256, \
-               int(round(colour[2] * 255)) % 256
-
-
-    # We've split the method that does the drawing out, so that draw_splash()
-    #  can call it with a fixed timer
-    def draw_surface(self, canvas, fireworks, t):
-        canvas.set_colour(FloorCanvas.BLACK)
 
-        for idx, firework in enumerate(fireworks):
-
-            # See if the delay, if set, has elapsed.
-            if "delay" in firework:
-                # If it has elapsed, or not set, nothing to do
-                if firework["delay"] is not None:
-                    # If we have waiting long enough, then start the launch
-                    if t > firework["start_time"] + firework["delay"]:
-                        firework["delay"] = None
-                        firework["start_time"] = t
-                        if self.mode == "EXPLOSIONS":
-                            firework["explode_time"] = t
-                    # If we haven't waited long enough, go to the next firework
-                    else:
-                        continue
-
-            theoretical_height = (t - firework["start_time"]) / 1000.0 * firework["speed"]
-
-            if firework["mode"] == "LAUNCH":
-                # Work out how high up the firework has got
-                if theoretical_height >= firework["target_height"]:
-                    firework["mode"] = "EXPLODE"
-                    firework["explode_time"] = t
-                current_height = theoretical_height
-            else:
-                current_height = firework["target_height"]
-
-            (h, s, v) = colorsys.rgb_to_hsv(*self.normalize(firework["colour"]))
-
-            if self.mode == "FIREWORKS":
-                # Draw the launching tail, which is an antialiased line, with
-                #  a gradient on it! :S
-                # But if they just go straight, then it's less of a problem
-                (x_quot, x_rem) = divmod(firework["x"], 1.0)
-                (y_quot, y_rem) = divmod(current_height, 1.0)
-                #self.logger.info("y quot:%f, mod:%f" % (y_quot, y_rem))
-                # Draw the tail
-                for y in range(int(y_quot)):
-                    # If it is a few blocks away, then tail the value off
-                    if y < (theoretical_height - 1):
-                        if y < theoretical_height - 1 - firework["tail"]:
-                            pass
-                        else:
-                            tail_prop = (y - (theoretical_height - 1 - firework["tail"])) / float(firework["tail"])
-                            #self.logger.info("hsv input: %f,%f,%f" % (h,s,v))
-                            canvas.set_pixel(x_quot, y, (h, s, tail_prop * v), format="HSV")
-                # If there is an extra bit left over
-                if y_rem > 0.01:
-                    v_partial = v * y_rem
-                    #self.logger.info("Remainder: %f, v_partial: %f" % (y_rem, v_partial))
-                    canvas.set_pixel(x_quot, y_quot, (h, s, v_partial), format="HSV")
-
-                if firework["mode"] == "LAUNCH":
-                    # Always Draw the brightest firework point
-                    canvas.set_pixel(x_quot, y_quot, (h, s, v), format="HSV")
-            if firework["mode"] == "EXPLODE":
-                # Draw an increasing disc of light
-
-                explode_x = firework["x"]
-                explode_y = firework["target_height"]
-
-                #
-                t_since_explosion = (t - firework["explode_time"]) / 1000.0
-                # Initial fast expansion
-                if t_since_explosion < firework["explode_radius"] / firework["explode_speed"]:
-                    explosion_radius = t_since_explosion * firework["explode_speed"]
-                # 4 times slower expansion whilst it is dying
-                else:
-                    t_since_max_explosion = t_since_explosion - (firework["explode_radius"] / firework["explode_speed"])
-                    #self.logger.info("Time since max explosion: %f" % t_since_max_explosion)
-                    explosion_radius = firework["explode_radius"] + t_since_max_explosion * firework[
-                        "explode_speed"] / 4.0
-
-                decay_ratio = min(1.0, math.e ** -((t_since_explosion - 2.0) / (1.0)))
-                if decay_ratio < 0.01:
-                    firework["mode"] = "DEAD"
-
-                for x in range(canvas.get_width()):
-                    for y in range(canvas.get_height()):
-                        # Calculate how far away from the centre of the blob the centre of this pixel is
-                        x_d = x - explode_x
-                        y_d = y - explode_y
-                        distance_away = math.sqrt(x_d * x_d + y_d * y_d)
-
-                        distance_decay_factor = 1.0
-                        if explosion_radius >= 1:
-                            distance_decay_factor = 1.0 * (distance_away / explosion_radius)
-
-                        # As the firework decays, the alpha channel is set so that you can see through it
-                        #  to other fireworks behind, or it just fades to black
-                        if distance_away < explosion_radius:
-                            canvas.set_pixel(x, y, (h, s, v), "HSV", decay_ratio * distance_decay_factor)
-                        elif distance_away < explosion_radius + 1:
-                            (d_quot, d_rem) = divmod(distance_away - explosion_radius, 1.0)
-                            canvas.set_pixel(x, y, (h, s, v), "HSV", (1 - d_rem) * decay_ratio * distance_decay_factor)
-
-
-        # Return the canvas
-        return canvas
+class FireworkShow(object):
+    """
+    All of the fireworks currently going off, as two particle systems: the
+    rockets on their way up and the sparks from the explosions. Rockets explode
+    into sparks when they reach the end of their lifetime, which is set to when
+    they reach their target height. Each rocket is also drawn onto a "trails"
+    layer of the canvas, which fades out a little every frame, so it leaves a
+    trail behind it.
+    """
+
+    COLOURS = numpy.array([(0xFF, 0, 0), (0, 0xFF, 0), (0, 0, 0xFF), (0xFF, 0xFF, 0), (0, 0xFF, 0xFF), (0xFF, 0, 0xFF),
+                           (0xFF, 0xFF, 0xFF)], dtype=numpy.float32)
+
+    SPARKS_PER_BURST = 40
+    # How long a trail takes to fade to about a third, in seconds
+    TRAIL_TIME = 0.3
+
+    def __init__(self, width, height, quantity, random_state=None):
+        self.width = width
+        self.height = height
+        self.quantity = quantity
+        self.mode = "FIREWORKS"
+        self.trail_opacity = 1.0
+        self.random = random_state if random_state is not None else numpy.random.RandomState()
+
+        rocket_capacity = max(quantity, 2)
+        self.rockets = ParticleSystem(rocket_capacity)
+        self.sparks = ParticleSystem(rocket_capacity * self.SPARKS_PER_BURST * 2, gravity=(0.0, -1.5), fade=2.0)
+
+        # The shape of the explosion for each rocket slot
+        self.explode_radius = numpy.zeros(rocket_capacity, dtype=numpy.float32)
+        self.explode_speed = numpy.zeros(rocket_capacity, dtype=numpy.float32)
+
+        # When each of the explosions currently going off will have died out
+        self.time = 0.0
+        self.burst_ends = numpy.zeros(0)
+
+    def launch_rocket(self, x, target_height, speed, colour, explode_radius=3.0, explode_speed=5.0, delay=0.0):
+        slots = self.rockets.emit(1, (x, 0.0), (0.0, speed), colour, target_height / speed, delay=delay)
+        self.explode_radius[slots] = explode_radius
+        self.explode_speed[slots] = explode_speed
+
+    def launch_random(self, count):
+        colours = self.COLOURS[self.random.randint(0, len(self.COLOURS), count)]
+        x = self.random.randint(0, self.width + 1, count)
+        delay = self.random.randint(0, 5000, count) / 1000.0
+        explode_radius = self.random.randint(20, 71, count) / 10.0
+        explode_speed = self.random.randint(30, 51, count) / 10.0
 
+        if self.mode == "EXPLOSIONS":
+            # Just the explosions, so the rockets appear where they will go
+            #  off, and go off as soon as their delay is up
+            target_height = self.random.randint(0, int(self.height * 0.8) + 1, count)
+            position = numpy.column_stack((x, target_height))
+            slots = self.rockets.emit(count, position, (0.0, 0.0), colours, 0.0, delay=delay)
+        else:
+            target_height = self.random.randint(4, int(self.height * 0.8) + 1, count)
+            speed = self.random.randint(50, 81, count) / 10.0
+            position = numpy.column_stack((x, numpy.zeros(count)))
+            velocity = numpy.column_stack((numpy.zeros(count), speed))
+            slots = self.rockets.emit(count, position, velocity, colours, target_height / speed, delay=delay)
+
+        used = len(slots)
+        self.explode_radius[slots] = explode_radius[:used]
+        self.explode_speed[slots] = explode_speed[:used]
+
+    # Throw out sparks in all directions from each of the positions. Drag
+    #  slows them down so that they come to rest at about the explosion radius
+    def burst(self, positions, colours, explode_radius, explode_speed):
+        positions = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float32))
+        colours = numpy.atleast_2d(numpy.asarray(colours, dtype=numpy.float32))
+        bursts = len(positions)
+        explode_radius = numpy.resize(numpy.asarray(explode_radius, dtype=numpy.float32), bursts)
+        explode_speed = numpy.resize(numpy.asarray(explode_speed, dtype=numpy.float32), bursts)
+
+        count = bursts * self.SPARKS_PER_BURST
+        angle = self.random.uniform(0, 2 * math.pi, count)
+        speed = self.random.uniform(0.6, 1.0, count) * numpy.repeat(explode_speed, self.SPARKS_PER_BURST)
+        velocity = numpy.column_stack((numpy.cos(angle) * speed, numpy.sin(angle) * speed))
+        drag = numpy.repeat(explode_speed / explode_radius, self.SPARKS_PER_BURST)
+        lifetime = self.random.uniform(1.5, 3.0, count)
+
+        self.sparks.emit(count, numpy.repeat(positions, self.SPARKS_PER_BURST, axis=0), velocity,
+                         numpy.repeat(colours, self.SPARKS_PER_BURST, axis=0), lifetime, drag)
+        self.burst_ends = numpy.append(self.burst_ends, numpy.repeat(self.time + 3.0, bursts))
+
+    def step(self, dt):
+        self.time += dt
+
+        exploded = self.rockets.update(dt)
+        if len(exploded) > 0:
+            self.burst(self.rockets.position[exploded], self.rockets.colour[exploded],
+                       self.explode_radius[exploded], self.explode_speed[exploded])
+        self.sparks.update(dt)
+
+        # Keep the requested number of fireworks going at once
+        self.burst_ends = self.burst_ends[self.burst_ends > self.time]
+        active = self.rockets.count() + len(self.burst_ends)
+        if active < self.quantity:
+            self.launch_random(self.quantity - active)
+
+    # Draw everything, with dt the seconds since the last frame. The trails
+    #  layer is kept from one frame to the next, fading out as it goes, and
+    #  is added on top of the rockets and sparks
+    def draw(self, canvas, dt):
+        canvas.set_colour(FloorCanvas.BLACK)
+        trails = canvas.get_layer("trails", blend="add")
+        trails.opacity = self.trail_opacity
+        trails.decay(math.exp(-dt / self.TRAIL_TIME))
+        self.rockets.splat(trails)
+        self.sparks.splat(canvas)
+        self.rockets.splat(canvas)
+        return canvas
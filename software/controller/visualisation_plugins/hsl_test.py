@@ -1,10 +1,11 @@
 from VisualisationPlugin import VisualisationPlugin
 
 import pygame
-# For colour conversion functions
-from colorsys import hls_to_rgb
 
-from DDRPi import FloorCanvas
+import numpy
+
+# For colour conversion functions
+from lib.tiles import TileRenderer, hls_to_rgb
 
 
 class HlsTestVisualisationPlugin(VisualisationPlugin):
@@ -28,26 +29,19 @@ class HlsTestVisualisationPlugin(VisualisationPlugin):
         return self.draw_surface(0)
 
     def draw_surface(self, canvas, ticks):
-        canvas.set_colour(FloorCanvas.WHITE)
-
-        for x in range(0, canvas.get_width()):
-            for y in range(0, canvas.get_height()):
-                h = float(x) / canvas.get_width()
-                # A saturation of 1.0 gives pure colour
-                # 0 = grey
-                s = 1.0
-                # a lightness of 0.5 gives pure colour,
-                #  0 = black, 1 = white
-                l = float(y) / canvas.get_height()
-
-                # Convert the hls colourspace to RGB so we
-                #  can assign it to a pixel
-                rgb = hls_to_rgb(h, l, s)
-                canvas.set_float_pixel_tuple(x, y, rgb)
-
-
-        # Return the canvas
-        return canvas
-
-
-
+        params = {"width": canvas.get_width(), "height": canvas.get_height()}
+        return TileRenderer.get_renderer().render(canvas, render_hls, params)
+
+
+# Hue goes across the floor and lightness down it
+def render_hls(xs, ys, params):
+    h = xs / params["width"]
+    # A saturation of 1.0 gives pure colour
+    # 0 = grey
+    s = 1.0
+    # a lightness of 0.5 gives pure colour,
+    #  0 = black, 1 = white
+    l = ys / params["height"]
+
+    # Convert the hls colourspace to RGB
+    return numpy.floor(hls_to_rgb(h, l, s) * 255)
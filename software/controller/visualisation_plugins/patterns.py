@@ -7,7 +7,10 @@ import colorsys
 import pygame
 import os
 
+import numpy
+
 from DDRPi import FloorCanvas
+from lib.floorcanvas import CanvasLayer
 
 from VisualisationPlugin import VisualisationPlugin
 
@@ -98,36 +101,23 @@ def hexToFloatTuple(hexString):
 
 # Motion blur is applied to multiple frames (how many)
 
+# The blurred frame is kept on a layer, which fades out by decayFactor before
+#  each new frame goes on top of it, keeping the brighter of the two
 class MotionBlurFilter(Filter):
     def __init__(self, decayFactor):
         self.__decayFactor = decayFactor;
-        self.__currentFrame = None
+        self.__layer = None
 
     def process(self, frame):
-        self.__currentFrame = self.__decay(self.__currentFrame)
-        self.__currentFrame = self.__overlay(frame, self.__currentFrame)
-        return self.__currentFrame
-
-    def __decay(self, frame):
-        if self.__currentFrame == None: return None
-        return [[MotionBlurFilter.__applyDecay(self.__decayFactor, rgb) for rgb in row] for row in frame]
-
-    def __overlay(self, topFrame, bottomFrame):
-        if bottomFrame == None: return topFrame
-        frameOfPairedRows = zip(topFrame, bottomFrame)
-        return [[self.__blend(pair[0], pair[1]) for pair in zip(rowPairs[0], rowPairs[1])] for rowPairs in
-                frameOfPairedRows]
-
-    @staticmethod
-    def __blend(rgb1, rgb2):
-        return (max(rgb1[0], rgb2[0]), max(rgb1[1], rgb2[1]), max(rgb1[2], rgb2[2]))
-
-    @staticmethod
-    def __applyDecay(decayFactor, rgb):
-        (r, g, b) = rgb
-        (h, l, s) = colorsys.rgb_to_hls(r, g, b);
-        l *= decayFactor
-        return colorsys.hls_to_rgb(h, l, s)
+        # Frames are rows of float (r, g, b), and layers are indexed [x][y]
+        rgb = numpy.array(frame, dtype=numpy.float32).transpose(1, 0, 2) * 255
+        (width, height) = rgb.shape[:2]
+        if self.__layer is None or self.__layer.get_size() != (width, height):
+            self.__layer = CanvasLayer("motion_blur", width, height, blend="max")
+        self.__layer.decay(self.__decayFactor)
+        rgb = numpy.clip(self.__layer.composite(rgb), 0, 255)
+        self.__layer.set_rgb_array(rgb.astype(numpy.uint8))
+        return (rgb.transpose(1, 0, 2) / 255.0).tolist()
 
 
 class HueScroller(Filter):
@@ -3,12 +3,13 @@ __authors__ = ['Andrew Taylor']
 import random
 import time
 import pygame
-# Python comes with some color conversion methods.
-import colorsys
 # For Math things, what else
 import math
 
+import numpy
+
 from VisualisationPlugin import VisualisationPlugin
+from lib.tiles import TileRenderer, hsv_to_rgb
 
 import logging
 
@@ -155,8 +156,8 @@ class SpeedingBlobsVisualisationPlugin(VisualisationPlugin):
         # Fraction of the way through
         background_hue = (float(t) / float(t_background_period)) % 1
 
-        # Create a blank "sheet"
-        sheet = [[0 for y in range(canvas.get_height())] for x in range(canvas.get_width())]
+        # Where each blob is, and its height and decay
+        blob_positions = []
 
         # Draw all of the blobs
         for blob in blobs:
@@ -242,25 +243,28 @@ class SpeedingBlobsVisualisationPlugin(VisualisationPlugin):
             #  relativity rubber-sheet analogy, but the other way up) then it doesn't matter that numbers
             #  wrap, we just want to apply a height map colour, with the bottom varying
 
-            for x in range(canvas.get_width()):
-                for y in range(canvas.get_height()):
-                    # Calculate how far away from the centre of the blob the centre of this pixel is
-                    x_d = x - blob_x
-                    y_d = y - blob_y
-                    distance_away = math.sqrt(x_d * x_d + y_d * y_d)
-                    decay = blob["decay"]
-                    # Only draw pixels in the decay zone
-                    if (distance_away < decay):
-                        # Calculate the scaling factor
-                        decay_amount = (math.cos(math.pi * distance_away / decay) + 1.0) / 2.0
-                        # This compounds any blobs on top of each other automatically
-                        sheet[x][y] += (blob_height * decay_amount)
-
-        # Now translate the sheet height into colours
-        for x in range(canvas.get_width()):
-            for y in range(canvas.get_height()):
-                hue = background_hue + sheet[x][y]
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(hue, 1.0, 1.0))
-                canvas.set_pixel(x, y, rgb_colour)
+            blob_positions.append((blob_x, blob_y, blob_height, blob["decay"]))
 
-        return canvas
+        params = {"background_hue": background_hue, "blobs": blob_positions}
+        return TileRenderer.get_renderer().render(canvas, render_blobs, params)
+
+
+# Add up the height of every blob over each pixel, and use it to shift the hue
+def render_blobs(xs, ys, params):
+    # Create a blank "sheet"
+    sheet = numpy.zeros(xs.shape)
+
+    for (blob_x, blob_y, blob_height, decay) in params["blobs"]:
+        # Calculate how far away from the centre of the blob the centre of each pixel is
+        x_d = xs - blob_x
+        y_d = ys - blob_y
+        distance_away = numpy.sqrt(x_d * x_d + y_d * y_d)
+        # Calculate the scaling factor
+        decay_amount = (numpy.cos(math.pi * distance_away / decay) + 1.0) / 2.0
+        # Only draw pixels in the decay zone. This compounds any blobs on
+        #  top of each other automatically
+        sheet += numpy.where(distance_away < decay, blob_height * decay_amount, 0.0)
+
+    # Now translate the sheet height into colours
+    hue = params["background_hue"] + sheet
+    return numpy.round(hsv_to_rgb(hue, 1.0, 1.0) * 255) % 256
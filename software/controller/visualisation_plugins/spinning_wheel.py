@@ -1,16 +1,20 @@
 from VisualisationPlugin import VisualisationPlugin
 
 import pygame
-import colorsys
-import math, cmath
+import math
+
+import numpy
 
 from DDRPi import FloorCanvas
 from lib.controllers import ControllerInput
+from lib.tiles import TileRenderer, hsv_to_rgb
 import logging
 
 
 class SpinningWheelVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
+
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN]
     VALID_MODES = ["CENTER", "EDGE_ROTATE"]
     VALID_COLOURS = ["FULL_COLOUR", "BLACK_AND_WHITE"]
 
@@ -65,9 +69,7 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
     def handle_event(self, event):
 
         try:
-            event_name_temp = pygame.event.event_name(event.type)
-
-            if event_name_temp == "JoyButtonDown":
+            if event.type == pygame.JOYBUTTONDOWN:
                 # button = self.__buttons__[event.button]
                 button = event.button
                 if button is not None:
@@ -113,34 +115,14 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
             x_centre_pixel = (w - 1) / 2.0 + radius * math.cos(edge_rotate_angle)
             y_centre_pixel = (h - 1) / 2.0 + radius * math.sin(edge_rotate_angle)
 
-        for x in range(w):
-            for y in range(h):
-
-                x_diff = x - x_centre_pixel
-                y_diff = y - y_centre_pixel
-
-                # Get angle in the range [0,2pi]
-                angle = cmath.phase(complex(-x_diff, y_diff)) + math.pi
-
-                # Add a bit according to the phase
-                angle += self.speed * t / (1000.0 * 2.0 * math.pi)
-
-                # Get it back in the range [0,2pi]
-                (angle_div, angle_mod) = divmod(angle, 2.0 * math.pi)
-
-                # Default, full colour
-                hue = angle_mod / (2.0 * math.pi)
-                saturation = 1.0
-                value = 1.0
-                if self.colours == "BLACK_AND_WHITE":
-                    hue = 0.0
-                    saturation = 0.0
-                    value = angle_mod / (1.0 * math.pi)
-
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(*(hue, saturation, value)))
-                canvas.set_pixel_tuple(x, y, rgb_colour)
-        #exit(1)
-        return canvas
+        params = {
+            "x_centre": x_centre_pixel,
+            "y_centre": y_centre_pixel,
+            # Add a bit according to the phase
+            "offset": self.speed * t / (1000.0 * 2.0 * math.pi),
+            "colours": self.colours
+        }
+        return TileRenderer.get_renderer().render(canvas, render_wheel, params)
 
     # Example, and following two functions taken from http://www.pygame.org/wiki/RGBColorConversion
 
@@ -155,3 +137,20 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
                int(round(color[1] * 255)), \
                int(round(color[2] * 255))
 
+
+
+# The colour of each pixel comes from its angle around the centre, turned by the offset
+def render_wheel(xs, ys, params):
+    x_diff = xs - params["x_centre"]
+    y_diff = ys - params["y_centre"]
+
+    # Get angle in the range [0,2pi], plus the offset, and back in the range
+    angle = numpy.arctan2(y_diff, -x_diff) + math.pi + params["offset"]
+    angle_mod = numpy.mod(angle, 2.0 * math.pi)
+
+    if params["colours"] == "BLACK_AND_WHITE":
+        rgb = hsv_to_rgb(0.0, 0.0, angle_mod / (1.0 * math.pi))
+    else:
+        # Default, full colour
+        rgb = hsv_to_rgb(angle_mod / (2.0 * math.pi), 1.0, 1.0)
+    return numpy.round(rgb * 255)
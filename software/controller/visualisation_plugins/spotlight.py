@@ -11,6 +11,8 @@ from lib.controllers import ControllerInput
 class SpotlightVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    EVENT_TYPES = [pygame.JOYBUTTONDOWN, pygame.JOYAXISMOTION]
+
     def __init__(self):
         self.clock = pygame.time.Clock()
 
@@ -45,7 +47,7 @@ class SpotlightVisualisationPlugin(VisualisationPlugin):
     def handle_event(self, event):
         try:
 
-            if (pygame.event.event_name(event.type) == "JoyButtonDown"):
+            if (event.type == pygame.JOYBUTTONDOWN):
                 # Create a new spot if the user doesn't already have one
                 if (event.button == ControllerInput.BUTTON_A):
                     if event.joy not in self.spots:
@@ -76,7 +78,7 @@ class SpotlightVisualisationPlugin(VisualisationPlugin):
                             self.spots[event.joy]["brightness"] += 1
 
 
-            elif (pygame.event.event_name(event.type) == "JoyAxisMotion"):
+            elif (event.type == pygame.JOYAXISMOTION):
                 if event.joy in self.spots:
                     if event.axis == 1:
                         # The axis is upside down, -1 = up
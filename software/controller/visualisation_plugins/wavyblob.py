@@ -4,7 +4,10 @@ import pygame
 import colorsys
 import math
 
+import numpy
+
 from DDRPi import FloorCanvas
+from lib.tiles import TileRenderer, hsv_to_rgb
 import logging
 
 
@@ -56,31 +59,15 @@ class WavyBlobVisualisationPlugin(VisualisationPlugin):
 
         max_distance_away = math.sqrt(w * w + h * h) / 4.0
 
-        for x in range(0, w):
-            for y in range(0, h):
-
-                hsv_colour = []
-                for i in range(0, 3):
-                    hsv_colour.append(0x00)
-                hsv_colour[1] = starting_colour_hsv[1]
-                hsv_colour[2] = starting_colour_hsv[2]
-
-                x_delta = math.fabs(x - x_this_centre_pixel)
-                y_delta = math.fabs(y - y_this_centre_pixel)
-
-                distance_away = math.sqrt(x_delta * x_delta + y_delta * y_delta)
-
-                t_period = 4000.0
-                t_adjustment = t * 2.0 * math.pi / t_period
-                multiplier = (math.sin(t_adjustment) + 1.0) / 2.0
-
-                # We vary only the hue between 0.0 (red) and 1/3 (green)
-                hsv_colour[0] = 0.33 * ((math.sin(distance_away / 3.0 - t_adjustment) + 1.0) / 2.0)
-
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(*hsv_colour))
-                canvas.set_pixel_tuple(x, y, rgb_colour)
-
-        return canvas
+        t_period = 4000.0
+        params = {
+            "x_centre": x_this_centre_pixel,
+            "y_centre": y_this_centre_pixel,
+            "t_adjustment": t * 2.0 * math.pi / t_period,
+            "saturation": starting_colour_hsv[1],
+            "value": starting_colour_hsv[2]
+        }
+        return TileRenderer.get_renderer().render(canvas, render_blob, params)
 
     # Example, and following two functions taken from http://www.pygame.org/wiki/RGBColorConversion
 
@@ -95,3 +82,16 @@ class WavyBlobVisualisationPlugin(VisualisationPlugin):
                int(round(color[1] * 255)), \
                int(round(color[2] * 255))
 
+
+
+# Rings of hue between red and green, moving out from the centre over time
+def render_blob(xs, ys, params):
+    x_delta = xs - params["x_centre"]
+    y_delta = ys - params["y_centre"]
+    distance_away = numpy.sqrt(x_delta * x_delta + y_delta * y_delta)
+
+    # We vary only the hue between 0.0 (red) and 1/3 (green)
+    hue = 0.33 * ((numpy.sin(distance_away / 3.0 - params["t_adjustment"]) + 1.0) / 2.0)
+
+    rgb = hsv_to_rgb(hue, params["saturation"], params["value"])
+    return numpy.round(rgb * 255)